@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import random
+import sys
+import time
+
+from six.moves import BaseHTTPServer, socketserver
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+def create_handler(latency_ms, body_size, error_rate, keep_alive):
+    body = b'x' * body_size
+    error_body = b'error'
+
+    class BenchmarkHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = keep_alive and 'HTTP/1.1' or 'HTTP/1.0'
+
+        def handle_request(self):
+            content_length = int(self.headers.get('Content-Length') or 0)
+            if content_length:
+                self.rfile.read(content_length)
+
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+
+            status, response_body = 200, body
+            if error_rate and random.random() < error_rate:
+                status, response_body = 500, error_body
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(response_body)))
+            if not keep_alive:
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+            self.end_headers()
+
+            if self.command != 'HEAD':
+                self.wfile.write(response_body)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = handle_request
+
+        def log_message(self, format, *args):
+            pass
+
+    return BenchmarkHandler
+
+
+def create_server(port=0, latency_ms=0, body_size=1024, error_rate=0.0, keep_alive=True):
+    handler = create_handler(latency_ms, body_size, error_rate, keep_alive)
+    return ThreadedHTTPServer(('127.0.0.1', port), handler)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Local http server for octopus benchmarks.')
+    parser.add_argument('--port', type=int, default=0, help='port to listen on (0 picks a free port).')
+    parser.add_argument('--latency-ms', type=float, default=0, help='time to wait before responding.')
+    parser.add_argument('--body-size', type=int, default=1024, help='size of the response body in bytes.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='ratio of requests answered with status 500.')
+    parser.add_argument('--no-keep-alive', action='store_true', help='close connections after each response.')
+    options = parser.parse_args(args)
+
+    server = create_server(
+        port=options.port,
+        latency_ms=options.latency_ms,
+        body_size=options.body_size,
+        error_rate=options.error_rate,
+        keep_alive=not options.no_keep_alive
+    )
+
+    sys.stdout.write('%d\n' % server.server_address[1])
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
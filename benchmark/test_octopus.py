@@ -1,177 +1,262 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
 import sys
-from random import choice
+from collections import defaultdict
 from time import time
 
-import requests
-
 from octopus import Octopus, TornadoOctopus
+from octopus.limiter.in_memory.per_domain import Limiter as PerDomainInMemoryLimiter
+from octopus.tornado_core import PYCURL_AVAILABLE
 
+try:
+    from octopus import AsyncioOctopus
+except ImportError:
+    AsyncioOctopus = None
 
-def main(repetitions, concurrency):
-
-    # alexa top sites
-    urls = [
-        'http://facebook.com',
-        'http://youtube.com',
-        'http://yahoo.com',
-        'http://wikipedia.org',
-        'http://linkedin.com',
-        'http://live.com',
-        'http://twitter.com',
-        'http://amazon.com',
-        'http://blogspot.com',
-        'http://wordpress.com',
-        'http://bing.com',
-        'http://ebay.com',
-        'http://tumblr.com',
-    ]
 
-    urls_to_retrieve = [choice(urls) for i in range(repetitions)]
-
-    #requests_total_time = sequential_requests(repetitions, urls_to_retrieve)
-    requests_total_time = 2692.66  # did it once... takes too long to get 2000 urls sequentially.
-    otto_total_time = otto_requests(repetitions, concurrency, urls_to_retrieve)
-    otto_cached_total_time = otto_cached_requests(repetitions, concurrency, urls_to_retrieve)
-    tornado_pycurl_total_time = tornado_requests(repetitions, concurrency, urls_to_retrieve)
-    tornado_total_time = tornado_requests(repetitions, concurrency, urls_to_retrieve, ignore_pycurl=True)
-
-    message = "RESULTS"
-    print
-    print("=" * len(message))
-    print(message)
-    print("=" * len(message))
-    print
-
-    print "[requests] Retrieving %d urls took %.2f seconds meaning %.2f urls/second." % (
-        repetitions,
-        requests_total_time,
-        repetitions / requests_total_time
-    )
-    print
+MODES = [
+    'threaded',
+    'threaded-cache',
+    'threaded-limited',
+    'tornado-simple',
+    'tornado-simple-limited',
+    'tornado-curl',
+    'tornado-curl-limited',
+    'asyncio',
+    'asyncio-limited',
+]
 
-    print "[octopus] Retrieving %d urls took %.2f seconds meaning %.2f urls/second." % (
-        repetitions,
-        otto_total_time,
-        repetitions / otto_total_time
-    )
-    print
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
 
-    print "[octopus] Retrieving %d urls with local in-memory caching took %.2f seconds meaning %.2f urls/second." % (
-        repetitions,
-        otto_cached_total_time,
-        repetitions / otto_cached_total_time
-    )
-    print
 
-    print "[octopus-tornado] Retrieving %d urls took %.2f seconds meaning %.2f urls/second." % (
-        repetitions,
-        tornado_total_time,
-        repetitions / tornado_total_time
+def parse_options(args=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks octopus engines against a local http server and reports the results as JSON.'
     )
-    print
+    parser.add_argument('--requests', type=int, default=2000, help='number of urls to retrieve per mode.')
+    parser.add_argument('--concurrency', type=int, default=50, help='concurrency of each engine.')
+    parser.add_argument('--distinct-urls', type=int, default=13, help='number of distinct urls to choose from.')
+    parser.add_argument('--domains', type=int, default=4, help='number of url prefixes the urls are spread over.')
+    parser.add_argument('--limit', type=int, default=5, help='concurrent requests per url prefix in limited modes.')
+    parser.add_argument('--latency-ms', type=float, default=20, help='server latency for each response.')
+    parser.add_argument('--body-size', type=int, default=10240, help='server response body size in bytes.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='ratio of responses with status 500.')
+    parser.add_argument('--no-keep-alive', action='store_true', help='server closes connections after each response.')
+    parser.add_argument('--seed', type=int, default=42, help='random seed used to pick the urls.')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES, help='modes to benchmark.')
+    parser.add_argument('--output', default=None, help='file to write the JSON results to (defaults to stdout).')
+
+    # used internally to run each mode in a separate process
+    parser.add_argument('--run-mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+
+    return parser.parse_args(args)
+
+
+def get_domains(base_url, options):
+    return ['%s/domain-%d' % (base_url, index) for index in range(options.domains)]
+
 
-    print "[octopus-tornado-pycurl] Retrieving %d urls took %.2f seconds meaning %.2f urls/second." % (
-        repetitions,
-        tornado_pycurl_total_time,
-        repetitions / tornado_pycurl_total_time
+def get_urls(base_url, options):
+    domains = get_domains(base_url, options)
+    urls = ['%s/page-%d' % (domains[index % len(domains)], index) for index in range(options.distinct_urls)]
+
+    rand = random.Random(options.seed)
+    return [rand.choice(urls) for i in range(options.requests)]
+
+
+def get_limiter(base_url, options):
+    return PerDomainInMemoryLimiter(
+        *[{domain: options.limit} for domain in get_domains(base_url, options)],
+        limiter_miss_timeout_ms=50
     )
-    print
 
-    print "Overall, threaded octopus was more than %d times faster than sequential requests and tornado octopus was more than %d times faster than sequential requests." % (
-        int(requests_total_time / otto_total_time),
-        int(requests_total_time / tornado_pycurl_total_time)
+
+def create_engine(mode, base_url, options):
+    limiter = None
+    if mode.endswith('-limited'):
+        limiter = get_limiter(base_url, options)
+
+    if mode.startswith('threaded'):
+        return Octopus(
+            concurrency=options.concurrency, cache=mode == 'threaded-cache',
+            request_timeout_in_seconds=30, limiter=limiter
+        )
+
+    if mode.startswith('tornado'):
+        return TornadoOctopus(
+            concurrency=options.concurrency, auto_start=True,
+            ignore_pycurl=mode.startswith('tornado-simple'),
+            request_timeout_in_seconds=30, limiter=limiter
+        )
+
+    return AsyncioOctopus(
+        concurrency=options.concurrency, auto_start=True,
+        request_timeout_in_seconds=30, limiter=limiter
     )
 
-    print
 
+def get_skip_reason(mode):
+    if mode.startswith('tornado-curl') and not PYCURL_AVAILABLE:
+        return 'pycurl is not available.'
 
-def sequential_requests(repetitions, urls_to_retrieve):
-    message = "Retrieving URLs sequentially with Requests..."
-    print
-    print("=" * len(message))
-    print(message)
-    print("=" * len(message))
-    print
+    if mode.startswith('asyncio') and AsyncioOctopus is None:
+        return 'aiohttp is not available.'
 
-    start_time = time()
+    return None
 
-    for url_index, url in enumerate(urls_to_retrieve):
-        print "%.2f%% - getting %s..." % (
-            float(url_index) / float(repetitions) * 100,
-            url
-        )
-        assert requests.get(url).status_code == 200
 
-    return time() - start_time
+def percentile(values, percent):
+    if not values:
+        return None
 
+    index = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(index, len(values) - 1))]
 
-def otto_requests(repetitions, concurrency, urls_to_retrieve):
-    message = "Retrieving URLs concurrently with Octopus..."
-    print
-    print("=" * len(message))
-    print(message)
-    print("=" * len(message))
-    print
 
-    otto = Octopus(concurrency=concurrency)
+def get_peak_rss_in_bytes(usage):
+    # ru_maxrss is reported in kilobytes on linux and in bytes on mac os
+    if sys.platform == 'darwin':
+        return usage.ru_maxrss
+    return usage.ru_maxrss * 1024
 
-    for url in urls_to_retrieve:
-        otto.enqueue(url, handle_url_response)
 
+def run_mode(mode, base_url, options):
+    urls = get_urls(base_url, options)
+    latencies = []
+    status_codes = defaultdict(int)
+
+    def handle_url_response(url, response):
+        status_codes[str(response.status_code)] += 1
+        if response.request_time:
+            latencies.append(response.request_time)
+
+    otto = create_engine(mode, base_url, options)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
     start_time = time()
-    otto.start()
+
+    for url in urls:
+        otto.enqueue(url, handle_url_response)
+
+    if mode.startswith('threaded'):
+        otto.start()
+
     otto.wait(0)
 
-    return time() - start_time
+    total_time = time() - start_time
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    if mode.startswith('asyncio'):
+        otto.loop.run_until_complete(otto.close())
+
+    latencies.sort()
+    responses = sum(status_codes.values())
+
+    return {
+        'mode': mode,
+        'requests': len(urls),
+        'responses': responses,
+        'errors': sum([count for status, count in status_codes.items() if int(status) > 399]),
+        'status_codes': dict(status_codes),
+        'total_time': total_time,
+        'throughput': responses / total_time,
+        'latency': {
+            'mean': latencies and sum(latencies) / len(latencies) or None,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+        },
+        'cpu_time': (
+            (usage_after.ru_utime - usage_before.ru_utime) +
+            (usage_after.ru_stime - usage_before.ru_stime)
+        ),
+        'peak_rss_bytes': get_peak_rss_in_bytes(usage_after),
+    }
+
+
+def start_server(options):
+    command = [
+        sys.executable, SERVER_PATH,
+        '--latency-ms', str(options.latency_ms),
+        '--body-size', str(options.body_size),
+        '--error-rate', str(options.error_rate),
+    ]
+    if options.no_keep_alive:
+        command.append('--no-keep-alive')
 
+    server = subprocess.Popen(command, stdout=subprocess.PIPE)
+    port = int(server.stdout.readline())
 
-def otto_cached_requests(repetitions, concurrency, urls_to_retrieve):
-    message = "Retrieving URLs concurrently with Octopus with caching enabled..."
-    print
-    print("=" * len(message))
-    print(message)
-    print("=" * len(message))
-    print
+    return server, 'http://127.0.0.1:%d' % port
 
-    otto = Octopus(concurrency=concurrency, cache=True, auto_start=True)
 
-    for url in urls_to_retrieve:
-        otto.enqueue(url, handle_url_response)
+def run_mode_in_subprocess(mode, base_url, args):
+    # each mode runs in a fresh process so cpu time and peak memory are not shared between modes
+    command = [sys.executable, os.path.abspath(__file__), '--run-mode', mode, '--base-url', base_url] + args
+    output = subprocess.check_output(command)
+    return json.loads(output.decode('utf-8'))
 
-    start_time = time()
-    otto.wait(0)
 
-    return time() - start_time
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
 
+    options = parse_options(args)
 
-def tornado_requests(repetitions, concurrency, urls_to_retrieve, ignore_pycurl=False):
-    message = "Retrieving URLs concurrently with TornadoOctopus (%s)..." % (
-        ignore_pycurl and "using SimpleHTTPClient" or "using pycurl"
-    )
-    print
-    print("=" * len(message))
-    print(message)
-    print("=" * len(message))
-    print
+    if options.run_mode:
+        sys.stdout.write(json.dumps(run_mode(options.run_mode, options.base_url, options)))
+        return
 
-    otto = TornadoOctopus(concurrency=concurrency, cache=False, auto_start=True, ignore_pycurl=ignore_pycurl)
+    server, base_url = start_server(options)
 
-    for url in urls_to_retrieve:
-        otto.enqueue(url, handle_url_response)
+    results = []
+    try:
+        for mode in options.modes:
+            skip_reason = get_skip_reason(mode)
 
-    start_time = time()
-    otto.wait(0)
+            if skip_reason is not None:
+                results.append({'mode': mode, 'skipped': skip_reason})
+                continue
+
+            sys.stderr.write('Benchmarking %s...\n' % mode)
+            results.append(run_mode_in_subprocess(mode, base_url, args))
+    finally:
+        server.terminate()
+        server.wait()
 
-    return time() - start_time
+    report = {
+        'config': {
+            'requests': options.requests,
+            'concurrency': options.concurrency,
+            'distinct_urls': options.distinct_urls,
+            'domains': options.domains,
+            'limit': options.limit,
+            'latency_ms': options.latency_ms,
+            'body_size': options.body_size,
+            'error_rate': options.error_rate,
+            'keep_alive': not options.no_keep_alive,
+            'seed': options.seed,
+            'python': sys.version.split()[0],
+        },
+        'results': results,
+    }
 
+    output = json.dumps(report, indent=2, sort_keys=True)
 
-def handle_url_response(url, response):
-    print "Got %s!" % url
-    assert response.status_code == 200, "Expected status code for %s to be 200, got %s" % (url, response.status_code)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        sys.stdout.write(output + '\n')
 
 
 if __name__ == '__main__':
-    main(int(sys.argv[1]), int(sys.argv[2]))
+    main()
@@ -1,7 +1,14 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import sys
+
 __version__ = '0.6.4'
 
 from octopus.core import Octopus, TimeoutError, ResponseError  # NOQA
 from octopus.tornado_core import TornadoOctopus  # NOQA
+from octopus.process_core import ProcessOctopus  # NOQA
+
+if sys.version_info >= (3, 7):
+    # AsyncioOctopus requires python 3.7+
+    from octopus.asyncio_core import AsyncioOctopus  # NOQA
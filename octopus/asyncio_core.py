@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+
+try:
+    import aiohttp
+except ImportError:
+    print("Can't import aiohttp. Probably setup.py installing package.")
+
+from octopus.in_flight import InFlightRequests
+from octopus.body import BodyReader, get_request_options, is_streaming
+from octopus.core import TimeoutError
+from octopus.engine import (
+    WaitingRequests, create_response_cache, get_limiter_domain, get_retry_count, get_retry_delay,
+    get_validators, report_response
+)
+from octopus.model import Response
+from octopus.request_queue import RequestQueue
+
+
+class AsyncioRequestQueue(asyncio.Queue):
+    # items are (priority, request) tuples, retrieved like in OctopusQueue
+    def _init(self, maxsize):
+        self._queue = RequestQueue()
+
+    def _put(self, item):
+        priority, request = item
+        self._queue.append(request, priority)
+
+    def _get(self):
+        return self._queue.popitem()
+
+
+class AsyncioOctopus(object):
+    def __init__(
+            self, concurrency=10, auto_start=False, cache=False,
+            expiration_in_seconds=30, request_timeout_in_seconds=10,
+            connect_timeout_in_seconds=5, limiter=None,
+            allow_connection_reuse=True, cache_max_entries=None,
+            cache_max_size_in_bytes=None, http_caching=False,
+            coalesce_requests=False, response_cache=None, loop=None,
+            chunk_size_in_bytes=64 * 1024, max_body_size_in_bytes=None,
+            abort_large_bodies=False, headers_only=False):
+
+        self.concurrency = concurrency
+        self.auto_start = auto_start
+
+        self.cache = cache
+        self.http_caching = http_caching
+        self.response_cache = create_response_cache(
+            response_cache, http_caching, expiration_in_seconds, cache_max_entries, cache_max_size_in_bytes
+        )
+        self.request_timeout_in_seconds = request_timeout_in_seconds
+        self.connect_timeout_in_seconds = connect_timeout_in_seconds
+        self.chunk_size_in_bytes = chunk_size_in_bytes
+        self.max_body_size_in_bytes = max_body_size_in_bytes
+        self.abort_large_bodies = abort_large_bodies
+        self.headers_only = headers_only
+
+        self.limiter = limiter
+
+        self.waiting = WaitingRequests()
+        self.retry_handles = {}
+
+        self.coalesce_requests = coalesce_requests
+        self.in_flight = InFlightRequests()
+        self.allow_connection_reuse = allow_connection_reuse
+
+        self.loop = loop
+        # the queue is created by start_workers, inside the running loop.
+        # Requests enqueued before it wait in enqueued.
+        self.url_queue = None
+        self.enqueued = []
+        self.workers = []
+        self.session = None
+
+        if auto_start:
+            logging.debug('Auto starting...')
+            self.start()
+
+    @property
+    def queue_size(self):
+        if self.url_queue is None:
+            return len(self.enqueued) + self.waiting.size
+
+        return self.url_queue.qsize() + self.waiting.size
+
+    @property
+    def is_empty(self):
+        return self.queue_size == 0
+
+    def start(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is not None:
+            self.start_workers()
+            return
+
+        if self.loop is None:
+            logging.debug('Creating event loop.')
+            self.loop = asyncio.new_event_loop()
+
+    def start_workers(self):
+        if self.workers:
+            return
+
+        self.loop = asyncio.get_running_loop()
+
+        if self.url_queue is None:
+            # before python 3.10 asyncio queues are bound to the event loop
+            # that is current when they are created, which is not the one
+            # running them if the queue was created before it started.
+            self.url_queue = AsyncioRequestQueue()
+            for item in self.enqueued:
+                self.url_queue.put_nowait(item)
+            self.enqueued = []
+
+        logging.debug('Creating http session and %d workers.' % self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.concurrency,
+                force_close=not self.allow_connection_reuse
+            ),
+            timeout=aiohttp.ClientTimeout(
+                total=self.request_timeout_in_seconds,
+                connect=self.connect_timeout_in_seconds
+            )
+        )
+
+        for i in range(self.concurrency):
+            self.workers.append(self.loop.create_task(self.do_work()))
+
+    @classmethod
+    def from_aiohttp_response(cls, url, response, body, request_time):
+        # the body is kept as bytes and only decoded if the handler reads
+        # response.text. The body of streamed responses was already given to
+        # the chunk handler.
+        result = Response(
+            url=url, status_code=response.status,
+            headers=response.headers,
+            cookies=dict([(key, morsel.value) for key, morsel in response.cookies.items()]),
+            text=None, effective_url=str(response.url),
+            error=None, request_time=request_time,
+            content=body, encoding=response.charset
+        )
+
+        if response.status > 399:
+            result.error = result.text or None
+
+        return result
+
+    @classmethod
+    def from_error(cls, url, text, request_time):
+        return Response(
+            url=url, status_code=599,
+            headers={}, cookies={},
+            text=text, effective_url=url,
+            error=text, request_time=request_time
+        )
+
+    def wait_for_lock(self, url, handler, method, kwargs, priority):
+        logging.info('Could not acquire limit for url "%s".' % url)
+
+        domain = get_limiter_domain(self.limiter, url)
+        self.waiting.add(domain, (url, handler, method, kwargs), priority)
+        self.schedule_retry(domain, url)
+
+        self.limiter.publish_lock_miss(url)
+
+    def schedule_retry(self, domain, url):
+        # requests waiting for limiters that are also released elsewhere are
+        # retried by a timer. Retried requests start it again when they try to
+        # acquire their locks, so the next delay counts the locks they took.
+        if getattr(self.limiter, 'releases_locally', False) or domain not in self.waiting or domain in self.retry_handles:
+            return
+
+        self.retry_handles[domain] = self.loop.call_later(get_retry_delay(self.limiter, url), self.retry_waiting, domain, url)
+
+    def release(self, url):
+        self.limiter.release(url)
+
+        # the next request waiting for this domain is handed over to the
+        # worker that released the lock.
+        domain = get_limiter_domain(self.limiter, url)
+        items = self.waiting.take(domain)
+        return items and items[0] or None
+
+    def retry_waiting(self, domain, url):
+        # locks might have been released by other processes, so requests
+        # waiting for them go back to the queue to try again. Only as many as
+        # the limiter can take are retried, the others would miss again.
+        self.retry_handles.pop(domain, None)
+
+        for item in self.waiting.take(domain, get_retry_count(self.limiter, url)):
+            self.url_queue.put_nowait(item)
+            # the request was already counted as unfinished when first enqueued
+            self.url_queue.task_done()
+
+    def enqueue(self, url, handler, method='GET', priority=0, **kw):
+        logging.debug('Enqueueing %s...' % url)
+
+        if self.cache and not is_streaming(kw):
+            response = self.response_cache.get(url, method=method, headers=kw.get('headers'))
+
+            if response is not None:
+                logging.debug('Cache hit on %s.' % url)
+                handler(url, response)
+                return
+
+        if self.coalesce_requests and not is_streaming(kw):
+            handler, coalesced = self.in_flight.attach(url, handler, method, kw)
+            if coalesced:
+                return
+
+        item = (priority, (url, handler, method, kw))
+        if self.url_queue is None:
+            self.enqueued.append(item)
+        else:
+            self.url_queue.put_nowait(item)
+
+    async def do_work(self):
+        while True:
+            item = await self.url_queue.get()
+
+            # releasing a limiter lock hands over the next request waiting for
+            # it, which this worker processes right away.
+            while item is not None:
+                priority, (url, handler, method, kwargs) = item
+
+                try:
+                    item = await self.process(url, handler, method, kwargs, priority)
+                except Exception:
+                    logging.exception('Error processing %s.' % url)
+                    self.url_queue.task_done()
+                    item = None
+
+    async def process(self, url, handler, method, kwargs, priority=0):
+        next_item = None
+
+        response = None
+        if self.cache and not is_streaming(kwargs):
+            response = self.response_cache.get(url, method=method, headers=kwargs.get('headers'))
+
+        if response is None and self.limiter and not self.limiter.acquire(url):
+            # the request stays unfinished in the queue while it waits
+            self.wait_for_lock(url, handler, method, kwargs, priority)
+            return None
+
+        if self.limiter and self.waiting:
+            # retried requests keep the retry timer going
+            self.schedule_retry(get_limiter_domain(self.limiter, url), url)
+
+        if response is None:
+            request_kwargs = kwargs
+            validators = get_validators(self, url, method, kwargs)
+            if validators:
+                logging.debug('Revalidating cached response for %s.' % url)
+                request_kwargs = dict(kwargs, headers=dict(kwargs.get('headers') or {}, **validators))
+
+            try:
+                response = await self.fetch(url, method, **request_kwargs)
+            finally:
+                if self.limiter:
+                    next_item = self.release(url)
+
+            if self.limiter:
+                report_response(self.limiter, url, response)
+
+            logging.info('Got response(%s) from %s.' % (response.status_code, url))
+
+            if validators and response.status_code == 304:
+                response = self.response_cache.refresh(
+                    url, response, method=method, headers=kwargs.get('headers')
+                ) or response
+            elif self.cache and not is_streaming(kwargs) and not response.truncated and not response.headers_only and response.status_code < 399:
+                logging.debug('Putting %s into cache.' % url)
+                self.response_cache.put(url, response, method=method, headers=kwargs.get('headers'))
+
+        try:
+            handler(url, response)
+        except Exception:
+            logging.exception('Error calling callback for %s.' % url)
+
+        self.url_queue.task_done()
+
+        return next_item
+
+    async def fetch(self, url, method, **kw):
+        logging.info('Fetching %s...' % url)
+
+        start_time = self.loop.time()
+        options, kw = get_request_options(self, kw)
+        reader = BodyReader.create(url, options)
+
+        try:
+            async with self.session.request(method, url, **kw) as response:
+                if reader is None:
+                    body = await response.read()
+                    return self.from_aiohttp_response(url, response, body, self.loop.time() - start_time)
+
+                logging.debug('Reading response body for %s in chunks.' % url)
+                if not reader.headers_only:
+                    async for chunk in response.content.iter_chunked(self.chunk_size_in_bytes):
+                        if not reader.write(chunk):
+                            break
+
+                if reader.stopped:
+                    # the connection can't be reused with the rest of the body unread
+                    response.close()
+
+                result = self.from_aiohttp_response(url, response, reader.get_content(), self.loop.time() - start_time)
+                reader.update(result)
+                return result
+        except asyncio.TimeoutError:
+            request_time = self.loop.time() - start_time
+            return self.from_error(url, 'Request to %s timed out after %.2f seconds.' % (url, request_time), request_time)
+        except Exception as err:
+            return self.from_error(url, str(err), self.loop.time() - start_time)
+
+    async def join(self, timeout=None):
+        self.start_workers()
+
+        if not timeout:
+            await self.url_queue.join()
+            return
+
+        try:
+            await asyncio.wait_for(self.url_queue.join(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError()
+
+    async def fetch_all(self, urls, handler, method='GET', timeout=None, **kw):
+        for url in urls:
+            self.enqueue(url, handler, method, **kw)
+
+        await self.join(timeout)
+
+    def wait(self, timeout=10):
+        if self.loop is None:
+            self.start()
+
+        logging.info('Running event loop with %d URLs still left to process.' % self.queue_size)
+        self.loop.run_until_complete(self.join(timeout))
+
+    async def close(self):
+        for handle in self.retry_handles.values():
+            handle.cancel()
+        self.retry_handles = {}
+
+        for worker in self.workers:
+            worker.cancel()
+
+        if self.workers:
+            await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
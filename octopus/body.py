@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+# keyword arguments to enqueue that are handled by octopus instead of being
+# passed on to the http client. Options not given default to the engine ones.
+REQUEST_OPTIONS = ('chunk_handler', 'max_body_size_in_bytes', 'abort_large_bodies', 'headers_only')
+
+
+def is_streaming(kw):
+    # requests enqueued with a chunk_handler get their body in chunks as it
+    # arrives. Those are neither cached nor coalesced.
+    return kw.get('chunk_handler') is not None
+
+
+def get_request_options(engine, kw):
+    options = dict([(name, getattr(engine, name, None)) for name in REQUEST_OPTIONS])
+    request_kw = {}
+
+    for key, value in kw.items():
+        if key in options:
+            options[key] = value
+        else:
+            request_kw[key] = value
+
+    return options, request_kw
+
+
+class BodyReader(object):
+    # reads a response body as it arrives, handing it to the chunk handler if
+    # there is one, and stops reading it as soon as it is not wanted anymore.
+    @classmethod
+    def create(cls, url, options):
+        # bodies are only read in chunks when they have to be
+        if options['chunk_handler'] is None and options['max_body_size_in_bytes'] is None and not options['headers_only']:
+            return None
+
+        return cls(url, **options)
+
+    def __init__(
+            self, url, chunk_handler=None, max_body_size_in_bytes=None,
+            abort_large_bodies=False, headers_only=False):
+        self.url = url
+        self.chunk_handler = chunk_handler
+        self.max_body_size_in_bytes = max_body_size_in_bytes
+        self.abort_large_bodies = abort_large_bodies
+        self.headers_only = headers_only
+
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+
+    @property
+    def stopped(self):
+        return self.headers_only or self.truncated
+
+    @property
+    def complete(self):
+        # whether the whole body was read and kept, so it can be cached
+        return not self.stopped and self.chunk_handler is None
+
+    def write(self, chunk):
+        # returns whether the rest of the body should be read
+        if self.stopped:
+            return False
+
+        if not chunk:
+            return True
+
+        max_size = self.max_body_size_in_bytes
+        if max_size is not None and self.size + len(chunk) > max_size:
+            logging.info('Response body for %s is larger than %d bytes.' % (self.url, max_size))
+            chunk = chunk[:max_size - self.size]
+            self.truncated = True
+
+            if self.abort_large_bodies:
+                return False
+
+        if chunk:
+            self.size += len(chunk)
+
+            if self.chunk_handler is not None:
+                self.chunk_handler(self.url, chunk)
+            else:
+                self.chunks.append(chunk)
+
+        return not self.truncated
+
+    def get_content(self):
+        if self.headers_only or self.chunk_handler is not None:
+            return None
+
+        if self.truncated and self.abort_large_bodies:
+            return None
+
+        return b''.join(self.chunks)
+
+    def update(self, response):
+        response.truncated = self.truncated
+        response.headers_only = self.headers_only
+
+        if self.truncated and self.abort_large_bodies:
+            response.error = 'Response body for %s is larger than %d bytes.' % (self.url, self.max_body_size_in_bytes)
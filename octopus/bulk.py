@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from itertools import islice
+
+try:
+    import six
+except ImportError:
+    print("Can't import six. Probably setup.py installing package.")
+
+from octopus.body import is_streaming
+
+
+def read_requests(source):
+    # yields the requests in a file with one json object per line, like
+    # {"url": "http://www.globo.com", "method": "POST", "headers": {}, "body": "a=b"}
+    # lines can also be just the url as a json string. The file is read as the
+    # requests are consumed, so it can be as big as needed.
+    if isinstance(source, six.string_types):
+        with open(source) as lines:
+            for request in read_requests(lines):
+                yield request
+        return
+
+    for number, line in enumerate(source, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+        except ValueError:
+            logging.warning('Invalid request in line %d: %s' % (number, line))
+            continue
+
+        if isinstance(request, six.string_types):
+            request = {'url': request}
+
+        if not isinstance(request, dict) or not request.get('url'):
+            logging.warning('Request without url in line %d: %s' % (number, line))
+            continue
+
+        request.setdefault('method', 'GET')
+        request.setdefault('headers', {})
+        request.setdefault('body', None)
+
+        yield request
+
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+
+        yield batch
+
+
+def get_request(item, method='GET', priority=0, kw=None, body_argument='body'):
+    # items given to enqueue_many are urls or requests like the ones read by
+    # read_requests. Returns (url, method, priority, kw).
+    kw = kw or {}
+
+    if isinstance(item, six.string_types):
+        return item, method, priority, kw
+
+    request_kw = dict(kw)
+
+    if item.get('headers'):
+        headers = dict(kw.get('headers') or {})
+        headers.update(item['headers'])
+        request_kw['headers'] = headers
+
+    if item.get('body') is not None:
+        request_kw[body_argument] = item['body']
+
+    return item['url'], item.get('method') or method, item.get('priority', priority), request_kw
+
+
+def is_simple(method, kw):
+    return method.upper() == 'GET' and not kw.get('headers') and not is_streaming(kw)
+
+
+def get_cached_responses(cache, requests):
+    # returns the cached response (or None) for each (url, method, priority, kw).
+    # Caches with get_many look up all the plain GET requests at once.
+    get_many = getattr(cache, 'get_many', None)
+
+    cached = {}
+    if get_many is not None:
+        urls = [url for url, method, priority, kw in requests if is_simple(method, kw)]
+        cached = urls and get_many(urls) or {}
+
+    responses = []
+    for url, method, priority, kw in requests:
+        if is_streaming(kw):
+            responses.append(None)
+        elif get_many is not None and is_simple(method, kw):
+            responses.append(cached.get(url))
+        else:
+            responses.append(cache.get(url, method=method, headers=kw.get('headers')))
+
+    return responses
@@ -1,29 +1,371 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import heapq
+import time
+from collections import OrderedDict, deque
+from email.utils import mktime_tz, parsedate_tz
+from threading import RLock
 
-from datetime import datetime, timedelta
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+CACHEABLE_STATUS_CODES = (200, 203, 204, 300, 301, 404, 405, 410, 414, 501)
+
+# headers of a 304 response that must not replace the ones in the cached response
+IGNORED_REVALIDATION_HEADERS = ('content-length', 'content-encoding', 'transfer-encoding')
+
+
+def get_header(headers, name):
+    if not headers:
+        return None
+
+    value = headers.get(name)
+    if value is not None:
+        return value
+
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+
+    return None
+
+
+def parse_cache_control(value):
+    directives = {}
+
+    if not value:
+        return directives
+
+    for directive in value.split(','):
+        name, separator, argument = directive.partition('=')
+        directives[name.strip().lower()] = separator and argument.strip().strip('"') or None
+
+    return directives
+
+
+def parse_http_date(value):
+    parsed = value and parsedate_tz(value)
+
+    if not parsed:
+        return None
+
+    return mktime_tz(parsed)
+
+
+def can_revalidate(cache):
+    # http caching revalidates stale responses with get_validators and refresh
+    return callable(getattr(cache, 'get_validators', None)) and callable(getattr(cache, 'refresh', None))
 
 
 class Cache(object):
-    def __init__(self, expiration_in_seconds):
-        self.responses = {}
+    def __init__(self, expiration_in_seconds, max_entries=None, max_size_in_bytes=None):
+        self.responses = OrderedDict()
         self.expiration_in_seconds = expiration_in_seconds
+        self.max_entries = max_entries
+        self.max_size_in_bytes = max_size_in_bytes
+        self.size_in_bytes = 0
+
+        # (expires, url) in insertion order. Since every entry lives the same
+        # number of seconds, the oldest entries are always at the left.
+        self.expiration_queue = deque()
+        self.lock = RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
-    def put(self, url, response):
-        self.responses[url] = {
-            'response': response,
-            'expires': datetime.now() + timedelta(seconds=self.expiration_in_seconds)
+    def __len__(self):
+        return len(self.responses)
+
+    @property
+    def stats(self):
+        return {
+            'entries': len(self.responses),
+            'size_in_bytes': self.size_in_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
         }
 
-    def get(self, url):
-        if url not in self.responses:
-            return None
+    def get_size(self, response):
+        # the raw body is measured when available, so it is not decoded
+        content = getattr(response, 'content', None)
+        if isinstance(content, bytes):
+            return len(content)
+
+        try:
+            return len(response.text or '')
+        except (AttributeError, TypeError):
+            return 0
+
+    def put(self, url, response, method='GET', headers=None):
+        now = monotonic()
+        self.store(url, response, now + self.expiration_in_seconds, now)
+
+    def store(self, key, response, expires, now, *extra):
+        size = self.get_size(response)
+
+        with self.lock:
+            self.remove(key)
+
+            self.responses[key] = (response, expires, size) + extra
+            self.size_in_bytes += size
+            self.schedule_expiration(expires, key)
+
+            self.remove_expired(now)
+            self.evict()
+
+    def schedule_expiration(self, expires, key):
+        self.expiration_queue.append((expires, key))
+
+    def pop_expiration(self):
+        return self.expiration_queue.popleft()
+
+    def get(self, url, method='GET', headers=None):
+        now = monotonic()
+
+        with self.lock:
+            self.remove_expired(now)
+
+            data = self.responses.pop(url, None)
+
+            if data is None:
+                self.misses += 1
+                return None
+
+            response, expires, size = data
+
+            if expires <= now:
+                self.size_in_bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            # re-inserting moves the url to the most recently used position
+            self.responses[url] = data
+            self.hits += 1
+
+            return response
+
+    def get_many(self, urls):
+        # looks up all the urls holding the lock only once
+        responses = {}
+
+        with self.lock:
+            for url in urls:
+                response = self.get(url)
+                if response is not None:
+                    responses[url] = response
+
+        return responses
+
+    def remove(self, url):
+        with self.lock:
+            data = self.responses.pop(url, None)
+
+            if data is not None:
+                self.size_in_bytes -= data[2]
+
+    def remove_expired(self, now=None):
+        if now is None:
+            now = monotonic()
+
+        with self.lock:
+            while self.expiration_queue and self.expiration_queue[0][0] <= now:
+                expires, url = self.pop_expiration()
+
+                data = self.responses.get(url)
+
+                # the url might have been put again or evicted since
+                if data is not None and data[1] == expires:
+                    self.remove(url)
+                    self.expirations += 1
+
+    def evict(self):
+        with self.lock:
+            while self.responses and (
+                (self.max_entries is not None and len(self.responses) > self.max_entries) or
+                (self.max_size_in_bytes is not None and self.size_in_bytes > self.max_size_in_bytes)
+            ):
+                url, data = self.responses.popitem(last=False)
+                self.size_in_bytes -= data[2]
+                self.evictions += 1
+
+
+class HttpCache(Cache):
+    def __init__(
+            self, expiration_in_seconds, max_entries=None, max_size_in_bytes=None,
+            stale_expiration_in_seconds=3600):
+        super(HttpCache, self).__init__(
+            expiration_in_seconds=expiration_in_seconds,
+            max_entries=max_entries,
+            max_size_in_bytes=max_size_in_bytes
+        )
+
+        # responses have different lifetimes, so expirations are kept in a heap
+        self.expiration_queue = []
+        self.stale_expiration_in_seconds = stale_expiration_in_seconds
+        self.vary = OrderedDict()
+        self.revalidations = 0
+
+    @property
+    def stats(self):
+        stats = super(HttpCache, self).stats
+        stats['revalidations'] = self.revalidations
+        return stats
+
+    def schedule_expiration(self, expires, key):
+        heapq.heappush(self.expiration_queue, (expires, key))
+
+    def pop_expiration(self):
+        return heapq.heappop(self.expiration_queue)
+
+    def get_primary_key(self, url, method):
+        return '%s %s' % (method.upper(), url)
+
+    def get_key(self, url, method='GET', headers=None):
+        primary_key = self.get_primary_key(url, method)
+        vary = self.vary.get(primary_key)
+
+        if not vary:
+            return primary_key
+
+        return '\n'.join([primary_key] + ['%s: %s' % (name, get_header(headers, name) or '') for name in vary])
+
+    def get_freshness(self, response, directives):
+        freshness = None
+
+        if 'max-age' in directives:
+            try:
+                freshness = int(directives['max-age'])
+            except (TypeError, ValueError):
+                freshness = 0
+        else:
+            expires = parse_http_date(get_header(response.headers, 'Expires'))
+            if expires is not None:
+                date = parse_http_date(get_header(response.headers, 'Date')) or time.time()
+                freshness = expires - date
+
+        if freshness is None:
+            freshness = self.expiration_in_seconds
+
+        try:
+            freshness -= int(get_header(response.headers, 'Age') or 0)
+        except ValueError:
+            pass
+
+        if 'no-cache' in directives:
+            freshness = 0
+
+        return max(0, freshness)
+
+    def has_validators(self, response):
+        return bool(get_header(response.headers, 'ETag') or get_header(response.headers, 'Last-Modified'))
+
+    def put(self, url, response, method='GET', headers=None):
+        if method.upper() not in CACHEABLE_METHODS or response.status_code not in CACHEABLE_STATUS_CODES:
+            return
+
+        primary_key = self.get_primary_key(url, method)
+        directives = parse_cache_control(get_header(response.headers, 'Cache-Control'))
+        vary = sorted([
+            name.strip().lower()
+            for name in (get_header(response.headers, 'Vary') or '').split(',')
+            if name.strip()
+        ])
+
+        if 'no-store' in directives or '*' in vary:
+            self.remove(self.get_key(url, method, headers))
+            return
+
+        now = monotonic()
+        fresh_until = now + self.get_freshness(response, directives)
+
+        # stale responses are kept around if they can be revalidated
+        expires = fresh_until
+        if self.has_validators(response):
+            expires += self.stale_expiration_in_seconds
+
+        with self.lock:
+            self.vary.pop(primary_key, None)
+            if vary:
+                self.vary[primary_key] = vary
+                if self.max_entries is not None and len(self.vary) > self.max_entries:
+                    self.vary.popitem(last=False)
+
+            self.store(self.get_key(url, method, headers), response, expires, now, fresh_until)
+
+    def get(self, url, method='GET', headers=None):
+        now = monotonic()
+
+        with self.lock:
+            self.remove_expired(now)
+
+            key = self.get_key(url, method, headers)
+            data = self.responses.pop(key, None)
+
+            if data is None:
+                self.misses += 1
+                return None
+
+            self.responses[key] = data
+
+            if data[3] <= now:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return data[0]
+
+    def get_validators(self, url, method='GET', headers=None):
+        with self.lock:
+            data = self.responses.get(self.get_key(url, method, headers))
+
+        if data is None:
+            return {}
+
+        validators = {}
+
+        etag = get_header(data[0].headers, 'ETag')
+        if etag:
+            validators['If-None-Match'] = etag
+
+        last_modified = get_header(data[0].headers, 'Last-Modified')
+        if last_modified:
+            validators['If-Modified-Since'] = last_modified
+
+        return validators
+
+    def refresh(self, url, response, method='GET', headers=None):
+        with self.lock:
+            data = self.responses.get(self.get_key(url, method, headers))
+
+            if data is None:
+                return None
+
+            cached_response = data[0]
+
+            for key, value in response.headers.items():
+                if key.lower() in IGNORED_REVALIDATION_HEADERS:
+                    continue
+
+                for cached_key in list(cached_response.headers.keys()):
+                    if cached_key.lower() == key.lower():
+                        del cached_response.headers[cached_key]
+
+                cached_response.headers[key] = value
 
-        data = self.responses[url]
+            cached_response.request_time = response.request_time
+            self.revalidations += 1
 
-        if data['expires'] <= datetime.now():
-            del self.responses[url]
-            return None
+            self.put(url, cached_response, method, headers)
 
-        return data['response']
+        return cached_response
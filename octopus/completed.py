@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+try:
+    from six.moves import queue
+except ImportError:
+    print("Can't import six. Probably setup.py installing package.")
+
+
+class CompletedResponses(object):
+    # responses for as_completed. At most max_pending urls are enqueued and
+    # not consumed yet, so urls are only fetched as fast as the responses are
+    # consumed and no more than max_pending responses are ever kept.
+    def __init__(self, engine, urls, method='GET', max_pending=None, **kw):
+        self.engine = engine
+        self.urls = iter(urls)
+        self.method = method
+        self.max_pending = max_pending or engine.concurrency
+        self.kw = kw
+
+        self.responses = queue.Queue()
+        self.pending = 0
+        self.exhausted = False
+
+        # a url the engine had no room for, enqueued again on the next fill
+        self.rejected = None
+
+    @property
+    def finished(self):
+        return self.exhausted and self.pending == 0 and self.rejected is None
+
+    def fill(self):
+        while self.pending < self.max_pending:
+            url, self.rejected = self.rejected, None
+
+            if url is None:
+                if self.exhausted:
+                    return
+
+                try:
+                    url = next(self.urls)
+                except StopIteration:
+                    self.exhausted = True
+                    return
+
+            if self.engine.enqueue(url, self.handle, self.method, **self.kw) is False:
+                self.rejected = url
+                return
+
+            self.pending += 1
+
+    def handle(self, url, response):
+        # handlers can be called from other threads
+        self.responses.put((url, response))
+
+    def get(self, timeout=None):
+        # returns None if no response arrives in time
+        try:
+            item = self.responses.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        self.pending -= 1
+        return item
+
+    def get_nowait(self):
+        try:
+            item = self.responses.get_nowait()
+        except queue.Empty:
+            return None
+
+        self.pending -= 1
+        return item
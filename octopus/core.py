@@ -5,22 +5,79 @@ import logging
 import sys
 import time
 from datetime import timedelta
-from threading import Thread
+from threading import Lock, Thread, Timer, local
 
 try:
     import requests
+    import requests.adapters
     import requests.exceptions
 except ImportError:
     print("Can't import requests. Probably setup.py installing package.")
 
-from octopus.cache import Cache
+try:
+    from six.moves.http_cookiejar import DefaultCookiePolicy
+except ImportError:
+    print("Can't import six. Probably setup.py installing package.")
+
+from octopus.body import BodyReader, get_request_options, is_streaming
+from octopus.bulk import get_cached_responses, get_request, iter_batches
+from octopus.completed import CompletedResponses
+from octopus.engine import (
+    WaitingRequests, create_response_cache, get_limiter_domain, get_retry_count, get_retry_delay,
+    get_validators, report_response
+)
+from octopus.in_flight import InFlightRequests
+from octopus.metrics import Metrics
 from octopus.model import Response
+from octopus.request_queue import RequestQueue
 
 try:
 
     from six.moves import queue
 
     class OctopusQueue(queue.Queue):
+        # items are (priority, request) tuples. Requests are retrieved in
+        # priority order, and in the order they were put for the same priority.
+        def _init(self, maxsize):
+            self.queue = RequestQueue()
+
+        def _qsize(self):
+            return len(self.queue)
+
+        def _put(self, item):
+            priority, request = item
+            self.queue.append(request, priority)
+
+        def _get(self):
+            return self.queue.popitem()
+
+        def force_put(self, item):
+            self.force_put_many([item])
+
+        def force_put_many(self, items):
+            # puts the items at once, even if the queue is full
+            with self.not_empty:
+                for item in items:
+                    self._put(item)
+                self.unfinished_tasks += len(items)
+                self.not_empty.notify(len(items))
+
+        def wait_for_room(self, timeout=None):
+            # returns False if the queue is still full after timeout seconds
+            with self.not_full:
+                endtime = timeout is not None and time.time() + timeout
+                while 0 < self.maxsize <= self._qsize():
+                    if timeout is None:
+                        self.not_full.wait()
+                        continue
+
+                    remaining = endtime - time.time()
+                    if remaining <= 0.0:
+                        return False
+                    self.not_full.wait(remaining)
+
+            return True
+
         # from http://stackoverflow.com/questions/1564501/add-timeout-argument-to-pythons-queue-join
         def join_with_timeout(self, timeout):
             self.all_tasks_done.acquire()
@@ -43,6 +100,11 @@ class TimeoutError(RuntimeError):
 
 
 class ResponseError(object):
+    __slots__ = (
+        'url', 'status_code', 'text', 'error', 'headers', 'cookies',
+        'effective_url', 'elapsed', 'content', 'encoding'
+    )
+
     def __init__(self, url, status_code, text, error=None, elapsed=None):
         self.url = url
         self.status_code = status_code
@@ -52,6 +114,8 @@ class ResponseError(object):
         self.cookies = {}
         self.effective_url = url
         self.elapsed = elapsed
+        self.content = None
+        self.encoding = None
 
     def close(self):
         pass
@@ -60,48 +124,223 @@ class ResponseError(object):
 class Octopus(object):
     def __init__(
             self, concurrency=10, auto_start=False, cache=False,
-            expiration_in_seconds=30, request_timeout_in_seconds=5, limiter=None
+            expiration_in_seconds=30, request_timeout_in_seconds=5, limiter=None,
+            allow_connection_reuse=True, connection_pool_size=None,
+            connection_pool_sizes=None, max_pooled_hosts=10,
+            cache_max_entries=None, cache_max_size_in_bytes=None,
+            http_caching=False, coalesce_requests=False, response_cache=None,
+            chunk_size_in_bytes=64 * 1024, max_body_size_in_bytes=None,
+            abort_large_bodies=False, headers_only=False,
+            max_queue_size=None, enqueue_timeout_in_seconds=None, metrics=None
             ):
 
         self.concurrency = concurrency
         self.auto_start = auto_start
 
         self.cache = cache
-        self.response_cache = Cache(expiration_in_seconds=expiration_in_seconds)
+        self.http_caching = http_caching
+        self.response_cache = create_response_cache(
+            response_cache, http_caching, expiration_in_seconds, cache_max_entries, cache_max_size_in_bytes
+        )
         self.request_timeout_in_seconds = request_timeout_in_seconds
-
-        self.url_queue = OctopusQueue()
+        self.chunk_size_in_bytes = chunk_size_in_bytes
+        self.max_body_size_in_bytes = max_body_size_in_bytes
+        self.abort_large_bodies = abort_large_bodies
+        self.headers_only = headers_only
+
+        # with a max_queue_size, enqueue blocks until there is room in the
+        # queue, or for at most enqueue_timeout_in_seconds.
+        self.max_queue_size = max_queue_size
+        self.enqueue_timeout_in_seconds = enqueue_timeout_in_seconds
+        self.url_queue = OctopusQueue(maxsize=max_queue_size or 0)
         self.limiter = limiter
 
+        self.pending = WaitingRequests()
+        self.pending_lock = Lock()
+        self.retry_timers = {}
+
+        self.coalesce_requests = coalesce_requests
+        self.in_flight = InFlightRequests()
+
+        self.allow_connection_reuse = allow_connection_reuse
+        self.connection_pool_size = connection_pool_size or concurrency
+        self.connection_pool_sizes = connection_pool_sizes or {}
+        self.max_pooled_hosts = max_pooled_hosts
+        self.connection_adapters = None
+        self.sessions = local()
+        self.workers = local()
+
+        # a metrics registry can be shared by engines, adding up their counts
+        self.metrics = metrics or Metrics()
+        self.metrics.watch(self)
+
+        if self.allow_connection_reuse:
+            self.connection_adapters = self.get_connection_adapters()
+
         if auto_start:
             self.start()
 
-    def from_requests_response(self, url, response):
-        return Response(
+    def from_requests_response(self, url, response, body=None):
+        # the body is kept as bytes and only decoded if the handler reads
+        # response.text. Bodies read in chunks come from the body reader.
+        text = content = None
+        if body is not None:
+            content = body.get_content()
+        else:
+            content = response.content
+            if content is None:
+                text = response.text
+
+        result = Response(
             url=url, status_code=response.status_code,
-            headers=dict([(key, value) for key, value in response.headers.items()]),
-            cookies=dict([(key, value) for key, value in response.cookies.items()]),
-            text=response.text, effective_url=response.url,
-            error=response.status_code > 399 and response.text or None,
-            request_time=response.elapsed and response.elapsed.total_seconds or 0
+            headers=response.headers, cookies=response.cookies,
+            text=text, effective_url=response.url, error=None,
+            request_time=response.elapsed and response.elapsed.total_seconds() or 0,
+            content=content, encoding=response.encoding
+        )
+
+        if body is not None:
+            body.update(result)
+
+        if response.status_code > 399 and result.error is None:
+            result.error = result.text or None
+
+        return result
+
+    def get_connection_adapters(self):
+        # adapters are shared by all worker threads, so connections opened by
+        # one thread can be kept alive and reused by any other thread.
+        adapters = []
+
+        for prefix, pool_size in self.connection_pool_sizes.items():
+            adapters.append((prefix, self.create_connection_adapter(pool_size)))
+
+        default_adapter = self.create_connection_adapter(self.connection_pool_size)
+        adapters.append(('http://', default_adapter))
+        adapters.append(('https://', default_adapter))
+
+        return adapters
+
+    def create_connection_adapter(self, pool_size):
+        return requests.adapters.HTTPAdapter(
+            pool_connections=self.max_pooled_hosts,
+            pool_maxsize=pool_size
         )
 
-    def enqueue(self, url, handler, method='GET', **kw):
-        if self.cache:
-            response = self.response_cache.get(url)
+    def get_session(self):
+        session = getattr(self.sessions, 'session', None)
+
+        if session is None:
+            logging.debug('Creating http session for this worker thread.')
+            session = requests.Session()
+
+            # responses must not leak cookies into subsequent requests.
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+            for prefix, adapter in self.connection_adapters:
+                session.mount(prefix, adapter)
+
+            self.sessions.session = session
+
+        return session
+
+    def request(self, method, url, **kw):
+        if not self.allow_connection_reuse:
+            return requests.request(method, url, **kw)
+
+        return self.get_session().request(method, url, **kw)
+
+    def enqueue(self, url, handler, method='GET', priority=0, **kw):
+        # returns False if the queue is full and the url was not enqueued
+        if self.cache and not is_streaming(kw):
+            response = self.response_cache.get(url, method=method, headers=kw.get('headers'))
             if response is not None:
+                self.metrics.record_cache_hit()
                 handler(url, response)
-                return
+                return True
 
-        self.url_queue.put_nowait((url, handler, method, kw))
+        return self.put_requests([(url, handler, method, priority, kw)]) == 1
+
+    def enqueue_many(self, requests, handler, method='GET', priority=0, batch_size=100, **kw):
+        # enqueues urls or request descriptors, looking them up in the cache and
+        # putting them in the queue a batch at a time. Returns how many were enqueued.
+        count = 0
+
+        for batch in iter_batches(requests, batch_size):
+            batch = [get_request(item, method, priority, kw, body_argument='data') for item in batch]
+            logging.debug('Enqueueing %d urls...' % len(batch))
+
+            responses = [None] * len(batch)
+            if self.cache:
+                responses = get_cached_responses(self.response_cache, batch)
+
+            missing = []
+            for (url, request_method, request_priority, request_kw), response in zip(batch, responses):
+                if response is None:
+                    missing.append((url, handler, request_method, request_priority, request_kw))
+                else:
+                    self.metrics.record_cache_hit()
+                    handler(url, response)
+                    count += 1
+
+            count += self.put_requests(missing)
+
+        return count
+
+    def put_requests(self, requests):
+        # returns how many requests were put in the queue (or coalesced)
+        count = 0
+        items = []
+
+        for url, handler, method, priority, kw in requests:
+            if self.coalesce_requests and not is_streaming(kw):
+                handler, coalesced = self.in_flight.attach(url, handler, method, kw)
+                if coalesced:
+                    count += 1
+                    continue
+
+            items.append((priority, (url, handler, method, kw)))
+
+        if not self.max_queue_size or getattr(self.workers, 'running', False):
+            # handlers enqueueing urls would wait for their own worker thread
+            self.url_queue.force_put_many(items)
+            return count + len(items)
+
+        for item in items:
+            if self.put(item):
+                count += 1
+
+        return count
+
+    def put(self, item):
+        priority, (url, handler, method, kw) = item
+
+        timeout = self.enqueue_timeout_in_seconds
+        try:
+            self.url_queue.put(item, block=timeout != 0, timeout=timeout or None)
+        except queue.Full:
+            if self.coalesce_requests and not is_streaming(kw) and not self.in_flight.detach(url, method, kw):
+                # other handlers are waiting for this request already
+                self.url_queue.force_put(item)
+                return True
+
+            logging.info('Queue is full. Could not enqueue %s.' % url)
+            return False
+
+        return True
+
+    @property
+    def pending_size(self):
+        with self.pending_lock:
+            return self.pending.size
 
     @property
     def queue_size(self):
-        return self.url_queue.qsize()
+        return self.url_queue.qsize() + self.pending_size
 
     @property
     def is_empty(self):
-        return self.url_queue.empty()
+        return self.url_queue.empty() and self.pending_size == 0
 
     def start(self):
         for i in range(self.concurrency):
@@ -110,60 +349,237 @@ class Octopus(object):
             t.start()
 
     def do_work(self):
+        self.workers.running = True
+
         while True:
-            url, handler, method, kwargs = self.url_queue.get()
+            item = self.url_queue.get()
+
+            # releasing a limiter lock hands over the next request waiting for
+            # it, which this worker processes right away.
+            while item is not None:
+                item = self.process(*item)
+
+    def report_response(self, url, response, failed=False):
+        if failed and response.status_code != 599:
+            # requests that got no response, like timeouts, are reported with
+            # status code 599, as the other engines do.
+            response = Response(
+                url=url, status_code=599, headers={}, cookies={}, text=None,
+                effective_url=url, error=response.error, request_time=response.request_time
+            )
+
+        if getattr(self.limiter, 'remote', False):
+            report_response(self.limiter, url, response)
+            return
+
+        with self.pending_lock:
+            report_response(self.limiter, url, response)
+
+    def acquire(self, priority, request):
+        url = request[0]
+        domain = get_limiter_domain(self.limiter, url)
+
+        # local limiters are only safe to call holding the lock. Remote ones
+        # are called without it, since requests that miss a release while
+        # they are put to wait are retried by the timer anyway.
+        remote = getattr(self.limiter, 'remote', False)
+        if remote:
+            acquired = self.limiter.acquire(url)
+
+        if not remote or not acquired:
+            with self.pending_lock:
+                if not remote:
+                    acquired = self.limiter.acquire(url)
+
+                if not acquired:
+                    self.pending.add(domain, request, priority)
+
+        self.schedule_retry(domain, url)
+
+        return acquired
+
+    def schedule_retry(self, domain, url):
+        # requests waiting for limiters that are also released elsewhere are
+        # retried by a timer. Retried requests start it again when they try to
+        # acquire their locks, so the next delay counts the locks they took.
+        if getattr(self.limiter, 'releases_locally', False) or domain not in self.pending:
+            return
+
+        remote = getattr(self.limiter, 'remote', False)
+        with self.pending_lock:
+            if domain not in self.pending or domain in self.retry_timers:
+                return
 
-            response = None
-            if self.cache:
-                response = self.response_cache.get(url)
-
-            if response is None:
-                if self.limiter and not self.limiter.acquire(url):
-                    logging.info('Could not acquire limit for url "%s".' % url)
-                    self.url_queue.task_done()
-                    self.url_queue.put_nowait((url, handler, method, kwargs))
-                    self.limiter.publish_lock_miss(url)
-                    time.sleep(0.1)
-                    continue
+            self.retry_timers[domain] = None
+            if not remote:
+                delay = get_retry_delay(self.limiter, url)
+
+        # getting the delay can take a round trip to remote limiters
+        if remote:
+            delay = get_retry_delay(self.limiter, url)
+
+        timer = Timer(delay, self.retry_pending, [domain, url])
+        timer.daemon = True
+        self.retry_timers[domain] = timer
+        timer.start()
+
+    def release(self, url):
+        domain = get_limiter_domain(self.limiter, url)
+
+        remote = getattr(self.limiter, 'remote', False)
+        if remote:
+            self.limiter.release(url)
+
+        with self.pending_lock:
+            if not remote:
+                self.limiter.release(url)
+
+            items = self.pending.take(domain)
+
+        return items and items[0] or None
 
-                try:
-                    response = requests.request(method, url, timeout=self.request_timeout_in_seconds, **kwargs)
-                except requests.exceptions.Timeout:
-                    err = sys.exc_info()[1]
-                    response = ResponseError(
-                        url=url,
-                        status_code=500,
-                        text=str(err),
-                        error=err,
-                        elapsed=timedelta(seconds=self.request_timeout_in_seconds)
-                    )
-                except Exception:
-                    err = sys.exc_info()[1]
-                    response = ResponseError(
-                        url=url,
-                        status_code=599,
-                        text=str(err),
-                        error=err
-                    )
-                finally:
-                    if self.limiter:
-                        self.limiter.release(url)
-
-                original_response = response
-
-                response = self.from_requests_response(url, response)
-
-                original_response.close()
-
-                if self.cache:
-                    self.response_cache.put(url, response)
-
-            handler(url, response)
+    def retry_pending(self, domain, url):
+        # locks might have been released by other processes, so requests
+        # waiting for them go back to the queue to try again. Only as many as
+        # the limiter can take are retried, the others would miss again.
+        remote = getattr(self.limiter, 'remote', False)
+        if remote:
+            count = get_retry_count(self.limiter, url)
 
+        with self.pending_lock:
+            self.retry_timers.pop(domain, None)
+            if not remote:
+                count = get_retry_count(self.limiter, url)
+
+            requests = self.pending.take(domain, count)
+
+        for item in requests:
+            self.url_queue.force_put(item)
+            # the request was already counted as unfinished when first enqueued
             self.url_queue.task_done()
 
+    def process(self, priority, request):
+        url, handler, method, kwargs = request
+        next_item = None
+        body = None
+
+        response = None
+        if self.cache and not is_streaming(kwargs):
+            response = self.response_cache.get(url, method=method, headers=kwargs.get('headers'))
+            if response is not None:
+                self.metrics.record_cache_hit()
+                if self.limiter:
+                    # retried requests keep the retry timer going
+                    self.schedule_retry(get_limiter_domain(self.limiter, url), url)
+
+        if response is None:
+            if self.limiter and not self.acquire(priority, request):
+                logging.info('Could not acquire limit for url "%s".' % url)
+                self.limiter.publish_lock_miss(url)
+                self.metrics.record_limiter_miss(url, get_limiter_domain(self.limiter, url))
+                return None
+
+            request_kwargs = kwargs
+            validators = get_validators(self, url, method, kwargs)
+            if validators:
+                logging.debug('Revalidating cached response for %s.' % url)
+                request_kwargs = dict(kwargs, headers=dict(kwargs.get('headers') or {}, **validators))
+
+            options, request_kwargs = get_request_options(self, request_kwargs)
+            reader = BodyReader.create(url, options)
+            if reader is not None:
+                request_kwargs['stream'] = True
+
+            self.metrics.start_request(cache_miss=self.cache and not is_streaming(kwargs))
+
+            try:
+                response = self.request(method, url, timeout=self.request_timeout_in_seconds, **request_kwargs)
+
+                # the limiter lock is kept until the body is read
+                if reader is not None:
+                    self.read(response, reader)
+                    body = reader
+            except requests.exceptions.Timeout:
+                self.metrics.record_timeout()
+                err = sys.exc_info()[1]
+                response = ResponseError(
+                    url=url,
+                    status_code=500,
+                    text=str(err),
+                    error=err,
+                    elapsed=timedelta(seconds=self.request_timeout_in_seconds)
+                )
+            except Exception:
+                self.metrics.record_error()
+                err = sys.exc_info()[1]
+                response = ResponseError(
+                    url=url,
+                    status_code=599,
+                    text=str(err),
+                    error=err
+                )
+            finally:
+                if self.limiter:
+                    next_item = self.release(url)
+
+            original_response = response
+
+            response = self.from_requests_response(url, response, body=body)
+            self.metrics.end_request(url, response)
+
+            original_response.close()
+
+            if self.limiter:
+                self.report_response(url, response, failed=isinstance(original_response, ResponseError))
+
+            if validators and response.status_code == 304:
+                response = self.response_cache.refresh(
+                    url, response, method=method, headers=kwargs.get('headers')
+                ) or response
+            elif self.cache and (body is None or body.complete):
+                self.response_cache.put(url, response, method=method, headers=kwargs.get('headers'))
+
+        handler(url, response)
+
+        self.url_queue.task_done()
+
+        return next_item
+
+    def read(self, response, reader):
+        logging.debug('Reading response body for %s in chunks.' % reader.url)
+
+        if reader.headers_only:
+            return
+
+        for chunk in response.iter_content(chunk_size=self.chunk_size_in_bytes):
+            if not reader.write(chunk):
+                break
+
     def wait(self, timeout=10):
         if timeout > 0:
             self.url_queue.join_with_timeout(timeout=timeout)
         else:
             self.url_queue.join()
+
+    def as_completed(self, urls, method='GET', timeout=None, max_pending_responses=None, **kw):
+        # yields (url, response) as responses arrive. More urls are only
+        # enqueued as responses are consumed.
+        responses = CompletedResponses(self, urls, method, max_pending_responses, **kw)
+        deadline = timeout and time.time() + timeout
+
+        responses.fill()
+        while not responses.finished:
+            if responses.pending == 0:
+                # the queue was full, so the next url is enqueued again once
+                # the workers took something out of it
+                if not self.url_queue.wait_for_room(deadline and max(deadline - time.time(), 0)):
+                    raise TimeoutError('Timed out enqueueing urls.')
+                responses.fill()
+                continue
+
+            item = responses.get(timeout=deadline and max(deadline - time.time(), 0))
+            if item is None:
+                raise TimeoutError('Timed out waiting for %d urls.' % responses.pending)
+
+            responses.fill()
+            yield item
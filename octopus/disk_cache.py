@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import sqlite3
+import time
+from threading import local
+
+from octopus.serialization import dumps_response, loads_response
+
+
+class DiskCache(object):
+    def __init__(
+            self, path, expiration_in_seconds, max_entries=None, max_size_in_bytes=None,
+            compress=False, eviction_interval=100, timeout_in_seconds=10, batch_size=500):
+
+        self.path = path
+        self.expiration_in_seconds = expiration_in_seconds
+        self.max_entries = max_entries
+        self.max_size_in_bytes = max_size_in_bytes
+        self.compress = compress
+        self.eviction_interval = eviction_interval
+        self.timeout_in_seconds = timeout_in_seconds
+        self.batch_size = batch_size
+
+        self.connections = local()
+        self.puts_since_eviction = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self.create_schema()
+
+    @property
+    def stats(self):
+        entries, size_in_bytes = self.connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+        ).fetchone()
+
+        return {
+            'entries': entries,
+            'size_in_bytes': size_in_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    @property
+    def connection(self):
+        # sqlite connections can't be shared between threads or forked processes
+        pid = os.getpid()
+
+        if getattr(self.connections, 'pid', None) != pid:
+            logging.debug('Opening disk cache at %s.' % self.path)
+            connection = sqlite3.connect(self.path, timeout=self.timeout_in_seconds, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+
+            self.connections.connection = connection
+            self.connections.pid = pid
+
+        return self.connections.connection
+
+    def create_schema(self):
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, expires REAL NOT NULL, accessed REAL NOT NULL, '
+            'size INTEGER NOT NULL, data BLOB NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def put(self, url, response, method='GET', headers=None):
+        try:
+            data = dumps_response(response, compress=self.compress)
+        except (AttributeError, TypeError, ValueError):
+            logging.exception('Could not serialize response for %s. It will not be cached.' % url)
+            return
+
+        now = time.time()
+
+        self.connection.execute(
+            'INSERT OR REPLACE INTO responses (key, expires, accessed, size, data) VALUES (?, ?, ?, ?, ?)',
+            (url, now + self.expiration_in_seconds, now, len(data), sqlite3.Binary(data))
+        )
+
+        self.puts_since_eviction += 1
+        if self.puts_since_eviction >= self.eviction_interval:
+            self.evict()
+
+    def get(self, url, method='GET', headers=None):
+        now = time.time()
+
+        row = self.connection.execute('SELECT expires, data FROM responses WHERE key = ?', (url,)).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        expires, data = row
+
+        if expires <= now:
+            self.remove(url)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, url))
+        self.hits += 1
+
+        return loads_response(data)
+
+    def get_many(self, urls):
+        # a single query for each batch of urls instead of one per url
+        now = time.time()
+        responses = {}
+        urls = list(set(urls))
+
+        for start in range(0, len(urls), self.batch_size):
+            batch = urls[start:start + self.batch_size]
+            rows = self.connection.execute(
+                'SELECT key, expires, data FROM responses WHERE key IN (%s)' % ', '.join(['?'] * len(batch)),
+                batch
+            ).fetchall()
+
+            expired = []
+            for url, expires, data in rows:
+                if expires <= now:
+                    expired.append((url,))
+                else:
+                    responses[url] = loads_response(data)
+
+            if expired:
+                self.connection.executemany('DELETE FROM responses WHERE key = ?', expired)
+                self.expirations += len(expired)
+
+            accessed = [(now, url) for url in batch if url in responses]
+            if accessed:
+                self.connection.executemany('UPDATE responses SET accessed = ? WHERE key = ?', accessed)
+
+        self.hits += len(responses)
+        self.misses += len(urls) - len(responses)
+
+        return responses
+
+    def remove(self, url):
+        self.connection.execute('DELETE FROM responses WHERE key = ?', (url,))
+
+    def evict(self):
+        self.puts_since_eviction = 0
+        connection = self.connection
+
+        self.expirations += connection.execute('DELETE FROM responses WHERE expires <= ?', (time.time(),)).rowcount
+
+        if self.max_entries is not None:
+            self.evictions += connection.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            ).rowcount
+
+        if self.max_size_in_bytes is not None:
+            size_in_bytes = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+            if size_in_bytes <= self.max_size_in_bytes:
+                return
+
+            rows = connection.execute('SELECT key, size FROM responses ORDER BY accessed ASC')
+            keys = []
+            for key, size in rows:
+                if size_in_bytes <= self.max_size_in_bytes:
+                    break
+                keys.append((key,))
+                size_in_bytes -= size
+            rows.close()
+
+            connection.executemany('DELETE FROM responses WHERE key = ?', keys)
+            self.evictions += len(keys)
+
+    def clear(self):
+        self.connection.execute('DELETE FROM responses')
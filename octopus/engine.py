@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+
+from octopus.body import is_streaming
+from octopus.cache import Cache, HttpCache, can_revalidate
+from octopus.request_queue import RequestQueue
+
+
+def create_response_cache(response_cache, http_caching, expiration_in_seconds, max_entries, max_size_in_bytes):
+    if response_cache is None:
+        response_cache = (http_caching and HttpCache or Cache)(
+            expiration_in_seconds=expiration_in_seconds,
+            max_entries=max_entries,
+            max_size_in_bytes=max_size_in_bytes
+        )
+
+    if http_caching and not can_revalidate(response_cache):
+        raise ValueError('http_caching needs a response_cache that can revalidate responses, like octopus.cache.HttpCache.')
+
+    return response_cache
+
+
+def get_validators(engine, url, method, kw):
+    if not engine.cache or not engine.http_caching or is_streaming(kw):
+        return {}
+
+    return engine.response_cache.get_validators(url, method=method, headers=kw.get('headers'))
+
+
+def get_limiter_domain(limiter, url):
+    get_domain_from_url = getattr(limiter, 'get_domain_from_url', None)
+    return get_domain_from_url and get_domain_from_url(url)
+
+
+def get_retry_delay(limiter, url):
+    get_retry_delay = getattr(limiter, 'get_retry_delay', None)
+    delay = get_retry_delay and get_retry_delay(url)
+
+    if delay is None:
+        delay = getattr(limiter, 'limiter_miss_timeout_ms', 500) / 1000.0
+
+    return delay
+
+
+def get_retry_count(limiter, url):
+    # how many requests waiting for a lock are retried at once. Retrying more
+    # than the limiter can take would only have them miss the lock again.
+    get_available_locks = getattr(limiter, 'get_available_locks', None)
+    count = get_available_locks and get_available_locks(url)
+
+    return max(1, count or 0)
+
+
+def report_response(limiter, url, response):
+    report_response = getattr(limiter, 'report_response', None)
+    if report_response is not None:
+        report_response(url, response)
+
+
+class WaitingRequests(defaultdict):
+    # requests that missed a limiter lock wait here, per domain, until a
+    # request to the same domain releases its lock or they are retried.
+    def __init__(self):
+        super(WaitingRequests, self).__init__(RequestQueue)
+
+    @property
+    def size(self):
+        return sum([len(requests) for requests in self.values()])
+
+    def add(self, domain, request, priority):
+        self[domain].append(request, priority)
+
+    def take(self, domain, count=1):
+        # returns up to count (priority, request) items waiting for the
+        # domain, or all of them if count is None.
+        requests = self.get(domain)
+        items = []
+
+        while requests and (count is None or len(items) < count):
+            items.append(requests.popitem())
+
+        if requests is not None and not requests:
+            del self[domain]
+
+        return items
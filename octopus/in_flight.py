@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from threading import Lock
+
+COALESCABLE_METHODS = ('GET', 'HEAD')
+
+
+def get_request_key(url, method, kw):
+    arguments = []
+
+    for key, value in sorted(kw.items()):
+        if isinstance(value, dict):
+            value = sorted(value.items())
+        arguments.append((key, value))
+
+    return '%s %s %r' % (method.upper(), url, arguments)
+
+
+class InFlightRequests(object):
+    def __init__(self):
+        self.requests = {}
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.requests)
+
+    def attach(self, url, handler, method='GET', kw=None):
+        # returns (handler, True) if an identical request is already in flight and
+        # handler will get its response. Otherwise returns the handler the request
+        # must be enqueued with, which also calls every handler attached to it.
+        if method.upper() not in COALESCABLE_METHODS:
+            return handler, False
+
+        key = get_request_key(url, method, kw or {})
+
+        with self.lock:
+            if key in self.requests:
+                logging.debug('Request for %s is already in flight.' % url)
+                self.requests[key].append(handler)
+                return handler, True
+
+            self.requests[key] = []
+
+        def handle(url, response):
+            try:
+                handler(url, response)
+            finally:
+                self.complete(key, url, response)
+
+        return handle, False
+
+    def detach(self, url, method='GET', kw=None):
+        # forgets a request that could not be enqueued. Returns False if other
+        # handlers are already waiting for it, in which case it must be made.
+        if method.upper() not in COALESCABLE_METHODS:
+            return True
+
+        key = get_request_key(url, method, kw or {})
+
+        with self.lock:
+            if self.requests.get(key):
+                return False
+
+            self.requests.pop(key, None)
+            return True
+
+    def complete(self, key, url, response):
+        with self.lock:
+            handlers = self.requests.pop(key, [])
+
+        for handler in handlers:
+            try:
+                handler(url, response)
+            except Exception:
+                logging.exception('Error calling callback for %s.' % url)
@@ -5,6 +5,16 @@ from cyrusbus import Bus
 
 
 class Limiter(object):
+    # whether every release happens in this process. If not, engines can't
+    # rely on releases alone to wake requests waiting for a lock.
+    releases_locally = False
+
+    # whether locks are kept in another process, like redis. Engines call
+    # remote limiters without holding their own locks, so the round trips of
+    # many requests can happen at the same time. Remote limiters must be
+    # thread-safe and can't release locally.
+    remote = False
+
     def __init__(self, limiter_miss_timeout_ms=None):
         self.bus = Bus()
         self.limiter_miss_timeout_ms = limiter_miss_timeout_ms
@@ -16,6 +26,24 @@ class Limiter(object):
             callback(*args, **kw)
         return handle
 
+    def get_domain_from_url(self, url):
+        return None
+
+    def get_retry_delay(self, url):
+        # seconds until acquiring a lock for the url might succeed, or None if
+        # the limiter can't tell.
+        return None
+
+    def get_available_locks(self, url):
+        # how many locks for the url could be acquired right now, or None if
+        # the limiter can't tell. Engines retry that many waiting requests.
+        return None
+
+    def report_response(self, url, response):
+        # called by the engines with every response retrieved, so limiters can
+        # adapt to how each domain is responding.
+        pass
+
     def subscribe_to_lock_miss(self, callback):
         self.bus.subscribe('limiter.miss', self.handle_callbacks(callback))
 
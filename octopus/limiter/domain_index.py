@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+class DomainIndex(object):
+    def __init__(self, domains):
+        # url prefixes are grouped by length, so a url is matched by slicing it
+        # once for each distinct prefix length instead of comparing it to every
+        # single prefix. Each prefix keeps the position it was defined in, since
+        # prefixes defined first take precedence.
+        self.prefixes = {}
+
+        position = 0
+        for domain in domains:
+            for key, limit in domain.items():
+                prefixes = self.prefixes.setdefault(len(key), {})
+                if key not in prefixes:
+                    prefixes[key] = (position, key, limit)
+                position += 1
+
+        self.lengths = sorted(self.prefixes.keys())
+
+    def __len__(self):
+        return sum([len(prefixes) for prefixes in self.prefixes.values()])
+
+    def get(self, url):
+        match = None
+        url_length = len(url)
+
+        for length in self.lengths:
+            if length > url_length:
+                break
+
+            item = self.prefixes[length].get(url[:length])
+            if item is not None and (match is None or item[0] < match[0]):
+                match = item
+
+        if match is None:
+            return None, 0
+
+        return match[1], match[2]
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from octopus.cache import monotonic
+from octopus.limiter.in_memory.per_domain import Limiter as InMemoryPerDomainLimiter
+
+
+def get_limits(limit):
+    # a limit is either the maximum concurrency for the domain or a dictionary
+    # like {'min': 1, 'max': 20, 'initial': 5}
+    if isinstance(limit, dict):
+        maximum = int(limit['max'])
+        minimum = int(limit.get('min', 1))
+        initial = limit.get('initial', minimum)
+    else:
+        maximum = int(limit)
+        minimum = 1
+        initial = minimum
+
+    minimum = max(1, min(minimum, maximum))
+
+    return minimum, maximum, float(min(max(initial, minimum), maximum))
+
+
+class Limiter(InMemoryPerDomainLimiter):
+    # limits can grow while requests are waiting, so waiting requests are also
+    # retried instead of only being woken by releases.
+    releases_locally = False
+
+    def __init__(self, *domains, **kw):
+        self.increase_by = float(kw.get('increase_by', 1))
+        self.decrease_factor = float(kw.get('decrease_factor', 0.5))
+        self.latency_threshold_ms = kw.get('latency_threshold_ms', None)
+        self.error_status_codes = set(kw.get('error_status_codes', (429, 503, 504, 599)))
+
+        super(Limiter, self).__init__(*domains, **kw)
+
+    def update_domain_definitions(self, *domains):
+        super(Limiter, self).update_domain_definitions(*domains)
+        self.limits = {}
+        self.decreased_at = {}
+
+    def get_current_limit(self, domain, limit):
+        current = self.limits.get(domain)
+
+        if current is None:
+            current = self.limits[domain] = get_limits(limit)[2]
+
+        return current
+
+    def get_domain_limit(self, url):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            return 0
+
+        return int(self.get_current_limit(domain, limit))
+
+    def acquire(self, url):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            logging.info('Tried to acquire lock to a domain that was not specified in the limiter (%s).' % url)
+            return True
+
+        if self.domain_count[domain] < int(self.get_current_limit(domain, limit)):
+            self.domain_count[domain] += 1
+            return True
+
+        return False
+
+    def is_congested(self, response):
+        if response.status_code in self.error_status_codes:
+            return True
+
+        if self.latency_threshold_ms is None:
+            return False
+
+        return (response.request_time or 0) * 1000 > self.latency_threshold_ms
+
+    def report_response(self, url, response):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            return
+
+        minimum, maximum, initial = get_limits(limit)
+        current = self.get_current_limit(domain, limit)
+        now = monotonic()
+
+        if not self.is_congested(response):
+            # grows by increase_by after a whole window of successful responses
+            self.limits[domain] = min(maximum, current + self.increase_by / current)
+            return
+
+        # responses to requests started before the last decrease were already
+        # accounted for, or a single burst of errors would drop to the minimum.
+        decreased_at = self.decreased_at.get(domain)
+        if decreased_at is not None and now - (response.request_time or 0) < decreased_at:
+            return
+
+        self.limits[domain] = max(minimum, current * self.decrease_factor)
+        self.decreased_at[domain] = now
+
+        logging.info('Decreased concurrency limit for %s to %d after response(%s) from %s.' % (
+            domain, int(self.limits[domain]), response.status_code, url
+        ))
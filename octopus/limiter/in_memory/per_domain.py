@@ -5,9 +5,12 @@ import logging
 from collections import defaultdict
 
 from octopus.limiter import Limiter as BaseLimiter
+from octopus.limiter.domain_index import DomainIndex
 
 
 class Limiter(BaseLimiter):
+    releases_locally = True
+
     def __init__(self, *domains, **kw):
         limiter_miss_timeout_ms = None
         if 'limiter_miss_timeout_ms' in kw:
@@ -18,36 +21,37 @@ class Limiter(BaseLimiter):
 
     def update_domain_definitions(self, *domains):
         self.domains = domains
+        self.domain_index = DomainIndex(domains)
         self.domain_count = defaultdict(int)
 
+    def get_domain_and_limit(self, url):
+        return self.domain_index.get(url)
+
     def get_domain_from_url(self, url):
-        for domain in self.domains:
-            for key in domain.keys():
-                if url.startswith(key):
-                    return key
-        return None
+        return self.domain_index.get(url)[0]
 
     def get_domain_limit(self, url):
-        for domain in self.domains:
-            for key in domain.keys():
-                if url.startswith(key):
-                    return domain[key]
-        return 0
+        return self.domain_index.get(url)[1]
 
     def acquire(self, url):
-        domain = self.get_domain_from_url(url)
+        domain, limit = self.get_domain_and_limit(url)
         if domain is None:
             logging.info('Tried to acquire lock to a domain that was not specified in the limiter (%s).' % url)
             return True
 
-        limit = self.get_domain_limit(url)
-
         if self.domain_count[domain] < limit:
             self.domain_count[domain] += 1
             return True
 
         return False
 
+    def get_available_locks(self, url):
+        domain = self.get_domain_from_url(url)
+        if domain is None:
+            return None
+
+        return max(0, self.get_domain_limit(url) - self.domain_count.get(domain, 0))
+
     def release(self, url):
         domain = self.get_domain_from_url(url)
         if domain is None:
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from octopus.cache import monotonic
+from octopus.limiter.domain_index import DomainIndex
+from octopus.limiter.in_memory.per_domain import Limiter as InMemoryPerDomainLimiter
+
+
+def get_rate_and_burst(limit):
+    # a limit is either the number of requests per second or a dictionary
+    # like {'requests': 100, 'per_seconds': 60, 'burst': 10}
+    if isinstance(limit, dict):
+        requests = float(limit['requests'])
+        rate = requests / float(limit.get('per_seconds', 1))
+        burst = float(limit.get('burst', requests))
+    else:
+        rate = float(limit)
+        burst = rate
+
+    return rate, max(1.0, burst)
+
+
+class Limiter(InMemoryPerDomainLimiter):
+    # tokens are given back with time, not when requests are released
+    releases_locally = False
+
+    def update_domain_definitions(self, *domains):
+        self.domains = domains
+        self.domain_index = DomainIndex(domains)
+        self.buckets = {}
+
+    def get_tokens(self, domain, limit):
+        rate, burst = get_rate_and_burst(limit)
+        now = monotonic()
+
+        tokens, timestamp = self.buckets.get(domain, (burst, now))
+        tokens = min(burst, tokens + (now - timestamp) * rate)
+        self.buckets[domain] = (tokens, now)
+
+        return tokens
+
+    def acquire(self, url):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            logging.info('Tried to acquire lock to a domain that was not specified in the limiter (%s).' % url)
+            return True
+
+        tokens = self.get_tokens(domain, limit)
+
+        if tokens >= 1:
+            self.buckets[domain] = (tokens - 1, self.buckets[domain][1])
+            return True
+
+        return False
+
+    def release(self, url):
+        pass
+
+    def get_retry_delay(self, url):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            return 0
+
+        rate, burst = get_rate_and_burst(limit)
+        tokens = self.get_tokens(domain, limit)
+
+        return max(0, (1 - tokens) / rate)
+
+    def get_available_locks(self, url):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            return None
+
+        return int(self.get_tokens(domain, limit))
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import deque
+
+import six
+
+try:
+    from tornado import gen
+    from tornado.concurrent import Future
+    from tornado.tcpclient import TCPClient
+except ImportError:
+    print("Can't import tornado. Probably setup.py installing package.")
+
+
+class RedisError(RuntimeError):
+    pass
+
+
+def encode(value):
+    if isinstance(value, six.binary_type):
+        return value
+
+    if not isinstance(value, six.text_type):
+        value = str(value)
+
+    return value.encode('utf-8')
+
+
+def pack_command(*args):
+    command = [b'*' + encode(len(args)) + b'\r\n']
+
+    for arg in args:
+        arg = encode(arg)
+        command.append(b'$' + encode(len(arg)) + b'\r\n' + arg + b'\r\n')
+
+    return b''.join(command)
+
+
+class AsyncRedisClient(object):
+    # a minimal redis client for the tornado IOLoop. Commands are pipelined in
+    # a single connection and replies are matched to commands in order.
+    def __init__(self, host='localhost', port=6379, db=0, io_loop=None, password=None, username=None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.io_loop = io_loop
+        self.password = password
+        self.username = username
+
+        self.stream = None
+        self.connecting = False
+        self.buffer = []
+        self.pending = deque()
+        self.reading = False
+
+    @classmethod
+    def can_connect(cls, kwargs):
+        # unix sockets, ssl and credential providers are not supported
+        if 'path' in kwargs or kwargs.get('credential_provider') is not None:
+            return False
+
+        return not [key for key in kwargs if key.startswith('ssl')]
+
+    @classmethod
+    def from_connection(cls, redis, io_loop=None):
+        # returns None if the connection can't be made by this client
+        kwargs = redis.connection_pool.connection_kwargs
+
+        if not cls.can_connect(kwargs):
+            return None
+
+        return cls(
+            host=kwargs.get('host', 'localhost'),
+            port=kwargs.get('port', 6379),
+            db=kwargs.get('db', 0),
+            io_loop=io_loop,
+            password=kwargs.get('password'),
+            username=kwargs.get('username')
+        )
+
+    def execute(self, *args):
+        future = Future()
+        self.pending.append(future)
+        self.write(pack_command(*args))
+
+        return future
+
+    def write(self, data):
+        if self.stream is not None:
+            self.stream.write(data)
+            self.read_replies()
+            return
+
+        self.buffer.append(data)
+
+        if not self.connecting:
+            self.connect()
+
+    def connect(self):
+        logging.debug('Connecting to redis at %s:%s.' % (self.host, self.port))
+        self.connecting = True
+
+        future = TCPClient(io_loop=self.io_loop).connect(self.host, self.port)
+        self.io_loop.add_future(future, self.handle_connect)
+
+    def get_setup_commands(self):
+        commands = []
+
+        if self.password is not None:
+            if self.username is not None:
+                commands.append(pack_command('AUTH', self.username, self.password))
+            else:
+                commands.append(pack_command('AUTH', self.password))
+
+        if self.db:
+            commands.append(pack_command('SELECT', self.db))
+
+        return commands
+
+    @gen.coroutine
+    def handle_connect(self, future):
+        stream = None
+
+        try:
+            stream = future.result()
+
+            # the replies to AUTH and SELECT are checked before the queued
+            # commands are sent, so they don't run unauthenticated or in the
+            # wrong database.
+            commands = self.get_setup_commands()
+            if commands:
+                stream.write(b''.join(commands))
+                for command in commands:
+                    reply = yield self.read_reply(stream)
+                    if isinstance(reply, RedisError):
+                        raise reply
+        except Exception as err:
+            logging.error('Could not connect to redis at %s:%s: %s' % (self.host, self.port, err))
+            self.connecting = False
+            self.buffer = []
+            self.fail_pending(err)
+
+            if stream is not None:
+                stream.close()
+            return
+
+        self.connecting = False
+        self.stream = stream
+        self.stream.set_close_callback(self.handle_close)
+
+        data = b''.join(self.buffer)
+        self.buffer = []
+        self.stream.write(data)
+        self.read_replies()
+
+    def handle_close(self):
+        logging.debug('Connection to redis at %s:%s closed.' % (self.host, self.port))
+        error = self.stream and self.stream.error or RedisError('Connection to redis closed.')
+        self.stream = None
+        self.fail_pending(error)
+
+    def fail_pending(self, error):
+        pending, self.pending = self.pending, deque()
+
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+
+    @gen.coroutine
+    def read_replies(self):
+        if self.reading:
+            return
+
+        self.reading = True
+
+        try:
+            while self.pending and self.stream is not None:
+                reply = yield self.read_reply(self.stream)
+                future = self.pending.popleft()
+
+                if isinstance(reply, RedisError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except Exception:
+            # the close callback fails the pending commands
+            logging.debug('Stopped reading replies from redis.')
+        finally:
+            self.reading = False
+
+    @gen.coroutine
+    def read_reply(self, stream):
+        line = yield stream.read_until(b'\r\n')
+        kind, data = line[:1], line[1:-2]
+
+        if kind == b'+':
+            raise gen.Return(data)
+
+        if kind == b'-':
+            raise gen.Return(RedisError(data.decode('utf-8')))
+
+        if kind == b':':
+            raise gen.Return(int(data))
+
+        if kind == b'$':
+            size = int(data)
+            if size < 0:
+                raise gen.Return(None)
+
+            data = yield stream.read_bytes(size + 2)
+            raise gen.Return(data[:-2])
+
+        if kind == b'*':
+            size = int(data)
+            if size < 0:
+                raise gen.Return(None)
+
+            items = []
+            for index in range(size):
+                item = yield self.read_reply(stream)
+                items.append(item)
+
+            raise gen.Return(items)
+
+        raise RedisError('Unknown reply from redis: %r.' % line)
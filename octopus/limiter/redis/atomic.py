@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import uuid
+from collections import defaultdict
+from threading import Lock
+
+try:
+    from tornado import gen
+except ImportError:
+    print("Can't import tornado. Probably setup.py installing package.")
+
+from octopus.limiter.domain_index import DomainIndex
+from octopus.limiter.redis.async_client import AsyncRedisClient, RedisError
+from octopus.limiter.in_memory.per_domain import Limiter as InMemoryPerDomainLimiter
+
+# drops expired leases, then adds a new one if the domain is below its limit.
+# The redis clock is used, so leases expire at the same time for every node.
+ACQUIRE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local expiration_ms = tonumber(ARGV[2])
+local lease = ARGV[3]
+
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+
+if redis.call('ZCARD', KEYS[1]) >= limit then
+    return 0
+end
+
+redis.call('ZADD', KEYS[1], now + expiration_ms, lease)
+redis.call('PEXPIRE', KEYS[1], expiration_ms)
+
+return 1
+"""
+ACQUIRE_SCRIPT_SHA = hashlib.sha1(ACQUIRE_SCRIPT.encode('utf-8')).hexdigest()
+
+
+class Limiter(InMemoryPerDomainLimiter):
+    # locks are released by every process sharing the redis instance
+    releases_locally = False
+    remote = True
+
+    def __init__(self, *domains, **kw):
+        limiter_miss_timeout_ms = None
+        if 'limiter_miss_timeout_ms' in kw:
+            limiter_miss_timeout_ms = kw['limiter_miss_timeout_ms']
+
+        # Skips InMemoryPerDomainLimiter constructor
+        super(InMemoryPerDomainLimiter, self).__init__(limiter_miss_timeout_ms=limiter_miss_timeout_ms)
+
+        if not 'redis' in kw:
+            raise RuntimeError('You must specify a connection to redis in order to use Redis Limiter.')
+
+        self.redis = kw['redis']
+        self.expiration_in_seconds = float(kw.get('expiration_in_seconds', 10))
+        self.prefix = kw.get('prefix', 'leases-for')
+        self.acquire_script = self.redis.register_script(ACQUIRE_SCRIPT)
+
+        # leases taken by this limiter for each url, so the same url can be
+        # acquired many times and each release only frees one of them.
+        self.leases = defaultdict(list)
+        self.leases_lock = Lock()
+
+        self.async_client = None
+
+        self.update_domain_definitions(*domains)
+
+    def update_domain_definitions(self, *domains):
+        self.domains = domains
+        self.domain_index = DomainIndex(domains)
+
+    def get_key(self, domain):
+        return '%s-%s' % (self.prefix, domain)
+
+    def acquire(self, url):
+        return self.acquire_many([url])[0]
+
+    def acquire_many(self, urls):
+        # acquires the locks for all the urls with a single round trip to redis
+        acquired = [True] * len(urls)
+        requests = []
+
+        for index, url in enumerate(urls):
+            domain, limit = self.get_domain_and_limit(url)
+            if domain is None:
+                logging.info('Tried to acquire lock to a domain that was not specified in the limiter (%s).' % url)
+                continue
+
+            requests.append((index, url, domain, limit, uuid.uuid4().hex))
+
+        if not requests:
+            return acquired
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for index, url, domain, limit, lease in requests:
+            self.acquire_script(
+                keys=[self.get_key(domain)],
+                args=[limit, int(self.expiration_in_seconds * 1000), lease],
+                client=pipeline
+            )
+        results = pipeline.execute()
+
+        with self.leases_lock:
+            for (index, url, domain, limit, lease), could_lock in zip(requests, results):
+                if could_lock:
+                    self.leases[url].append((domain, lease))
+                else:
+                    logging.info('Tried to acquire lock for %s but could not.' % url)
+                    acquired[index] = False
+
+        return acquired
+
+    def get_available_locks(self, url):
+        # expired leases are only dropped on acquire, so this can be lower
+        # than the locks that would actually be acquired.
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            return None
+
+        return max(0, limit - self.redis.zcard(self.get_key(domain)))
+
+    def pop_lease(self, url):
+        if self.get_domain_from_url(url) is None:
+            logging.info('Tried to release lock to a domain that was not specified in the limiter (%s).' % url)
+            return None
+
+        with self.leases_lock:
+            leases = self.leases.get(url)
+            if not leases:
+                logging.info('Tried to release lock to a url that was not acquired in the limiter (%s).' % url)
+                return None
+
+            lease = leases.pop()
+            if not leases:
+                del self.leases[url]
+
+        return lease
+
+    def release(self, url):
+        lease = self.pop_lease(url)
+
+        if lease is not None:
+            domain, lease = lease
+            self.redis.zrem(self.get_key(domain), lease)
+
+    def get_async_client(self, io_loop):
+        # returns None if the async client can't connect like the redis
+        # connection does, so the sync connection is used instead.
+        if self.async_client is None or self.async_client.io_loop is not io_loop:
+            self.async_client = AsyncRedisClient.from_connection(self.redis, io_loop=io_loop)
+            if self.async_client is None:
+                return None
+
+            # loaded before any other command is sent in the same connection
+            future = self.async_client.execute('SCRIPT', 'LOAD', ACQUIRE_SCRIPT)
+            io_loop.add_future(future, self.handle_script_load)
+
+        return self.async_client
+
+    def handle_script_load(self, future):
+        # acquire_async sends the script itself if it was not loaded, and
+        # gets the same error if the connection failed.
+        try:
+            future.result()
+        except Exception as err:
+            logging.warning('Could not load acquire script in redis: %s' % err)
+
+    @gen.coroutine
+    def acquire_async(self, url, io_loop):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            logging.info('Tried to acquire lock to a domain that was not specified in the limiter (%s).' % url)
+            raise gen.Return(True)
+
+        client = self.get_async_client(io_loop)
+        if client is None:
+            raise gen.Return(self.acquire(url))
+
+        lease = uuid.uuid4().hex
+        args = [1, self.get_key(domain), limit, int(self.expiration_in_seconds * 1000), lease]
+
+        try:
+            could_lock = yield client.execute('EVALSHA', ACQUIRE_SCRIPT_SHA, *args)
+        except RedisError as err:
+            # scripts are lost when redis is restarted or scripts are flushed
+            if not str(err).startswith('NOSCRIPT'):
+                raise
+            could_lock = yield client.execute('EVAL', ACQUIRE_SCRIPT, *args)
+
+        if not could_lock:
+            logging.info('Tried to acquire lock for %s but could not.' % url)
+            raise gen.Return(False)
+
+        with self.leases_lock:
+            self.leases[url].append((domain, lease))
+
+        raise gen.Return(True)
+
+    @gen.coroutine
+    def release_async(self, url, io_loop):
+        client = self.get_async_client(io_loop)
+        if client is None:
+            self.release(url)
+            return
+
+        lease = self.pop_lease(url)
+
+        if lease is not None:
+            domain, lease = lease
+            yield client.execute('ZREM', self.get_key(domain), lease)
@@ -5,10 +5,15 @@ import logging
 
 from retools.limiter import Limiter as ReToolsLimiter
 
+from octopus.limiter.domain_index import DomainIndex
 from octopus.limiter.in_memory.per_domain import Limiter as InMemoryPerDomainLimiter
 
 
 class Limiter(InMemoryPerDomainLimiter):
+    # locks are released by every process sharing the redis instance
+    releases_locally = False
+    remote = True
+
     def __init__(self, *domains, **kw):
         limiter_miss_timeout_ms = None
         if 'limiter_miss_timeout_ms' in kw:
@@ -27,10 +32,15 @@ class Limiter(InMemoryPerDomainLimiter):
 
     def update_domain_definitions(self, *domains):
         self.domains = domains
+        self.domain_index = DomainIndex(domains)
         self.limiters = {}
 
         for domain in self.domains:
             for key, limit in domain.items():
+                # urls defined first take precedence
+                if key in self.limiters:
+                    continue
+
                 self.limiters[key] = ReToolsLimiter(
                     limit=limit,
                     prefix='limit-for-%s' % key,
@@ -51,6 +61,14 @@ class Limiter(InMemoryPerDomainLimiter):
 
         return could_lock
 
+    def get_available_locks(self, url):
+        domain = self.get_domain_from_url(url)
+        if domain is None:
+            return None
+
+        limiter = self.limiters[domain]
+        return max(0, limiter.limit - self.redis.zcard(limiter.prefix))
+
     def release(self, url):
         domain = self.get_domain_from_url(url)
 
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from octopus.limiter.domain_index import DomainIndex
+from octopus.limiter.in_memory.rate import Limiter as InMemoryRateLimiter, get_rate_and_burst
+
+# refills the bucket based on the redis clock, so every node sees the same
+# time, then takes the requested tokens if there are enough of them.
+# Returns whether the tokens were taken, the seconds until the next token and
+# the tokens left.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1])
+local timestamp = tonumber(bucket[2])
+
+if tokens == nil or timestamp == nil then
+    tokens = burst
+    timestamp = now
+end
+
+tokens = math.min(burst, tokens + math.max(0, now - timestamp) * rate)
+
+local taken = 0
+if requested > 0 and tokens >= requested then
+    tokens = tokens - requested
+    taken = 1
+end
+
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'timestamp', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+
+local delay = 0
+if tokens < 1 then
+    delay = (1 - tokens) / rate
+end
+
+return {taken, tostring(delay), tostring(tokens)}
+"""
+
+
+class Limiter(InMemoryRateLimiter):
+    remote = True
+
+    def __init__(self, *domains, **kw):
+        limiter_miss_timeout_ms = None
+        if 'limiter_miss_timeout_ms' in kw:
+            limiter_miss_timeout_ms = kw['limiter_miss_timeout_ms']
+
+        # Skips InMemoryPerDomainLimiter constructor
+        super(InMemoryRateLimiter, self).__init__(limiter_miss_timeout_ms=limiter_miss_timeout_ms)
+
+        if not 'redis' in kw:
+            raise RuntimeError('You must specify a connection to redis in order to use Redis Limiter.')
+
+        self.redis = kw['redis']
+        self.prefix = kw.get('prefix', 'rate-for')
+        self.token_bucket = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+        self.update_domain_definitions(*domains)
+
+    def update_domain_definitions(self, *domains):
+        self.domains = domains
+        self.domain_index = DomainIndex(domains)
+
+    def take_tokens(self, domain, limit, requested):
+        rate, burst = get_rate_and_burst(limit)
+        taken, delay, tokens = self.token_bucket(keys=['%s-%s' % (self.prefix, domain)], args=[rate, burst, requested])
+
+        return bool(taken), float(delay), float(tokens)
+
+    def acquire(self, url):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            logging.info('Tried to acquire lock to a domain that was not specified in the limiter (%s).' % url)
+            return True
+
+        could_lock = self.take_tokens(domain, limit, 1)[0]
+
+        if not could_lock:
+            logging.info('Tried to acquire lock for %s but could not.' % url)
+
+        return could_lock
+
+    def get_retry_delay(self, url):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            return 0
+
+        return self.take_tokens(domain, limit, 0)[1]
+
+    def get_available_locks(self, url):
+        domain, limit = self.get_domain_and_limit(url)
+        if domain is None:
+            return None
+
+        return int(self.take_tokens(domain, limit, 0)[2])
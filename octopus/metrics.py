@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock, Thread
+
+try:
+    from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from six.moves.socketserver import ThreadingMixIn
+    from six.moves.urllib.parse import urlparse
+except ImportError:
+    print("Can't import six. Probably setup.py installing package.")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# domains seen after max_domains are counted together under this label
+OTHER_DOMAINS = 'other'
+
+COUNTERS = (
+    ('requests', 'octopus_requests_total', 'Requests made.'),
+    ('timeouts', 'octopus_timeouts_total', 'Requests that timed out.'),
+    ('errors', 'octopus_errors_total', 'Requests that failed without a response.'),
+    ('cache_hits', 'octopus_cache_hits_total', 'Responses found in the cache.'),
+    ('cache_misses', 'octopus_cache_misses_total', 'Responses not found in the cache.'),
+)
+
+GAUGES = (
+    ('queue_size', 'octopus_queue_size', 'URLs waiting to be retrieved.'),
+    ('in_flight', 'octopus_in_flight', 'Requests being retrieved.'),
+)
+
+
+def get_status_class(status_code):
+    return '%dxx' % (int(status_code or 0) // 100)
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if isinstance(value, float) and value == int(value):
+        value = int(value)
+    return str(value)
+
+
+class Metrics(object):
+    # counts what the engines do. Every record method only updates a few
+    # numbers, values that the engines already know (like the queue size) are
+    # only read when a snapshot is taken.
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, max_domains=1000):
+        self.latency_buckets = tuple(sorted(latency_buckets))
+        self.max_domains = max_domains
+        self.lock = Lock()
+
+        self.requests = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.responses = defaultdict(int)
+        self.limiter_misses = defaultdict(int)
+
+        # domain -> [count per bucket (the last one is +Inf), sum, count]
+        self.latencies = {}
+
+        # name -> function returning the current value
+        self.gauges = {}
+
+        # engines recording in this registry
+        self.engines = weakref.WeakSet()
+
+    def set_gauge(self, name, function):
+        self.gauges[name] = function
+
+    def watch(self, engine):
+        self.engines.add(engine)
+        self.set_gauge('queue_size', self.get_queue_size)
+
+    def get_queue_size(self):
+        return sum([engine.queue_size for engine in list(self.engines)])
+
+    def get_domain(self, domain, known):
+        if domain in known or len(known) < self.max_domains:
+            return domain
+        return OTHER_DOMAINS
+
+    def start_request(self, cache_miss=False):
+        # cache misses are only counted for requests actually made, since
+        # engines look urls up in the cache again before making them.
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            if cache_miss:
+                self.cache_misses += 1
+
+    def end_request(self, url, response):
+        latency = response.request_time or 0
+        domain = urlparse(url).netloc
+        bucket = bisect_left(self.latency_buckets, latency)
+
+        with self.lock:
+            self.in_flight -= 1
+            self.responses[get_status_class(response.status_code)] += 1
+
+            domain = self.get_domain(domain, self.latencies)
+            histogram = self.latencies.get(domain)
+            if histogram is None:
+                histogram = self.latencies[domain] = [[0] * (len(self.latency_buckets) + 1), 0, 0]
+
+            histogram[0][bucket] += 1
+            histogram[1] += latency
+            histogram[2] += 1
+
+    def record_cache_hit(self):
+        with self.lock:
+            self.cache_hits += 1
+
+    def record_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def record_limiter_miss(self, url, domain=None):
+        domain = domain or urlparse(url).netloc
+
+        with self.lock:
+            self.limiter_misses[self.get_domain(domain, self.limiter_misses)] += 1
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = {
+                'requests': self.requests,
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'in_flight': self.in_flight,
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+                'responses': dict(self.responses),
+                'limiter_misses': dict(self.limiter_misses),
+                'latency': {},
+            }
+
+            for domain, (counts, total, count) in self.latencies.items():
+                buckets = []
+                cumulative = 0
+                for bound, bucket_count in zip(self.latency_buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    buckets.append((bound, cumulative))
+
+                snapshot['latency'][domain] = {'buckets': buckets, 'sum': total, 'count': count}
+
+        for name, function in self.gauges.items():
+            try:
+                snapshot[name] = function()
+            except Exception:
+                logging.exception('Error reading metric %s.' % name)
+
+        return snapshot
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+
+        def add_metric(name, metric_type, description, samples):
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            for suffix, labels, value in samples:
+                label_text = ','.join(['%s="%s"' % (key, escape_label(str(label))) for key, label in labels])
+                lines.append('%s%s%s %s' % (name, suffix, label_text and '{%s}' % label_text or '', format_value(value)))
+
+        for key, name, description in COUNTERS:
+            if key in snapshot:
+                add_metric(name, 'counter', description, [('', (), snapshot[key])])
+
+        for key, name, description in GAUGES:
+            if key in snapshot:
+                add_metric(name, 'gauge', description, [('', (), snapshot[key])])
+
+        add_metric(
+            'octopus_responses_total', 'counter', 'Responses by status class.',
+            [('', (('status_class', status_class),), value) for status_class, value in sorted(snapshot['responses'].items())]
+        )
+
+        add_metric(
+            'octopus_limiter_misses_total', 'counter', 'Requests that could not acquire a limiter lock, by domain.',
+            [('', (('domain', domain),), value) for domain, value in sorted(snapshot['limiter_misses'].items())]
+        )
+
+        samples = []
+        for domain, histogram in sorted(snapshot['latency'].items()):
+            for bound, count in histogram['buckets']:
+                bound = bound == float('inf') and '+Inf' or format_value(float(bound))
+                samples.append(('_bucket', (('domain', domain), ('le', bound)), count))
+            samples.append(('_sum', (('domain', domain),), histogram['sum']))
+            samples.append(('_count', (('domain', domain),), histogram['count']))
+
+        add_metric('octopus_request_duration_seconds', 'histogram', 'Request duration by domain.', samples)
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        # serves the metrics in prometheus text format in a background thread.
+        # Returns the server, call shutdown() on it to stop serving.
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug('Metrics request: %s' % (format % args))
+
+        server = MetricsServer((host, port), MetricsHandler)
+
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        logging.info('Serving metrics at http://%s:%d/metrics.' % (host, server.server_address[1]))
+
+        return server
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
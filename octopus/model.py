@@ -2,17 +2,81 @@
 # -*- coding: utf-8 -*-
 
 
+def to_dict(value):
+    # headers and cookies can be given as any mapping, or as a function that
+    # returns one, and are only turned into a dict when first accessed.
+    if value is None:
+        return {}
+
+    if isinstance(value, dict):
+        return value
+
+    if callable(value):
+        return to_dict(value())
+
+    return dict([(key, item) for key, item in value.items()])
+
+
 class Response(object):
+    __slots__ = (
+        'url', 'status_code', 'effective_url', 'error', 'request_time',
+        'content', 'encoding', 'truncated', 'headers_only',
+        '_headers', '_cookies', '_text'
+    )
+
     def __init__(
         self, url, status_code,
         headers, cookies, text, effective_url,
-        error, request_time
+        error, request_time, content=None, encoding=None,
+        truncated=False, headers_only=False
     ):
         self.url = url
         self.status_code = status_code
-        self.cookies = cookies
-        self.headers = headers
-        self.text = text
+        self._cookies = cookies
+        self._headers = headers
+        self._text = text
         self.effective_url = effective_url
         self.error = error
         self.request_time = request_time
+
+        # the raw body. If text is not given, it is decoded from the body
+        # the first time it is accessed.
+        self.content = content
+        self.encoding = encoding
+
+        # whether the body was cut short or not read at all
+        self.truncated = truncated
+        self.headers_only = headers_only
+
+    @property
+    def headers(self):
+        if not isinstance(self._headers, dict):
+            self._headers = to_dict(self._headers)
+        return self._headers
+
+    @headers.setter
+    def headers(self, value):
+        self._headers = value
+
+    @property
+    def cookies(self):
+        if not isinstance(self._cookies, dict):
+            self._cookies = to_dict(self._cookies)
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, value):
+        self._cookies = value
+
+    @property
+    def text(self):
+        if self._text is None and self.content is not None:
+            try:
+                self._text = self.content.decode(self.encoding or 'utf-8', 'replace')
+            except LookupError:
+                self._text = self.content.decode('utf-8', 'replace')
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+import multiprocessing
+import time
+import zlib
+from functools import partial
+from threading import Thread
+
+try:
+    from six.moves import queue
+    from six.moves.urllib.parse import urlparse
+except ImportError:
+    print("Can't import six. Probably setup.py installing package.")
+
+from octopus.body import is_streaming
+from octopus.core import TimeoutError
+from octopus.serialization import dumps_response, loads_response
+from octopus.tornado_core import TornadoOctopus
+
+
+class WorkerOctopus(TornadoOctopus):
+    # runs in each worker process. The IOLoop keeps running while the parent
+    # process can still send urls, even if there is nothing left to fetch.
+    closing = False
+
+    def close(self):
+        self.closing = True
+
+        if self.running_urls < 1 and self.remaining_requests == 0:
+            self.stop()
+
+    def stop(self, force=False):
+        if self.closing or force:
+            super(WorkerOctopus, self).stop(force=force)
+
+
+def run_worker(requests, results, concurrency, limiter, compress, options):
+    otto = WorkerOctopus(concurrency=concurrency, auto_start=True, limiter=limiter, **options)
+
+    def get_handler(request_id):
+        def handle(url, response):
+            results.put((request_id, dumps_response(response, compress=compress)))
+        return handle
+
+    def read_requests():
+        for request_id, url, method, priority, kw in iter(requests.get, None):
+            otto.ioloop.add_callback(partial(otto.enqueue, url, get_handler(request_id), method, priority, **kw))
+
+        otto.ioloop.add_callback(otto.close)
+
+    reader = Thread(target=read_requests)
+    reader.daemon = True
+    reader.start()
+
+    otto.ioloop.make_current()
+    otto.ioloop.start()
+
+
+class ProcessOctopus(object):
+    def __init__(
+            self, concurrency=10, processes=None, auto_start=False,
+            limiter=None, compress_responses=False, **kw):
+
+        self.concurrency = concurrency
+        self.processes = processes or multiprocessing.cpu_count()
+        self.auto_start = auto_start
+        self.limiter = limiter
+        self.compress_responses = compress_responses
+
+        # any other option is given to the TornadoOctopus in each process
+        self.options = kw
+
+        self.requests = [multiprocessing.Queue() for index in range(self.processes)]
+        self.results = multiprocessing.Queue()
+        self.workers = []
+
+        # handlers stay in this process, responses are sent back with the id
+        # of the request they belong to.
+        self.handlers = {}
+        self.request_ids = itertools.count()
+
+        if auto_start:
+            self.start()
+
+    def start(self):
+        if self.workers:
+            return
+
+        logging.debug('Starting %d worker processes.' % self.processes)
+
+        for requests in self.requests:
+            worker = multiprocessing.Process(
+                target=run_worker,
+                args=(requests, self.results, self.concurrency, self.limiter, self.compress_responses, self.options)
+            )
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def get_domain(self, url):
+        get_domain_from_url = getattr(self.limiter, 'get_domain_from_url', None)
+        domain = get_domain_from_url and get_domain_from_url(url)
+
+        return domain or urlparse(url).netloc
+
+    def get_shard(self, url):
+        # every url of the same domain goes to the same process, so the state
+        # of per-domain limiters and caches stays in a single process.
+        domain = self.get_domain(url).encode('utf-8')
+        return (zlib.crc32(domain) & 0xffffffff) % self.processes
+
+    def enqueue(self, url, handler, method='GET', priority=0, **kw):
+        if is_streaming(kw):
+            raise ValueError('ProcessOctopus does not support streaming responses to a chunk_handler.')
+
+        request_id = next(self.request_ids)
+        self.handlers[request_id] = (url, handler)
+        self.requests[self.get_shard(url)].put((request_id, url, method, priority, kw))
+
+    @property
+    def queue_size(self):
+        return len(self.handlers)
+
+    @property
+    def is_empty(self):
+        return self.queue_size == 0
+
+    def wait(self, timeout=10):
+        if timeout:
+            deadline = time.time() + timeout
+
+        while self.handlers:
+            # checks every second whether a worker died
+            wait_for = 1
+            if timeout:
+                wait_for = min(wait_for, deadline - time.time())
+                if wait_for <= 0:
+                    raise TimeoutError('Timed out waiting for %d urls.' % len(self.handlers))
+
+            try:
+                request_id, data = self.results.get(timeout=wait_for)
+            except queue.Empty:
+                self.check_workers()
+                continue
+
+            self.handle_result(request_id, data)
+
+    def handle_result(self, request_id, data):
+        url, handler = self.handlers.pop(request_id)
+
+        try:
+            handler(url, loads_response(data))
+        except Exception:
+            logging.exception('Error calling callback for %s.' % url)
+
+    def check_workers(self):
+        for worker in self.workers:
+            if not worker.is_alive():
+                raise RuntimeError('Worker process %s exited with code %s.' % (worker.pid, worker.exitcode))
+
+    def stop(self, timeout=5):
+        # workers finish fetching the urls they already got before exiting
+        logging.info('Stopping %d worker processes.' % len(self.workers))
+
+        for requests in self.requests:
+            requests.put(None)
+
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                logging.warning('Worker process %s did not stop in time. Terminating it.' % worker.pid)
+                worker.terminate()
+
+        self.workers = []
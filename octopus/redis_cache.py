@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from octopus.cache import Cache
+from octopus.serialization import dumps_response, loads_response
+
+
+class RedisCache(object):
+    def __init__(
+            self, redis, expiration_in_seconds, prefix='octopus-cache', compress=False,
+            local_expiration_in_seconds=None, local_max_entries=None, batch_size=500):
+
+        self.redis = redis
+        self.expiration_in_seconds = expiration_in_seconds
+        self.prefix = prefix
+        self.compress = compress
+        self.batch_size = batch_size
+
+        # responses are also kept in memory for a short time, so urls requested
+        # many times in a row do not need to go to redis every time.
+        self.local_cache = None
+        if local_expiration_in_seconds:
+            self.local_cache = Cache(
+                expiration_in_seconds=local_expiration_in_seconds,
+                max_entries=local_max_entries
+            )
+
+        self.hits = 0
+        self.misses = 0
+        self.local_hits = 0
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'local_hits': self.local_hits,
+        }
+
+    def get_key(self, url):
+        return '%s:%s' % (self.prefix, url)
+
+    def put(self, url, response, method='GET', headers=None):
+        try:
+            data = dumps_response(response, compress=self.compress)
+        except (AttributeError, TypeError, ValueError):
+            logging.exception('Could not serialize response for %s. It will not be cached.' % url)
+            return
+
+        self.redis.set(self.get_key(url), data, px=int(self.expiration_in_seconds * 1000))
+
+        if self.local_cache is not None:
+            self.local_cache.put(url, response)
+
+    def get(self, url, method='GET', headers=None):
+        return self.get_many([url]).get(url)
+
+    def get_many(self, urls):
+        responses = {}
+        missing = []
+
+        for url in urls:
+            response = None
+            if self.local_cache is not None:
+                response = self.local_cache.get(url)
+
+            if response is None:
+                missing.append(url)
+            else:
+                self.local_hits += 1
+                self.hits += 1
+                responses[url] = response
+
+        # a single MGET per batch instead of a round trip per url
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            values = self.redis.mget([self.get_key(url) for url in batch])
+
+            for url, data in zip(batch, values):
+                if data is None:
+                    self.misses += 1
+                    continue
+
+                response = loads_response(data)
+                self.hits += 1
+                responses[url] = response
+
+                if self.local_cache is not None:
+                    self.local_cache.put(url, response)
+
+        return responses
+
+    def prefetch(self, urls):
+        # loads the responses for all the urls into the local cache at once,
+        # so enqueueing them afterwards does not go to redis for each url.
+        if self.local_cache is None:
+            logging.info('Prefetching responses from redis without a local cache has no effect.')
+            return {}
+
+        return self.get_many(urls)
+
+    def remove(self, url):
+        self.redis.delete(self.get_key(url))
+
+        if self.local_cache is not None:
+            self.local_cache.remove(url)
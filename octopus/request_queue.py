@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+from collections import deque
+
+
+class RequestQueue(object):
+    # requests are kept in one deque per priority, so requests with the same
+    # priority are retrieved in the order they were enqueued. Higher priorities
+    # are retrieved first. Priorities are kept negated in a heap.
+    def __init__(self):
+        self.buckets = {}
+        self.priorities = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for priority in sorted(self.buckets.keys(), reverse=True):
+            for item in self.buckets[priority]:
+                yield priority, item
+
+    def get_bucket(self, priority):
+        bucket = self.buckets.get(priority)
+
+        if bucket is None:
+            bucket = self.buckets[priority] = deque()
+            heapq.heappush(self.priorities, -priority)
+
+        return bucket
+
+    def append(self, item, priority=0):
+        self.get_bucket(priority).append(item)
+        self.size += 1
+
+    def appendleft(self, item, priority=0):
+        self.get_bucket(priority).appendleft(item)
+        self.size += 1
+
+    def extend(self, items, priority=0):
+        for item in items:
+            self.append(item, priority)
+
+    def popitem(self):
+        if not self.size:
+            raise IndexError('pop from an empty request queue')
+
+        priority = -self.priorities[0]
+        bucket = self.buckets[priority]
+        item = bucket.popleft()
+        self.size -= 1
+
+        if not bucket:
+            del self.buckets[priority]
+            heapq.heappop(self.priorities)
+
+        return priority, item
+
+    def popleft(self):
+        return self.popitem()[1]
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import marshal
+import zlib
+
+from octopus.model import Response
+
+RESPONSE_FIELDS = (
+    'url', 'status_code', 'headers', 'cookies',
+    'text', 'effective_url', 'error', 'request_time',
+    'content', 'encoding', 'truncated', 'headers_only'
+)
+
+MARSHAL_VERSION = 2
+PLAIN = b'm'
+COMPRESSED = b'z'
+
+
+def dumps_response(response, compress=False):
+    values = []
+
+    # responses with a raw body are stored without decoding it
+    content = getattr(response, 'content', None)
+    if not isinstance(content, bytes):
+        content = None
+
+    for field in RESPONSE_FIELDS:
+        if field == 'content':
+            value = content
+        elif field == 'text' and content is not None:
+            value = None
+        else:
+            value = getattr(response, field, None)
+
+        if field in ('headers', 'cookies'):
+            value = dict(value or {})
+        elif field == 'error' and value is not None:
+            value = str(value)
+        elif field in ('truncated', 'headers_only'):
+            value = bool(value)
+        values.append(value)
+
+    data = marshal.dumps(tuple(values), MARSHAL_VERSION)
+
+    if compress:
+        return COMPRESSED + zlib.compress(data)
+
+    return PLAIN + data
+
+
+def loads_response(data):
+    data = bytes(data)
+    flag, data = data[:1], data[1:]
+
+    if flag == COMPRESSED:
+        data = zlib.decompress(data)
+    elif flag != PLAIN:
+        raise ValueError('Unknown serialized response format: %r.' % flag)
+
+    return Response(*marshal.loads(data))
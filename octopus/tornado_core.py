@@ -2,11 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import time
+import weakref
+from collections import deque
 from datetime import timedelta
+from functools import partial
 
 try:
+    from tornado.concurrent import Future
     from tornado.ioloop import IOLoop
     from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+    from tornado.httputil import HTTPHeaders
 except ImportError:
     print("Can't import tornado. Probably setup.py installing package.")
 
@@ -16,8 +22,132 @@ try:
 except ImportError:
     PYCURL_AVAILABLE = False
 
-from octopus.cache import Cache
+from octopus.body import BodyReader, get_request_options, is_streaming
+from octopus.bulk import get_cached_responses, get_request, iter_batches
+from octopus.completed import CompletedResponses
+from octopus.core import TimeoutError
+from octopus.engine import (
+    WaitingRequests, create_response_cache, get_limiter_domain, get_retry_count, get_retry_delay,
+    get_validators, report_response
+)
+from octopus.in_flight import InFlightRequests
+from octopus.metrics import Metrics
 from octopus.model import Response
+from octopus.request_queue import RequestQueue
+
+
+def parse_cookies(cookies):
+    if not cookies:
+        return {}
+
+    return dict([cookie.split('=') for cookie in cookies.split(';')])
+
+
+class BodyReadStopped(RuntimeError):
+    pass
+
+
+class TornadoBodyReader(BodyReader):
+    # tornado only gives an error response once a body stops being read, so
+    # the status code and headers are kept as they arrive.
+    def __init__(self, *args, **kw):
+        super(TornadoBodyReader, self).__init__(*args, **kw)
+        self.status_code = None
+        self.headers = HTTPHeaders()
+
+    def write_header(self, line):
+        if isinstance(line, bytes):
+            line = line.decode('latin1')
+
+        if line.startswith('HTTP/'):
+            # curl gives the headers of every redirect as well
+            self.status_code = int(line.split(' ')[1])
+            self.headers = HTTPHeaders()
+        elif line.strip():
+            self.headers.parse_line(line)
+
+    def stream(self, chunk):
+        # the simple http client stops reading the body if this raises
+        if not self.write(chunk):
+            raise BodyReadStopped('Stopped reading response body for %s.' % self.url)
+
+    def stream_curl(self, chunk):
+        # pycurl stops the transfer if the whole chunk is not taken
+        if not self.write(chunk):
+            return 0
+
+
+class TornadoCompletedResponses(CompletedResponses):
+    # iterates over the responses inside the running IOLoop, either with
+    # `async for` or by yielding next() in a coroutine until done().
+    def __init__(self, *args, **kw):
+        super(TornadoCompletedResponses, self).__init__(*args, **kw)
+        self.waiter = None
+        self.admitting = False
+
+        # whether as_completed is running the IOLoop until a response arrives
+        self.blocking = False
+
+    def fill(self):
+        super(TornadoCompletedResponses, self).fill()
+
+        # urls refused by a full queue wait for room in it
+        if self.rejected is not None and not self.admitting:
+            url, self.rejected = self.rejected, None
+            self.admitting = True
+            self.pending += 1
+
+            future = self.engine.enqueue_async(url, self.handle, self.method, **self.kw)
+            self.engine.ioloop.add_future(future, partial(self.handle_admitted, url))
+
+    def handle_admitted(self, url, future):
+        self.admitting = False
+
+        if not future.result():
+            self.pending -= 1
+            self.rejected = url
+
+        self.fill()
+
+    def handle(self, url, response):
+        super(TornadoCompletedResponses, self).handle(url, response)
+        self.engine.ioloop.add_callback(self.wake)
+
+    def wake(self):
+        if self.responses.empty():
+            return
+
+        if self.blocking:
+            self.engine.ioloop.stop()
+            return
+
+        if self.waiter is None:
+            return
+
+        waiter, self.waiter = self.waiter, None
+        item = self.get_nowait()
+        self.fill()
+        waiter.set_result(item)
+
+    def done(self):
+        self.fill()
+        return self.finished
+
+    def next(self):
+        self.fill()
+        self.waiter = Future()
+        future = self.waiter
+        self.wake()
+        return future
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self.done():
+            raise StopAsyncIteration  # NOQA
+
+        return self.next()
 
 
 class TornadoOctopus(object):
@@ -25,21 +155,38 @@ class TornadoOctopus(object):
             self, concurrency=10, auto_start=False, cache=False,
             expiration_in_seconds=30, request_timeout_in_seconds=10,
             connect_timeout_in_seconds=5, ignore_pycurl=False,
-            limiter=None, allow_connection_reuse=True):
+            limiter=None, allow_connection_reuse=True,
+            cache_max_entries=None, cache_max_size_in_bytes=None,
+            http_caching=False, coalesce_requests=False, response_cache=None,
+            max_body_size_in_bytes=None, abort_large_bodies=False, headers_only=False,
+            handler_executor=None, max_pending_handlers=None,
+            max_queue_size=None, enqueue_timeout_in_seconds=None, metrics=None):
 
         self.concurrency = concurrency
         self.auto_start = auto_start
         self.last_timeout = None
 
         self.cache = cache
-        self.response_cache = Cache(expiration_in_seconds=expiration_in_seconds)
+        self.http_caching = http_caching
+        self.response_cache = create_response_cache(
+            response_cache, http_caching, expiration_in_seconds, cache_max_entries, cache_max_size_in_bytes
+        )
         self.request_timeout_in_seconds = request_timeout_in_seconds
         self.connect_timeout_in_seconds = connect_timeout_in_seconds
+        self.max_body_size_in_bytes = max_body_size_in_bytes
+        self.abort_large_bodies = abort_large_bodies
+        self.headers_only = headers_only
 
         self.ignore_pycurl = ignore_pycurl
 
         self.running_urls = 0
-        self.url_queue = []
+        self.url_queue = RequestQueue()
+
+        # with a max_queue_size, enqueue refuses urls while the queue is full
+        # and enqueue_async waits for room in it.
+        self.max_queue_size = max_queue_size
+        self.enqueue_timeout_in_seconds = enqueue_timeout_in_seconds
+        self.enqueue_waiters = deque()
 
         if PYCURL_AVAILABLE and not self.ignore_pycurl:
             logging.debug('pycurl is available, thus Octopus will be using it instead of tornado\'s simple http client.')
@@ -54,9 +201,30 @@ class TornadoOctopus(object):
 
         self.limiter = limiter
 
+        self.waiting = WaitingRequests()
+        self.retry_timeouts = {}
+
+        self.coalesce_requests = coalesce_requests
+        self.in_flight = InFlightRequests()
+
+        # handlers can run in an executor instead of the IOLoop. No new urls
+        # are fetched while max_pending_handlers responses wait for them.
+        self.handler_executor = handler_executor
+        self.max_pending_handlers = max_pending_handlers
+        if self.max_pending_handlers is None:
+            self.max_pending_handlers = concurrency
+        self.pending_handlers = 0
+
+        # the IOLoop is not stopped while async iterators wait for responses
+        self.iterators = weakref.WeakSet()
+
+        # a metrics registry can be shared by engines, adding up their counts
+        self.metrics = metrics or Metrics()
+        self.metrics.watch(self)
+
     @property
     def queue_size(self):
-        return len(self.url_queue)
+        return self.remaining_requests
 
     @property
     def is_empty(self):
@@ -68,117 +236,373 @@ class TornadoOctopus(object):
         self.http_client = AsyncHTTPClient(io_loop=self.ioloop)
 
     @classmethod
-    def from_tornado_response(cls, url, response):
-        cookies = response.request.headers.get('Cookie', '')
-        if cookies:
-            cookies = dict([cookie.split('=') for cookie in cookies.split(';')])
-
-        return Response(
-            url=url, status_code=response.code,
-            headers=dict([(key, value) for key, value in response.headers.items()]),
-            cookies=cookies,
-            text=response.body, effective_url=response.effective_url,
-            error=response.error and str(response.error) or None,
-            request_time=response.request_time
+    def from_tornado_response(cls, url, response, body=None):
+        # headers and cookies are only copied if the handler reads them
+        status_code = response.code
+        headers = response.headers
+        text = response.body
+        error = response.error and str(response.error) or None
+
+        if body is not None:
+            # bodies read in chunks come from the body reader, along with the
+            # status and headers if reading the body was stopped.
+            text = body.get_content()
+            if body.status_code is not None:
+                status_code, headers = body.status_code, body.headers
+            if body.stopped:
+                error = None
+
+        result = Response(
+            url=url, status_code=status_code,
+            headers=headers,
+            cookies=partial(parse_cookies, response.request.headers.get('Cookie', '')),
+            text=text, effective_url=response.effective_url,
+            error=error, request_time=response.request_time
         )
 
-    def enqueue(self, url, handler, method='GET', **kw):
+        if body is not None:
+            body.update(result)
+
+        return result
+
+    @property
+    def is_full(self):
+        return bool(self.max_queue_size) and len(self.url_queue) >= self.max_queue_size
+
+    def enqueue(self, url, handler, method='GET', priority=0, **kw):
+        # returns False if the queue is full and the url was not enqueued
         logging.debug('Enqueueing %s...' % url)
 
-        if self.cache:
-            response = self.response_cache.get(url)
+        if self.cache and not is_streaming(kw):
+            response = self.response_cache.get(url, method=method, headers=kw.get('headers'))
 
             if response is not None:
                 logging.debug('Cache hit on %s.' % url)
-                handler(url, response)
-                return
-
-        if self.running_urls < self.concurrency:
+                self.metrics.record_cache_hit()
+                self.call_handler(url, handler, response)
+                return True
+
+        return self.add_request(url, handler, method, priority, kw)
+
+    def enqueue_many(self, requests, handler, method='GET', priority=0, batch_size=100, **kw):
+        # enqueues urls or request descriptors, looking them up in the cache a
+        # batch at a time. Returns how many were enqueued.
+        count = 0
+
+        for batch in iter_batches(requests, batch_size):
+            batch = [get_request(item, method, priority, kw, body_argument='body') for item in batch]
+            logging.debug('Enqueueing %d urls...' % len(batch))
+
+            responses = [None] * len(batch)
+            if self.cache:
+                responses = get_cached_responses(self.response_cache, batch)
+
+            for (url, request_method, request_priority, request_kw), response in zip(batch, responses):
+                if response is not None:
+                    self.metrics.record_cache_hit()
+                    self.call_handler(url, handler, response)
+                    count += 1
+                elif self.add_request(url, handler, request_method, request_priority, request_kw):
+                    count += 1
+
+        return count
+
+    def add_request(self, url, handler, method, priority, kw):
+        coalescing = self.coalesce_requests and not is_streaming(kw)
+        if coalescing:
+            handler, coalesced = self.in_flight.attach(url, handler, method, kw)
+            if coalesced:
+                return True
+
+        if self.can_fetch:
             logging.debug('Queue has space available for fetching %s.' % url)
-            self.get_next_url(url, handler, method, **kw)
+            self.get_next_url(url, handler, method, priority=priority, **kw)
+        elif self.is_full:
+            logging.info('Queue is full. Could not enqueue %s.' % url)
+            if coalescing:
+                self.in_flight.detach(url, method, kw)
+            return False
         else:
             logging.debug('Queue is full. Enqueueing %s for future fetch.' % url)
-            self.url_queue.append((url, handler, method, kw))
+            self.url_queue.append((url, handler, method, kw), priority)
+
+        return True
+
+    def enqueue_async(self, url, handler, method='GET', priority=0, **kw):
+        # returns a future that resolves to True once the url is enqueued, or
+        # to False if there is no room in the queue for it in time.
+        future = Future()
+
+        if not self.enqueue_waiters and self.enqueue(url, handler, method, priority, **kw):
+            future.set_result(True)
+            return future
+
+        if self.enqueue_timeout_in_seconds == 0:
+            future.set_result(False)
+            return future
+
+        waiter = (future, url, handler, method, priority, kw)
+        self.enqueue_waiters.append(waiter)
+
+        if self.enqueue_timeout_in_seconds is not None:
+            deadline = timedelta(seconds=self.enqueue_timeout_in_seconds)
+            self.ioloop.add_timeout(deadline, partial(self.handle_enqueue_timeout, waiter))
+
+        return future
+
+    def handle_enqueue_timeout(self, waiter):
+        if waiter in self.enqueue_waiters:
+            logging.info('Queue is full. Could not enqueue %s.' % waiter[1])
+            self.enqueue_waiters.remove(waiter)
+            waiter[0].set_result(False)
+
+    def admit_waiting(self):
+        # urls waiting for room in the queue are enqueued in order
+        while self.enqueue_waiters:
+            future, url, handler, method, priority, kw = self.enqueue_waiters[0]
+
+            if not self.enqueue(url, handler, method, priority, **kw):
+                return
+
+            self.enqueue_waiters.popleft()
+            future.set_result(True)
 
     def fetch(self, url, handler, method, **kw):
         self.running_urls += 1
 
-        if self.cache:
-            response = self.response_cache.get(url)
+        if self.cache and not is_streaming(kw):
+            response = self.response_cache.get(url, method=method, headers=kw.get('headers'))
 
             if response is not None:
                 logging.debug('Cache hit on %s.' % url)
+                self.metrics.record_cache_hit()
                 self.running_urls -= 1
-                handler(url, response)
+                if self.limiter:
+                    self.release(url)
+                self.call_handler(url, handler, response)
                 return
 
         logging.info('Fetching %s...' % url)
 
+        request_kw = kw
+        validators = get_validators(self, url, method, kw)
+        if validators:
+            logging.debug('Revalidating cached response for %s.' % url)
+            request_kw = dict(kw, headers=dict(kw.get('headers') or {}, **validators))
+
+        options, request_kw = get_request_options(self, request_kw)
+        reader = TornadoBodyReader.create(url, options)
+
+        prepare_curl_callback = self.handle_curl_callback
+        if reader is not None:
+            request_kw['streaming_callback'] = reader.stream
+            request_kw['header_callback'] = reader.write_header
+            prepare_curl_callback = partial(self.handle_curl_callback, reader=reader)
+
         request = HTTPRequest(
             url=url,
             method=method,
             connect_timeout=self.connect_timeout_in_seconds,
             request_timeout=self.request_timeout_in_seconds,
-            prepare_curl_callback=self.handle_curl_callback,
-            **kw
+            prepare_curl_callback=prepare_curl_callback,
+            **request_kw
         )
 
-        self.http_client.fetch(request, self.handle_request(url, handler))
+        self.metrics.start_request(cache_miss=self.cache and not is_streaming(kw))
+        self.http_client.fetch(
+            request,
+            self.handle_request(
+                url, handler, method=method, headers=kw.get('headers'),
+                revalidating=bool(validators), body=reader
+            )
+        )
 
-    def handle_curl_callback(self, curl):
+    def handle_curl_callback(self, curl, reader=None):
         if not self.allow_connection_reuse:
             curl.setopt(pycurl.FRESH_CONNECT, 1)
 
-    def get_next_url(self, request_url=None, handler=None, method=None, **kw):
+        if reader is not None:
+            # replaces the functions set by tornado, which can't stop the transfer
+            curl.setopt(pycurl.WRITEFUNCTION, reader.stream_curl)
+            curl.setopt(pycurl.HEADERFUNCTION, reader.write_header)
+
+    def get_next_url(self, request_url=None, handler=None, method=None, priority=0, **kw):
         if request_url is None:
             if not self.url_queue:
                 return
 
-            request_url, handler, method, kw = self.url_queue.pop()
+            priority, (request_url, handler, method, kw) = self.url_queue.popitem()
+            self.fetch_next_url(request_url, handler, method, priority=priority, **kw)
+            self.admit_waiting()
+            return
 
-        self.fetch_next_url(request_url, handler, method, **kw)
+        self.fetch_next_url(request_url, handler, method, priority=priority, **kw)
 
-    def fetch_next_url(self, request_url, handler, method, **kw):
-        if self.limiter and not self.limiter.acquire(request_url):
-            logging.info('Could not acquire limit for url "%s".' % request_url)
+    def fetch_next_url(self, request_url, handler, method, priority=0, **kw):
+        if self.limiter and hasattr(self.limiter, 'acquire_async'):
+            # the request takes a slot while waiting for redis, so other urls
+            # keep being fetched without blocking the IOLoop.
+            self.running_urls += 1
+            self.ioloop.add_callback(self.acquire_async, request_url, handler, method, priority, kw)
+            return None
 
-            self.url_queue.append((request_url, handler, method, kw))
-            deadline = timedelta(seconds=self.limiter.limiter_miss_timeout_ms / 1000.0)
-            self.ioloop.add_timeout(deadline, self.get_next_url)
-            self.limiter.publish_lock_miss(request_url)
+        if self.limiter and not self.limiter.acquire(request_url):
+            self.wait_for_lock(request_url, handler, method, priority, kw)
             return False
 
         logging.debug('Queue has space available for fetching %s.' % request_url)
-        self.fetch(request_url, handler, method, **kw)
+        self.fetch_acquired(request_url, handler, method, **kw)
         return True
 
-    def handle_request(self, url, callback):
+    def acquire_async(self, request_url, handler, method, priority, kw):
+        # started from inside the IOLoop, since coroutines resume in the
+        # current IOLoop and urls may be enqueued before it is started.
+        future = self.limiter.acquire_async(request_url, io_loop=self.ioloop)
+        self.ioloop.add_future(future, partial(self.handle_acquire, request_url, handler, method, priority, kw))
+
+    def handle_acquire(self, request_url, handler, method, priority, kw, future):
+        self.running_urls -= 1
+
+        try:
+            acquired = future.result()
+        except Exception:
+            logging.exception('Error acquiring limit for url "%s".' % request_url)
+            acquired = False
+
+        if acquired:
+            logging.debug('Queue has space available for fetching %s.' % request_url)
+            self.fetch_acquired(request_url, handler, method, **kw)
+        else:
+            self.wait_for_lock(request_url, handler, method, priority, kw)
+            self.dispatch()
+
+    def fetch_acquired(self, request_url, handler, method, **kw):
+        if self.limiter and self.waiting:
+            # retried requests keep the retry timer going
+            self.schedule_retry(get_limiter_domain(self.limiter, request_url), request_url)
+
+        self.fetch(request_url, handler, method, **kw)
+
+    def wait_for_lock(self, request_url, handler, method, priority, kw):
+        logging.info('Could not acquire limit for url "%s".' % request_url)
+
+        domain = get_limiter_domain(self.limiter, request_url)
+        self.waiting.add(domain, (request_url, handler, method, kw), priority)
+        self.schedule_retry(domain, request_url)
+
+        self.limiter.publish_lock_miss(request_url)
+        self.metrics.record_limiter_miss(request_url, domain)
+
+    def schedule_retry(self, domain, url):
+        # requests waiting for limiters that are also released elsewhere are
+        # retried by a timer. Retried requests start it again when they try to
+        # acquire their locks, so the next delay counts the locks they took.
+        if getattr(self.limiter, 'releases_locally', False) or domain not in self.waiting or domain in self.retry_timeouts:
+            return
+
+        deadline = timedelta(seconds=get_retry_delay(self.limiter, url))
+        self.retry_timeouts[domain] = self.ioloop.add_timeout(deadline, partial(self.retry_waiting, domain, url))
+
+    def release(self, url):
+        if hasattr(self.limiter, 'release_async'):
+            future = self.limiter.release_async(url, io_loop=self.ioloop)
+            self.ioloop.add_future(future, partial(self.handle_release, url))
+        else:
+            self.limiter.release(url)
+
+        # the next request waiting for this domain is the next one to be fetched
+        domain = get_limiter_domain(self.limiter, url)
+        for priority, request in self.waiting.take(domain):
+            self.url_queue.appendleft(request, priority)
+
+    def handle_release(self, url, future):
+        try:
+            future.result()
+        except Exception:
+            logging.exception('Error releasing limit for url "%s".' % url)
+
+    def retry_waiting(self, domain, url):
+        # locks might have been released by other nodes, so requests waiting
+        # for them try again. Only as many as the limiter can take are
+        # retried, the others would miss again.
+        self.retry_timeouts.pop(domain, None)
+        for priority, request in self.waiting.take(domain, get_retry_count(self.limiter, url)):
+            self.url_queue.append(request, priority)
+        self.dispatch()
+
+    @property
+    def can_fetch(self):
+        if self.running_urls >= self.concurrency:
+            return False
+
+        return self.handler_executor is None or self.pending_handlers < self.max_pending_handlers
+
+    def dispatch(self):
+        while self.can_fetch and self.url_queue:
+            self.get_next_url()
+
+    def call_handler(self, url, handler, response):
+        if self.handler_executor is None:
+            try:
+                handler(url, response)
+            except Exception:
+                logging.exception('Error calling callback for %s.' % url)
+            return
+
+        self.pending_handlers += 1
+        future = self.handler_executor.submit(handler, url, response)
+        self.ioloop.add_future(future, partial(self.handle_handler_done, url))
+
+    def handle_handler_done(self, url, future):
+        self.pending_handlers -= 1
+
+        try:
+            future.result()
+        except Exception:
+            logging.exception('Error calling callback for %s.' % url)
+
+        self.dispatch()
+        self.stop_if_done()
+
+    def stop_if_done(self):
+        logging.debug('Getting %d urls and still have %d more urls to get...' % (self.running_urls, self.remaining_requests))
+        if any([not responses.finished for responses in self.iterators]):
+            return
+
+        if self.running_urls < 1 and self.remaining_requests == 0 and self.pending_handlers == 0:
+            logging.debug('Nothing else to get. Stopping Octopus...')
+            self.stop()
+
+    def handle_request(self, url, callback, method='GET', headers=None, revalidating=False, body=None):
         def handle(response):
             logging.debug('Handler called for url %s...' % url)
             self.running_urls -= 1
 
-            response = self.from_tornado_response(url, response)
+            response = self.from_tornado_response(url, response, body=body)
             logging.info('Got response(%s) from %s.' % (response.status_code, url))
 
-            if self.cache and response and response.status_code < 399:
+            self.metrics.end_request(url, response)
+            if response.status_code == 599:
+                error = (response.error or '').lower()
+                if 'timeout' in error or 'timed out' in error:
+                    self.metrics.record_timeout()
+                else:
+                    self.metrics.record_error()
+
+            if revalidating and response.status_code == 304:
+                logging.debug('Cached response for %s is still valid.' % url)
+                response = self.response_cache.refresh(url, response, method=method, headers=headers) or response
+            elif self.cache and (body is None or body.complete) and response and response.status_code < 399:
                 logging.debug('Putting %s into cache.' % url)
-                self.response_cache.put(url, response)
+                self.response_cache.put(url, response, method=method, headers=headers)
 
             if self.limiter:
-                self.limiter.release(url)
+                report_response(self.limiter, url, response)
+                self.release(url)
 
-            try:
-                callback(url, response)
-            except Exception:
-                logging.exception('Error calling callback for %s.' % url)
-
-            if self.running_urls < self.concurrency and self.url_queue:
-                self.get_next_url()
-
-            logging.debug('Getting %d urls and still have %d more urls to get...' % (self.running_urls, self.remaining_requests))
-            if self.running_urls < 1 and self.remaining_requests == 0:
-                logging.debug('Nothing else to get. Stopping Octopus...')
-                self.stop()
+            self.call_handler(url, callback, response)
+            self.dispatch()
+            self.stop_if_done()
 
         return handle
 
@@ -188,7 +612,7 @@ class TornadoOctopus(object):
 
     def wait(self, timeout=10):
         self.last_timeout = timeout
-        if not self.url_queue and not self.running_urls:
+        if not self.remaining_requests and not self.running_urls and not self.pending_handlers:
             logging.debug('No urls to wait for. Returning immediately.')
             return
 
@@ -201,9 +625,47 @@ class TornadoOctopus(object):
         logging.info('Starting IOLoop with %d URLs still left to process.' % self.remaining_requests)
         self.ioloop.start()
 
+    def as_completed(self, urls, method='GET', timeout=None, max_pending_responses=None, **kw):
+        # yields (url, response) as responses arrive, running the IOLoop
+        # while waiting for them. More urls are only enqueued as responses
+        # are consumed.
+        responses = TornadoCompletedResponses(self, urls, method, max_pending_responses, **kw)
+        deadline = timeout and time.time() + timeout
+
+        timeout_handle = None
+        if deadline:
+            timeout_handle = self.ioloop.add_timeout(deadline, self.ioloop.stop)
+
+        try:
+            while not responses.done():
+                item = responses.get_nowait()
+
+                if item is None:
+                    if deadline and time.time() >= deadline:
+                        raise TimeoutError('Timed out waiting for %d urls.' % responses.pending)
+
+                    responses.blocking = True
+                    self.ioloop.start()
+                    responses.blocking = False
+                    continue
+
+                yield item
+        finally:
+            responses.blocking = False
+            if timeout_handle is not None:
+                self.ioloop.remove_timeout(timeout_handle)
+
+    def as_completed_async(self, urls, method='GET', max_pending_responses=None, **kw):
+        responses = TornadoCompletedResponses(self, urls, method, max_pending_responses, **kw)
+        self.iterators.add(responses)
+        return responses
+
     @property
     def remaining_requests(self):
-        return len(self.url_queue)
+        return (
+            len(self.url_queue) + len(self.enqueue_waiters) +
+            self.waiting.size
+        )
 
     def stop(self, force=False):
         logging.info('Stopping IOLoop with %d URLs still left to process.' % self.remaining_requests)
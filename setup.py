@@ -13,6 +13,7 @@ tests_require = [
     'tox',
     'ipdb',
     'coveralls',
+    'aiohttp; python_version >= "3.7"',
 ]
 
 setup(
@@ -49,5 +50,6 @@ Octopus is a library to use threads to concurrently retrieve and report on the c
     ],
     extras_require={
         'tests': tests_require,
+        'asyncio': ['aiohttp; python_version >= "3.7"'],
     },
 )
@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+
+from aiohttp import web
+from preggy import expect
+from mock import Mock, patch
+
+from octopus import AsyncioOctopus, TimeoutError
+from octopus.cache import Cache
+from octopus.limiter.in_memory.per_domain import Limiter as PerDomainInMemoryLimiter
+from octopus.limiter.in_memory.rate import Limiter as RateInMemoryLimiter
+from tests import TestCase
+
+
+class TestAsyncioOctopus(TestCase):
+    def setUp(self):
+        self.response = None
+        self.responses = {}
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.etag_requests = []
+        self.requests = []
+
+    def tearDown(self):
+        if self.server is not None:
+            self.loop.run_until_complete(self.server.cleanup())
+        self.loop.close()
+
+    def start_server(self, delay=0):
+        async def handle(request):
+            if delay:
+                await asyncio.sleep(delay)
+
+            if request.path == '/error':
+                return web.Response(status=500, text='server error')
+
+            if request.path == '/etag':
+                self.etag_requests.append(request.headers.get('If-None-Match'))
+                if request.headers.get('If-None-Match') == '"v1"':
+                    return web.Response(status=304, headers={'Cache-Control': 'max-age=60'})
+                return web.Response(text='etag', headers={'ETag': '"v1"', 'Cache-Control': 'max-age=0'})
+
+            self.requests.append(request.path)
+
+            response = web.Response(text='%s %s' % (request.method, request.path))
+            response.set_cookie('foo', 'bar')
+            return response
+
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', handle)
+
+        self.server = web.AppRunner(app)
+        self.loop.run_until_complete(self.server.setup())
+        site = web.TCPSite(self.server, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+
+        port = site._server.sockets[0].getsockname()[1]
+        return 'http://127.0.0.1:%d' % port
+
+    def handle_url_response(self, url, response):
+        self.response = response
+        self.responses[url] = response
+
+    def test_can_create_asyncio_otto(self):
+        otto = AsyncioOctopus()
+
+        expect(otto.concurrency).to_equal(10)
+        expect(otto.auto_start).to_be_false()
+        expect(otto.cache).to_be_false()
+
+        expect(otto.response_cache).to_be_instance_of(Cache)
+        expect(otto.response_cache.expiration_in_seconds).to_equal(30)
+
+        expect(otto.request_timeout_in_seconds).to_equal(10)
+        expect(otto.connect_timeout_in_seconds).to_equal(5)
+        expect(otto.allow_connection_reuse).to_be_true()
+        expect(otto.limiter).to_be_null()
+        expect(otto.loop).to_be_null()
+
+    def test_can_create_asyncio_otto_with_auto_start(self):
+        otto = AsyncioOctopus(auto_start=True)
+
+        expect(otto.loop).not_to_be_null()
+        expect(otto.workers).to_be_empty()
+
+    def test_can_get_queue_info(self):
+        otto = AsyncioOctopus()
+
+        expect(otto.queue_size).to_equal(0)
+        expect(otto.is_empty).to_be_true()
+
+    def test_can_enqueue_url(self):
+        otto = AsyncioOctopus()
+
+        otto.enqueue('http://www.google.com', None, method='GET', something='else')
+
+        expect(otto.queue_size).to_equal(1)
+        expect(otto.is_empty).to_be_false()
+
+    def test_can_enqueue_and_get_from_cache(self):
+        mock_response = Mock()
+        otto = AsyncioOctopus(cache=True)
+        otto.response_cache.put('http://www.google.com', mock_response)
+
+        otto.enqueue('http://www.google.com', self.handle_url_response)
+
+        expect(otto.is_empty).to_be_true()
+        expect(self.response).to_equal(mock_response)
+
+    def test_can_get_response_from_aiohttp_response(self):
+        response = Mock(
+            status=404,
+            headers={'baz': 'foo'},
+            cookies={'foo': Mock(value='bar')},
+            url='http://www.google.com/',
+            charset=None
+        )
+
+        otto_response = AsyncioOctopus.from_aiohttp_response('http://www.google.com', response, b'body', 2.1)
+
+        expect(otto_response.url).to_equal('http://www.google.com')
+        expect(otto_response.status_code).to_equal(404)
+        expect(otto_response.headers).to_be_like({'baz': 'foo'})
+        expect(otto_response.cookies).to_be_like({'foo': 'bar'})
+        expect(otto_response.text).to_equal('body')
+        expect(otto_response.effective_url).to_equal('http://www.google.com/')
+        expect(otto_response.error).to_equal('body')
+        expect(otto_response.request_time).to_equal(2.1)
+
+    def test_can_wait(self):
+        base_url = self.start_server()
+        otto = AsyncioOctopus(concurrency=2, loop=self.loop, auto_start=True)
+
+        otto.enqueue(base_url + '/a', self.handle_url_response)
+        otto.enqueue(base_url + '/b', self.handle_url_response, method='POST')
+        otto.enqueue(base_url + '/error', self.handle_url_response)
+
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.responses).to_length(3)
+        expect(self.responses[base_url + '/a'].status_code).to_equal(200)
+        expect(self.responses[base_url + '/a'].text).to_equal('GET /a')
+        expect(self.responses[base_url + '/a'].cookies).to_be_like({'foo': 'bar'})
+        expect(self.responses[base_url + '/b'].text).to_equal('POST /b')
+        expect(self.responses[base_url + '/error'].status_code).to_equal(500)
+        expect(self.responses[base_url + '/error'].error).to_equal('server error')
+
+    def test_creates_queue_inside_the_running_loop(self):
+        base_url = self.start_server()
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop)
+
+        otto.enqueue(base_url + '/a', self.handle_url_response)
+        otto.enqueue(base_url + '/b', self.handle_url_response, priority=1)
+
+        expect(otto.url_queue).to_be_null()
+        expect(otto.queue_size).to_equal(2)
+
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.responses).to_length(2)
+        expect(self.requests).to_equal(['/b', '/a'])
+        expect(otto.url_queue._loop).to_equal(self.loop)
+        expect(otto.enqueued).to_be_empty()
+
+    def test_can_fetch_all_from_running_loop(self):
+        base_url = self.start_server()
+        urls = [base_url + '/%d' % index for index in range(20)]
+
+        async def run():
+            otto = AsyncioOctopus(concurrency=5)
+            await otto.fetch_all(urls, self.handle_url_response, timeout=5)
+            await otto.close()
+
+        self.loop.run_until_complete(run())
+
+        expect(self.responses).to_length(20)
+
+    def test_can_cache_responses(self):
+        base_url = self.start_server()
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop, cache=True)
+
+        otto.enqueue(base_url + '/a', self.handle_url_response)
+        otto.wait(5)
+
+        expect(self.response).not_to_be_null()
+        expect(otto.response_cache.get(base_url + '/a')).to_equal(self.response)
+        self.loop.run_until_complete(otto.close())
+
+    def test_can_handle_invalid_urls(self):
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop)
+
+        otto.enqueue('http://127.0.0.1:1/', self.handle_url_response)
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.response.status_code).to_equal(599)
+        expect(self.response.error).to_equal(self.response.text)
+        expect(self.response.text).not_to_be_empty()
+
+    def test_can_handle_timeouts(self):
+        base_url = self.start_server(delay=1)
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop, request_timeout_in_seconds=0.1)
+
+        otto.enqueue(base_url + '/a', self.handle_url_response)
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.response.status_code).to_equal(599)
+        expect(self.response.text).to_include('timed out')
+
+    def test_times_out_on_wait(self):
+        base_url = self.start_server(delay=1)
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop)
+
+        otto.enqueue(base_url + '/a', self.handle_url_response)
+
+        try:
+            otto.wait(0.1)
+        except TimeoutError:
+            pass
+        else:
+            assert False, "Should not have gotten this far"
+        finally:
+            self.loop.run_until_complete(otto.close())
+
+    def test_respects_limiter(self):
+        base_url = self.start_server()
+        limiter = PerDomainInMemoryLimiter({base_url: 1}, limiter_miss_timeout_ms=10)
+        misses = []
+        limiter.subscribe_to_lock_miss(misses.append)
+
+        otto = AsyncioOctopus(concurrency=4, loop=self.loop, limiter=limiter)
+
+        for index in range(4):
+            otto.enqueue(base_url + '/%d' % index, self.handle_url_response)
+
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.responses).to_length(4)
+        expect(misses).not_to_be_empty()
+        expect(limiter.domain_count[base_url]).to_equal(0)
+
+    def test_hands_lock_over_to_waiting_requests(self):
+        base_url = self.start_server(delay=0.05)
+        limiter = PerDomainInMemoryLimiter({base_url: 1}, limiter_miss_timeout_ms=10000)
+        otto = AsyncioOctopus(concurrency=4, loop=self.loop, limiter=limiter)
+
+        for index in range(4):
+            otto.enqueue(base_url + '/%d' % index, self.handle_url_response)
+
+        async def run():
+            otto.start_workers()
+            await asyncio.sleep(0.02)
+            queue_size = otto.queue_size
+            await otto.join(5)
+            return queue_size
+
+        queue_size = self.loop.run_until_complete(run())
+        self.loop.run_until_complete(otto.close())
+
+        # waiting requests don't sleep for limiter_miss_timeout_ms
+        expect(self.responses).to_length(4)
+        expect(queue_size).to_equal(3)
+        expect(otto.waiting).to_be_empty()
+        expect(otto.retry_handles).to_be_empty()
+
+    def test_retries_waiting_requests_if_lock_is_released_elsewhere(self):
+        base_url = self.start_server()
+        limiter = PerDomainInMemoryLimiter({base_url: 1}, limiter_miss_timeout_ms=10)
+        limiter.releases_locally = False
+        limiter.domain_count[base_url] = 1
+        otto = AsyncioOctopus(concurrency=2, loop=self.loop, limiter=limiter)
+
+        otto.enqueue(base_url + '/a', self.handle_url_response)
+        self.loop.call_later(0.05, limiter.release, base_url + '/a')
+
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.responses).to_length(1)
+        expect(otto.retry_handles).to_be_empty()
+
+    def test_retries_only_requests_the_rate_limiter_can_take(self):
+        base_url = self.start_server()
+        limiter = RateInMemoryLimiter({base_url: {'requests': 40, 'burst': 1}})
+        misses = []
+        limiter.subscribe_to_lock_miss(misses.append)
+        otto = AsyncioOctopus(concurrency=10, loop=self.loop, limiter=limiter)
+
+        for index in range(30):
+            otto.enqueue(base_url + '/%d' % index, self.handle_url_response)
+
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        # every waiting request used to be retried each time a token was added
+        expect(self.responses).to_length(30)
+        expect(len(misses)).to_be_lesser_than(90)
+        expect(otto.waiting).to_be_empty()
+
+    @patch.object(logging, 'exception')
+    def test_logs_handler_errors(self, logging_mock):
+        base_url = self.start_server()
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop)
+
+        def handle_url_response(url, response):
+            raise RuntimeError(url)
+
+        otto.enqueue(base_url + '/a', handle_url_response)
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        logging_mock.assert_called_once_with('Error calling callback for %s.' % (base_url + '/a'))
+
+    def test_revalidates_stale_responses(self):
+        base_url = self.start_server()
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop, cache=True, http_caching=True)
+
+        for i in range(3):
+            otto.enqueue(base_url + '/etag', self.handle_url_response)
+            otto.wait(5)
+            expect(self.response.status_code).to_equal(200)
+            expect(self.response.text).to_equal('etag')
+
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.etag_requests).to_equal([None, '"v1"'])
+        expect(otto.response_cache.revalidations).to_equal(1)
+
+    def test_urls_are_retrieved_in_order_of_priority(self):
+        base_url = self.start_server()
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop)
+
+        otto.enqueue(base_url + '/1', self.handle_url_response)
+        otto.enqueue(base_url + '/2', self.handle_url_response)
+        otto.enqueue(base_url + '/urgent', self.handle_url_response, priority=10)
+        otto.enqueue(base_url + '/3', self.handle_url_response)
+
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.requests).to_equal(['/urgent', '/1', '/2', '/3'])
+
+    def test_coalesces_identical_requests(self):
+        base_url = self.start_server(delay=0.1)
+        otto = AsyncioOctopus(concurrency=10, loop=self.loop, coalesce_requests=True)
+        responses = []
+
+        def handle_url_response(url, response):
+            responses.append(response)
+
+        for i in range(10):
+            otto.enqueue(base_url + '/a', handle_url_response)
+
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(self.requests).to_equal(['/a'])
+        expect(responses).to_length(10)
+
+    def test_can_stream_response_body_to_chunk_handler(self):
+        base_url = self.start_server()
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop, cache=True, chunk_size_in_bytes=2)
+        chunks = []
+
+        otto.enqueue(base_url + '/stream', self.handle_url_response, chunk_handler=lambda url, chunk: chunks.append(chunk))
+        otto.wait(5)
+        otto.enqueue(base_url + '/stream', self.handle_url_response, chunk_handler=lambda url, chunk: chunks.append(chunk))
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        expect(b''.join(chunks)).to_equal(b'GET /streamGET /stream')
+        expect(len(chunks)).to_be_greater_than(2)
+        expect(self.response.status_code).to_equal(200)
+        expect(self.response.text).to_be_null()
+        expect(self.requests).to_equal(['/stream', '/stream'])
+
+    def test_can_limit_response_body_size(self):
+        base_url = self.start_server()
+        otto = AsyncioOctopus(concurrency=1, loop=self.loop, cache=True, max_body_size_in_bytes=5, chunk_size_in_bytes=2)
+
+        otto.enqueue(base_url + '/truncated', self.handle_url_response)
+        otto.enqueue(base_url + '/aborted', self.handle_url_response, abort_large_bodies=True)
+        otto.enqueue(base_url + '/headers', self.handle_url_response, headers_only=True)
+        otto.wait(5)
+        self.loop.run_until_complete(otto.close())
+
+        truncated = self.responses[base_url + '/truncated']
+        expect(truncated.text).to_equal('GET /')
+        expect(truncated.truncated).to_be_true()
+        expect(otto.response_cache.get(base_url + '/truncated')).to_be_null()
+
+        aborted = self.responses[base_url + '/aborted']
+        expect(aborted.status_code).to_equal(200)
+        expect(aborted.text).to_be_null()
+        expect(aborted.error).to_equal('Response body for %s/aborted is larger than 5 bytes.' % base_url)
+
+        headers = self.responses[base_url + '/headers']
+        expect(headers.status_code).to_equal(200)
+        expect(headers.headers).to_include('Content-Type')
+        expect(headers.text).to_be_null()
+        expect(headers.headers_only).to_be_true()
+
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from preggy import expect
+from mock import patch
+
+from octopus.limiter.in_memory.adaptive import Limiter as AdaptiveInMemoryLimiter, get_limits
+from octopus.model import Response
+from tests import TestCase
+
+
+class TestAdaptive(TestCase):
+    def setUp(self):
+        super(TestAdaptive, self).setUp()
+        self.limiter = AdaptiveInMemoryLimiter(
+            {'http://g1.globo.com': {'min': 2, 'max': 4, 'initial': 3}},
+            {'http://globoesporte.globo.com': 10},
+            latency_threshold_ms=500
+        )
+
+    def get_response(self, url, status_code=200, request_time=0.1):
+        return Response(
+            url=url, status_code=status_code, headers={}, cookies={},
+            text='body', effective_url=url, error=None, request_time=request_time
+        )
+
+    def test_can_get_limits(self):
+        expect(get_limits(10)).to_equal((1, 10, 1.0))
+        expect(get_limits({'max': 10})).to_equal((1, 10, 1.0))
+        expect(get_limits({'min': 2, 'max': 10, 'initial': 5})).to_equal((2, 10, 5.0))
+        expect(get_limits({'min': 2, 'max': 10, 'initial': 50})).to_equal((2, 10, 10.0))
+        expect(get_limits({'min': 20, 'max': 10})).to_equal((10, 10, 10.0))
+
+    def test_can_create_limiter(self):
+        expect(self.limiter.releases_locally).to_be_false()
+        expect(self.limiter.latency_threshold_ms).to_equal(500)
+        expect(self.limiter.error_status_codes).to_equal(set([429, 503, 504, 599]))
+        expect(self.limiter.limits).to_be_empty()
+
+    def test_starts_with_initial_limit(self):
+        expect(self.limiter.get_domain_limit('http://g1.globo.com/')).to_equal(3)
+        expect(self.limiter.get_domain_limit('http://globoesporte.globo.com/')).to_equal(1)
+        expect(self.limiter.get_domain_limit('http://www.google.com/')).to_equal(0)
+
+    def test_can_acquire_up_to_current_limit(self):
+        for index in range(3):
+            expect(self.limiter.acquire('http://g1.globo.com/%d' % index)).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/')).to_be_false()
+
+        self.limiter.release('http://g1.globo.com/0')
+        expect(self.limiter.acquire('http://g1.globo.com/')).to_be_true()
+
+    def test_can_get_available_locks(self):
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(3)
+
+        self.limiter.acquire('http://g1.globo.com/')
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(2)
+
+        expect(self.limiter.get_available_locks('http://www.google.com/')).to_be_null()
+
+    def test_successful_responses_increase_limit_up_to_maximum(self):
+        url = 'http://g1.globo.com/'
+
+        self.limiter.report_response(url, self.get_response(url))
+        expect(self.limiter.get_domain_limit(url)).to_equal(3)
+
+        for index in range(3):
+            self.limiter.report_response(url, self.get_response(url))
+
+        expect(self.limiter.get_domain_limit(url)).to_equal(4)
+
+        for index in range(10):
+            self.limiter.report_response(url, self.get_response(url))
+
+        expect(self.limiter.limits['http://g1.globo.com']).to_equal(4)
+
+    def test_errors_decrease_limit_down_to_minimum(self):
+        url = 'http://globoesporte.globo.com/'
+        self.limiter.limits['http://globoesporte.globo.com'] = 8.0
+
+        self.limiter.report_response(url, self.get_response(url, status_code=503, request_time=0))
+        expect(self.limiter.get_domain_limit(url)).to_equal(4)
+
+        self.limiter.report_response(url, self.get_response(url, status_code=429, request_time=0))
+        self.limiter.report_response(url, self.get_response(url, status_code=599, request_time=0))
+        self.limiter.report_response(url, self.get_response(url, status_code=599, request_time=0))
+        expect(self.limiter.get_domain_limit(url)).to_equal(1)
+
+    def test_slow_responses_decrease_limit(self):
+        url = 'http://g1.globo.com/'
+        self.limiter.limits['http://g1.globo.com'] = 4.0
+
+        self.limiter.report_response(url, self.get_response(url, request_time=0.4))
+        expect(self.limiter.get_domain_limit(url)).to_equal(4)
+
+        self.limiter.report_response(url, self.get_response(url, request_time=0))
+        self.limiter.decreased_at.clear()
+        self.limiter.report_response(url, self.get_response(url, request_time=0.6))
+        expect(self.limiter.get_domain_limit(url)).to_equal(2)
+
+    def test_requests_started_before_last_decrease_do_not_decrease_limit_again(self):
+        url = 'http://globoesporte.globo.com/'
+        self.limiter.limits['http://globoesporte.globo.com'] = 8.0
+
+        self.limiter.report_response(url, self.get_response(url, status_code=503, request_time=1))
+        self.limiter.report_response(url, self.get_response(url, status_code=503, request_time=1))
+        self.limiter.report_response(url, self.get_response(url, status_code=503, request_time=1))
+
+        expect(self.limiter.get_domain_limit(url)).to_equal(4)
+
+    def test_other_error_status_codes_do_not_decrease_limit(self):
+        url = 'http://globoesporte.globo.com/'
+        self.limiter.limits['http://globoesporte.globo.com'] = 8.0
+
+        self.limiter.report_response(url, self.get_response(url, status_code=404))
+
+        expect(self.limiter.limits['http://globoesporte.globo.com']).to_be_greater_than(8)
+
+    def test_reporting_unknown_url_does_nothing(self):
+        self.limiter.report_response('http://www.google.com', self.get_response('http://www.google.com', status_code=503))
+        expect(self.limiter.limits).to_be_empty()
+
+    @patch.object(logging, 'info')
+    def test_can_acquire_from_unknown_domain_url(self, logging_mock):
+        expect(self.limiter.acquire('http://www.google.com')).to_be_true()
+        logging_mock.assert_called_once_with('Tried to acquire lock to a domain that was not specified in the limiter (http://www.google.com).')
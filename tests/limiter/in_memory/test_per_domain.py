@@ -68,3 +68,17 @@ class TestPerDomain(TestCase):
 
         expect(self.limiter.domain_count).to_be_empty()
         logging_mock.assert_called_once_with('Tried to release lock to a domain that was not specified in the limiter (http://www.google.com).')
+
+    def test_can_get_domain_and_limit(self):
+        expect(self.limiter.get_domain_and_limit('http://g1.globo.com/economia/')).to_equal(('http://g1.globo.com', 10))
+        expect(self.limiter.get_domain_and_limit('http://www.google.com')).to_equal((None, 0))
+
+    def test_urls_defined_first_take_precedence(self):
+        limiter = PerDomainInMemoryLimiter(
+            {'http://g1.globo.com/economia': 1},
+            {'http://g1.globo.com': 10}
+        )
+
+        expect(limiter.acquire('http://g1.globo.com/economia/')).to_be_true()
+        expect(limiter.acquire('http://g1.globo.com/economia/')).to_be_false()
+        expect(limiter.acquire('http://g1.globo.com/politica/')).to_be_true()
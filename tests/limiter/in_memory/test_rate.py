@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from preggy import expect
+from mock import patch
+
+from octopus.limiter.in_memory.rate import Limiter as RateInMemoryLimiter, get_rate_and_burst
+from tests import TestCase
+
+
+class TestRate(TestCase):
+    def setUp(self):
+        super(TestRate, self).setUp()
+        self.limiter = RateInMemoryLimiter(
+            {'http://g1.globo.com': {'requests': 2, 'per_seconds': 0.1}},
+            {'http://globoesporte.globo.com': 1}
+        )
+
+    def test_can_get_rate_and_burst(self):
+        expect(get_rate_and_burst(10)).to_equal((10.0, 10.0))
+        expect(get_rate_and_burst(0.5)).to_equal((0.5, 1.0))
+        expect(get_rate_and_burst({'requests': 120, 'per_seconds': 60})).to_equal((2.0, 120.0))
+        expect(get_rate_and_burst({'requests': 120, 'per_seconds': 60, 'burst': 5})).to_equal((2.0, 5.0))
+
+    def test_can_create_limiter(self):
+        expect(self.limiter.releases_locally).to_be_false()
+        expect(self.limiter.domains[1]['http://globoesporte.globo.com']).to_equal(1)
+        expect(self.limiter.buckets).to_be_empty()
+
+    def test_can_acquire_up_to_burst(self):
+        expect(self.limiter.acquire('http://g1.globo.com/economia')).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/politica')).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/')).to_be_false()
+
+        expect(self.limiter.acquire('http://globoesporte.globo.com/')).to_be_true()
+        expect(self.limiter.acquire('http://globoesporte.globo.com/')).to_be_false()
+
+    def test_tokens_are_refilled_with_time(self):
+        self.limiter.acquire('http://g1.globo.com/')
+        self.limiter.acquire('http://g1.globo.com/')
+
+        time.sleep(0.06)
+
+        expect(self.limiter.acquire('http://g1.globo.com/')).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/')).to_be_false()
+
+    def test_releasing_does_not_give_tokens_back(self):
+        self.limiter.acquire('http://globoesporte.globo.com/')
+        self.limiter.release('http://globoesporte.globo.com/')
+
+        expect(self.limiter.acquire('http://globoesporte.globo.com/')).to_be_false()
+
+    def test_can_get_retry_delay(self):
+        expect(self.limiter.get_retry_delay('http://globoesporte.globo.com/')).to_equal(0)
+
+        self.limiter.acquire('http://globoesporte.globo.com/')
+
+        delay = self.limiter.get_retry_delay('http://globoesporte.globo.com/')
+        expect(delay).to_be_greater_than(0.9)
+        expect(delay).to_be_lesser_or_equal_to(1)
+
+        expect(self.limiter.get_retry_delay('http://www.google.com')).to_equal(0)
+
+    def test_can_get_available_locks(self):
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(2)
+
+        self.limiter.acquire('http://g1.globo.com/')
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(1)
+
+        self.limiter.acquire('http://g1.globo.com/')
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(0)
+
+        expect(self.limiter.get_available_locks('http://www.google.com')).to_be_null()
+
+    @patch.object(logging, 'info')
+    def test_can_acquire_from_unknown_domain_url(self, logging_mock):
+        expect(self.limiter.acquire('http://www.google.com')).to_be_true()
+        logging_mock.assert_called_once_with('Tried to acquire lock to a domain that was not specified in the limiter (http://www.google.com).')
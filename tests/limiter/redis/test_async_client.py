@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import redis
+from preggy import expect
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from octopus.limiter.redis.async_client import AsyncRedisClient, RedisError, pack_command
+from tests import TestCase
+
+
+class TestAsyncRedisClient(TestCase):
+    def setUp(self):
+        super(TestAsyncRedisClient, self).setUp()
+        self.io_loop = IOLoop()
+        self.client = AsyncRedisClient(port=7575, io_loop=self.io_loop)
+
+    def tearDown(self):
+        self.client.close()
+        self.io_loop.close(all_fds=True)
+
+    def run_sync(self, func):
+        return self.io_loop.run_sync(func, timeout=5)
+
+    def test_can_pack_command(self):
+        expect(pack_command('SET', 'key', 10)).to_equal(b'*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$2\r\n10\r\n')
+
+    def test_can_create_client_from_connection(self):
+        client = AsyncRedisClient.from_connection(self.redis, io_loop=self.io_loop)
+
+        expect(client.host).to_equal('localhost')
+        expect(client.port).to_equal(7575)
+        expect(client.db).to_equal(0)
+        expect(client.io_loop).to_equal(self.io_loop)
+
+    def test_can_create_client_from_connection_with_password(self):
+        connection = redis.Redis(port=7575, username='octopus', password='secret')
+
+        client = AsyncRedisClient.from_connection(connection, io_loop=self.io_loop)
+
+        expect(client.username).to_equal('octopus')
+        expect(client.password).to_equal('secret')
+
+    def test_cant_create_client_from_unsupported_connections(self):
+        unix_socket = redis.Redis(unix_socket_path='/tmp/redis.sock')
+        ssl = redis.Redis(port=7575, ssl=True)
+
+        expect(AsyncRedisClient.from_connection(unix_socket, io_loop=self.io_loop)).to_be_null()
+        expect(AsyncRedisClient.from_connection(ssl, io_loop=self.io_loop)).to_be_null()
+
+    def test_authenticates_before_other_commands(self):
+        client = AsyncRedisClient(port=7575, db=2, password='secret', io_loop=self.io_loop)
+
+        @gen.coroutine
+        def execute():
+            yield client.execute('SET', 'key', 'value')
+            value = yield client.execute('GET', 'key')
+            raise gen.Return(value)
+
+        expect(client.get_setup_commands()).to_equal([pack_command('AUTH', 'secret'), pack_command('SELECT', 2)])
+
+        self.redis.config_set('requirepass', 'secret')
+        try:
+            expect(self.run_sync(execute)).to_equal(b'value')
+            expect(redis.Redis(port=7575, db=2, password='secret').get('key')).to_equal(b'value')
+        finally:
+            client.close()
+            redis.Redis(port=7575, password='secret').config_set('requirepass', '')
+
+    def test_fails_commands_when_it_cant_authenticate(self):
+        client = AsyncRedisClient(port=7575, password='wrong', io_loop=self.io_loop)
+
+        @gen.coroutine
+        def execute():
+            get = client.execute('GET', 'key')
+            try:
+                yield client.execute('SET', 'key', 'value')
+            finally:
+                # every command queued while connecting gets the error
+                expect(get.exception()).to_be_instance_of(RedisError)
+
+        self.redis.config_set('requirepass', 'secret')
+        try:
+            self.run_sync(execute)
+        except RedisError as err:
+            expect(str(err)).to_include('password')
+        else:
+            assert False, "Should not have gotten this far"
+        finally:
+            client.close()
+            redis.Redis(port=7575, password='secret').config_set('requirepass', '')
+
+        expect(client.pending).to_be_empty()
+        expect(client.stream).to_be_null()
+        expect(self.redis.get('key')).to_be_null()
+
+    def test_can_execute_commands(self):
+        @gen.coroutine
+        def execute():
+            yield self.client.execute('SET', 'key', 'value')
+            value = yield self.client.execute('GET', 'key')
+            missing = yield self.client.execute('GET', 'other-key')
+            count = yield self.client.execute('INCR', 'counter')
+            raise gen.Return((value, missing, count))
+
+        expect(self.run_sync(execute)).to_equal((b'value', None, 1))
+        expect(self.redis.get('key')).to_equal(b'value')
+
+    def test_pipelined_commands_get_their_own_replies(self):
+        @gen.coroutine
+        def execute():
+            replies = yield [self.client.execute('INCR', 'counter') for i in range(100)]
+            raise gen.Return(replies)
+
+        expect(self.run_sync(execute)).to_equal(list(range(1, 101)))
+
+    def test_can_read_nested_replies(self):
+        @gen.coroutine
+        def execute():
+            reply = yield self.client.execute('EVAL', "return {1, 'a', {2, 'b'}}", 0)
+            raise gen.Return(reply)
+
+        expect(self.run_sync(execute)).to_equal([1, b'a', [2, b'b']])
+
+    def test_errors_are_raised(self):
+        @gen.coroutine
+        def execute():
+            yield self.client.execute('INCRBY', 'counter', 'a')
+
+        try:
+            self.run_sync(execute)
+        except RedisError as err:
+            expect(str(err)).to_include('ERR')
+        else:
+            assert False, "Should not have gotten this far"
+
+    def test_can_select_database(self):
+        client = AsyncRedisClient(port=7575, db=2, io_loop=self.io_loop)
+
+        @gen.coroutine
+        def execute():
+            yield client.execute('SET', 'key', 'value')
+
+        self.run_sync(execute)
+        client.close()
+
+        expect(self.redis.get('key')).to_be_null()
+
+    def test_reconnects_after_connection_is_closed(self):
+        @gen.coroutine
+        def execute():
+            yield self.client.execute('SET', 'key', 'value')
+            self.client.close()
+            yield gen.sleep(0.01)
+            value = yield self.client.execute('GET', 'key')
+            raise gen.Return(value)
+
+        expect(self.run_sync(execute)).to_equal(b'value')
+
+    def test_fails_commands_when_it_cant_connect(self):
+        client = AsyncRedisClient(port=1, io_loop=self.io_loop)
+
+        @gen.coroutine
+        def execute():
+            yield client.execute('GET', 'key')
+
+        try:
+            self.run_sync(execute)
+        except Exception as err:
+            expect(err).not_to_be_instance_of(RedisError)
+        else:
+            assert False, "Should not have gotten this far"
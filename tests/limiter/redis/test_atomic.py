@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import sys
+import time
+
+import redis
+from preggy import expect
+from mock import patch
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from octopus.limiter.redis.async_client import RedisError
+from octopus.limiter.redis.atomic import Limiter as AtomicRedisLimiter
+from tests import TestCase
+
+
+class TestAtomic(TestCase):
+    def setUp(self):
+        super(TestAtomic, self).setUp()
+        self.limiter = AtomicRedisLimiter(
+            {'http://g1.globo.com': 2},
+            {'http://globoesporte.globo.com': 1},
+            redis=self.redis,
+            expiration_in_seconds=12
+        )
+
+    def test_can_create_limiter(self):
+        expect(self.limiter.redis).to_equal(self.redis)
+        expect(self.limiter.expiration_in_seconds).to_equal(12)
+        expect(self.limiter.prefix).to_equal('leases-for')
+        expect(self.limiter.releases_locally).to_be_false()
+        expect(self.limiter.domains[0]['http://g1.globo.com']).to_equal(2)
+
+    def test_cant_create_limiter_without_redis(self):
+        try:
+            AtomicRedisLimiter()
+        except RuntimeError:
+            err = sys.exc_info()[1]
+            expect(err).to_have_an_error_message_of('You must specify a connection to redis in order to use Redis Limiter.')
+        else:
+            assert False, "Should not have gotten this far"
+
+    def test_can_acquire_limit(self):
+        expect(self.limiter.acquire('http://g1.globo.com/economia')).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/economia')).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/politica')).to_be_false()
+
+        expect(self.redis.zcard('leases-for-http://g1.globo.com')).to_equal(2)
+        expect(self.limiter.leases['http://g1.globo.com/economia']).to_length(2)
+
+    def test_can_release(self):
+        url = 'http://g1.globo.com/economia'
+        self.limiter.acquire(url)
+        self.limiter.acquire(url)
+
+        self.limiter.release(url)
+
+        expect(self.redis.zcard('leases-for-http://g1.globo.com')).to_equal(1)
+        expect(self.limiter.acquire('http://g1.globo.com/politica')).to_be_true()
+
+        self.limiter.release(url)
+        self.limiter.release('http://g1.globo.com/politica')
+
+        expect(self.redis.zcard('leases-for-http://g1.globo.com')).to_equal(0)
+        expect(self.limiter.leases).to_be_empty()
+
+    def test_can_get_available_locks(self):
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(2)
+
+        self.limiter.acquire('http://g1.globo.com/economia')
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(1)
+
+        self.limiter.acquire('http://g1.globo.com/economia')
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(0)
+
+        expect(self.limiter.get_available_locks('http://www.google.com')).to_be_null()
+
+    def test_leases_are_shared_between_limiters(self):
+        other_limiter = AtomicRedisLimiter({'http://globoesporte.globo.com': 1}, redis=self.redis)
+
+        expect(other_limiter.acquire('http://globoesporte.globo.com/')).to_be_true()
+        expect(self.limiter.acquire('http://globoesporte.globo.com/')).to_be_false()
+
+        other_limiter.release('http://globoesporte.globo.com/')
+
+        expect(self.limiter.acquire('http://globoesporte.globo.com/')).to_be_true()
+
+    def test_expired_leases_are_dropped(self):
+        limiter = AtomicRedisLimiter({'http://globoesporte.globo.com': 1}, redis=self.redis, expiration_in_seconds=0.05)
+
+        expect(limiter.acquire('http://globoesporte.globo.com/')).to_be_true()
+        expect(limiter.acquire('http://globoesporte.globo.com/')).to_be_false()
+
+        time.sleep(0.1)
+
+        expect(limiter.acquire('http://globoesporte.globo.com/')).to_be_true()
+
+    def test_can_acquire_many(self):
+        acquired = self.limiter.acquire_many([
+            'http://g1.globo.com/1',
+            'http://www.google.com',
+            'http://globoesporte.globo.com/1',
+            'http://g1.globo.com/2',
+            'http://globoesporte.globo.com/2',
+            'http://g1.globo.com/3',
+        ])
+
+        expect(acquired).to_equal([True, True, True, True, False, False])
+        expect(self.redis.zcard('leases-for-http://g1.globo.com')).to_equal(2)
+        expect(self.redis.zcard('leases-for-http://globoesporte.globo.com')).to_equal(1)
+
+    @patch.object(logging, 'info')
+    def test_can_acquire_from_unknown_domain_url(self, logging_mock):
+        expect(self.limiter.acquire('http://www.google.com')).to_be_true()
+        logging_mock.assert_called_once_with('Tried to acquire lock to a domain that was not specified in the limiter (http://www.google.com).')
+
+    @patch.object(logging, 'info')
+    def test_can_release_unknown_url(self, logging_mock):
+        self.limiter.release('http://www.google.com')
+        logging_mock.assert_called_once_with('Tried to release lock to a domain that was not specified in the limiter (http://www.google.com).')
+
+    @patch.object(logging, 'info')
+    def test_can_release_url_not_acquired(self, logging_mock):
+        self.limiter.release('http://g1.globo.com/economia')
+        logging_mock.assert_called_once_with('Tried to release lock to a url that was not acquired in the limiter (http://g1.globo.com/economia).')
+
+    def test_can_acquire_and_release_asynchronously(self):
+        io_loop = IOLoop()
+
+        @gen.coroutine
+        def execute():
+            acquired = yield [self.limiter.acquire_async('http://g1.globo.com/%d' % i, io_loop) for i in range(3)]
+            leases = self.redis.zcard('leases-for-http://g1.globo.com')
+
+            yield self.limiter.release_async('http://g1.globo.com/0', io_loop)
+            other = yield self.limiter.acquire_async('http://g1.globo.com/3', io_loop)
+            unknown = yield self.limiter.acquire_async('http://www.google.com', io_loop)
+
+            raise gen.Return((acquired, leases, other, unknown))
+
+        try:
+            acquired, leases, other, unknown = io_loop.run_sync(execute, timeout=5)
+        finally:
+            self.limiter.async_client.close()
+            io_loop.close(all_fds=True)
+
+        expect(acquired).to_equal([True, True, False])
+        expect(leases).to_equal(2)
+        expect(other).to_be_true()
+        expect(unknown).to_be_true()
+        expect(self.limiter.leases).to_include('http://g1.globo.com/3')
+        expect(self.limiter.leases).not_to_include('http://g1.globo.com/0')
+
+    @patch.object(logging, 'warning')
+    def test_acquiring_asynchronously_fails_with_wrong_password(self, logging_mock):
+        limiter = AtomicRedisLimiter({'http://g1.globo.com': 2}, redis=redis.Redis(port=7575, password='wrong'))
+        io_loop = IOLoop()
+
+        @gen.coroutine
+        def execute():
+            yield limiter.acquire_async('http://g1.globo.com/', io_loop)
+
+        self.redis.config_set('requirepass', 'secret')
+        try:
+            io_loop.run_sync(execute, timeout=5)
+        except RedisError as err:
+            expect(str(err)).to_include('password')
+        else:
+            assert False, "Should not have gotten this far"
+        finally:
+            limiter.async_client.close()
+            io_loop.close(all_fds=True)
+            redis.Redis(port=7575, password='secret').config_set('requirepass', '')
+
+        expect(logging_mock.call_count).to_equal(1)
+        expect(limiter.leases).to_be_empty()
+
+    def test_acquires_synchronously_when_async_client_cant_connect(self):
+        io_loop = IOLoop()
+
+        @gen.coroutine
+        def execute():
+            acquired = yield self.limiter.acquire_async('http://globoesporte.globo.com/a', io_loop)
+            other = yield self.limiter.acquire_async('http://globoesporte.globo.com/b', io_loop)
+            yield self.limiter.release_async('http://globoesporte.globo.com/a', io_loop)
+            raise gen.Return((acquired, other))
+
+        with patch('octopus.limiter.redis.atomic.AsyncRedisClient.from_connection', return_value=None):
+            try:
+                acquired, other = io_loop.run_sync(execute, timeout=5)
+            finally:
+                io_loop.close(all_fds=True)
+
+        expect(acquired).to_be_true()
+        expect(other).to_be_false()
+        expect(self.limiter.async_client).to_be_null()
+        expect(self.redis.zcard('leases-for-http://globoesporte.globo.com')).to_equal(0)
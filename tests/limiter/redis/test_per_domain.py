@@ -45,6 +45,18 @@ class TestPerDomain(TestCase):
         finally:
             self.limiter.release('http://g1.globo.com')
 
+    def test_can_get_available_locks(self):
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(10)
+
+        self.limiter.acquire('http://g1.globo.com/')
+
+        try:
+            expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(9)
+        finally:
+            self.limiter.release('http://g1.globo.com/')
+
+        expect(self.limiter.get_available_locks('http://www.google.com')).to_be_null()
+
     def test_acquiring_internal_url_gets_proper_domain(self):
         url = 'http://g1.globo.com/economia/'
         expect(self.limiter.acquire(url)).to_be_true()
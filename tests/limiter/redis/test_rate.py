@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+
+from preggy import expect
+
+from octopus.limiter.redis.rate import Limiter as RateRedisLimiter
+from tests import TestCase
+
+
+class TestRate(TestCase):
+    def setUp(self):
+        super(TestRate, self).setUp()
+        self.limiter = RateRedisLimiter(
+            {'http://g1.globo.com': {'requests': 2, 'per_seconds': 0.1}},
+            {'http://globoesporte.globo.com': 1},
+            redis=self.redis
+        )
+
+    def test_can_create_limiter(self):
+        expect(self.limiter.redis).to_equal(self.redis)
+        expect(self.limiter.prefix).to_equal('rate-for')
+        expect(self.limiter.releases_locally).to_be_false()
+
+    def test_cant_create_limiter_without_redis(self):
+        try:
+            RateRedisLimiter()
+        except RuntimeError:
+            err = sys.exc_info()[1]
+            expect(err).to_have_an_error_message_of('You must specify a connection to redis in order to use Redis Limiter.')
+        else:
+            assert False, "Should not have gotten this far"
+
+    def test_can_acquire_up_to_burst(self):
+        expect(self.limiter.acquire('http://g1.globo.com/economia')).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/politica')).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/')).to_be_false()
+
+        expect(self.redis.exists('rate-for-http://g1.globo.com')).to_be_true()
+        expect(self.redis.pttl('rate-for-http://g1.globo.com')).to_be_greater_than(0)
+
+    def test_tokens_are_shared_between_limiters(self):
+        other_limiter = RateRedisLimiter({'http://globoesporte.globo.com': 1}, redis=self.redis)
+
+        expect(other_limiter.acquire('http://globoesporte.globo.com/')).to_be_true()
+        expect(self.limiter.acquire('http://globoesporte.globo.com/')).to_be_false()
+
+    def test_tokens_are_refilled_with_time(self):
+        self.limiter.acquire('http://g1.globo.com/')
+        self.limiter.acquire('http://g1.globo.com/')
+
+        time.sleep(0.06)
+
+        expect(self.limiter.acquire('http://g1.globo.com/')).to_be_true()
+        expect(self.limiter.acquire('http://g1.globo.com/')).to_be_false()
+
+    def test_can_get_retry_delay(self):
+        expect(self.limiter.get_retry_delay('http://globoesporte.globo.com/')).to_equal(0)
+
+        self.limiter.acquire('http://globoesporte.globo.com/')
+
+        delay = self.limiter.get_retry_delay('http://globoesporte.globo.com/')
+        expect(delay).to_be_greater_than(0.9)
+        expect(delay).to_be_lesser_or_equal_to(1)
+
+    def test_can_get_available_locks(self):
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(2)
+
+        self.limiter.acquire('http://g1.globo.com/')
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(1)
+
+        self.limiter.acquire('http://g1.globo.com/')
+        expect(self.limiter.get_available_locks('http://g1.globo.com/')).to_equal(0)
+
+        expect(self.limiter.get_available_locks('http://www.google.com')).to_be_null()
+
+    def test_can_acquire_from_unknown_domain_url(self):
+        expect(self.limiter.acquire('http://www.google.com')).to_be_true()
+        expect(self.limiter.get_retry_delay('http://www.google.com')).to_equal(0)
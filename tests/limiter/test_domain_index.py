@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from preggy import expect
+
+from octopus.limiter.domain_index import DomainIndex
+from tests import TestCase
+
+
+class TestDomainIndex(TestCase):
+    def test_can_create_index(self):
+        index = DomainIndex([
+            {'http://g1.globo.com': 10, 'http://globo.com': 5},
+            {'http://globoesporte.globo.com': 10}
+        ])
+
+        expect(index).to_length(3)
+        expect(index.lengths).to_equal([16, 19, 29])
+
+    def test_can_get_domain_and_limit(self):
+        index = DomainIndex([{'http://g1.globo.com': 10}, {'http://globoesporte.globo.com': 20}])
+
+        expect(index.get('http://g1.globo.com/economia/')).to_equal(('http://g1.globo.com', 10))
+        expect(index.get('http://globoesporte.globo.com')).to_equal(('http://globoesporte.globo.com', 20))
+
+    def test_returns_none_for_unknown_urls(self):
+        index = DomainIndex([{'http://g1.globo.com': 10}])
+
+        expect(index.get('http://www.google.com')).to_equal((None, 0))
+        expect(index.get('http://g1')).to_equal((None, 0))
+
+    def test_urls_defined_first_take_precedence(self):
+        index = DomainIndex([
+            {'http://g1.globo.com/economia': 2},
+            {'http://g1.globo.com': 10},
+            {'http://g1.globo.com/economia/agronegocios': 1},
+            {'http://g1.globo.com': 20},
+        ])
+
+        expect(index.get('http://g1.globo.com/economia/agronegocios/')).to_equal(('http://g1.globo.com/economia', 2))
+        expect(index.get('http://g1.globo.com/politica/')).to_equal(('http://g1.globo.com', 10))
+
+    def test_matches_the_same_prefixes_as_a_linear_scan(self):
+        domains = [dict([('http://host%d.com/%s' % (index % 50, 'a' * (index % 7)), index)]) for index in range(500)]
+        index = DomainIndex(domains)
+
+        for url in ['http://host%d.com/%s' % (host, 'a' * size) for host in range(60) for size in range(9)]:
+            expected = (None, 0)
+            for domain in domains:
+                key, limit = list(domain.items())[0]
+                if url.startswith(key):
+                    expected = (key, limit)
+                    break
+
+            expect(index.get(url)).to_equal(expected)
@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+
+# AsyncioOctopus and its tests need python 3.7+
+if sys.version_info >= (3, 7):
+    from tests.asyncio_octopus import TestAsyncioOctopus  # NOQA
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from preggy import expect
+from mock import Mock
+
+from octopus.body import BodyReader, get_request_options, is_streaming
+from octopus.model import Response
+from tests import TestCase
+
+
+class TestBodyReader(TestCase):
+    def get_options(self, **kw):
+        options = {
+            'chunk_handler': None,
+            'max_body_size_in_bytes': None,
+            'abort_large_bodies': False,
+            'headers_only': False
+        }
+        options.update(kw)
+        return options
+
+    def get_response(self):
+        return Response(
+            url='http://www.google.com', status_code=200, headers={}, cookies={},
+            text=None, effective_url='http://www.google.com', error=None, request_time=0.1
+        )
+
+    def test_can_tell_streaming_requests(self):
+        expect(is_streaming({})).to_be_false()
+        expect(is_streaming({'chunk_handler': None})).to_be_false()
+        expect(is_streaming({'chunk_handler': Mock()})).to_be_true()
+
+    def test_can_get_request_options(self):
+        engine = Mock(max_body_size_in_bytes=10, abort_large_bodies=False, headers_only=False, chunk_handler=None)
+
+        options, request_kw = get_request_options(engine, {'headers': {'a': 'b'}, 'headers_only': True})
+
+        expect(options).to_equal(self.get_options(max_body_size_in_bytes=10, headers_only=True))
+        expect(request_kw).to_equal({'headers': {'a': 'b'}})
+
+    def test_bodies_are_read_at_once_by_default(self):
+        expect(BodyReader.create('http://www.google.com', self.get_options())).to_be_null()
+        expect(BodyReader.create('http://www.google.com', self.get_options(headers_only=True))).not_to_be_null()
+
+    def test_can_read_whole_body(self):
+        reader = BodyReader('http://www.google.com', max_body_size_in_bytes=10)
+
+        expect(reader.write(b'12345')).to_be_true()
+        expect(reader.write(b'')).to_be_true()
+        expect(reader.write(b'67890')).to_be_true()
+
+        expect(reader.get_content()).to_equal(b'1234567890')
+        expect(reader.truncated).to_be_false()
+        expect(reader.complete).to_be_true()
+
+    def test_truncates_large_bodies(self):
+        reader = BodyReader('http://www.google.com', max_body_size_in_bytes=7)
+        response = self.get_response()
+
+        expect(reader.write(b'12345')).to_be_true()
+        expect(reader.write(b'67890')).to_be_false()
+        expect(reader.write(b'abcde')).to_be_false()
+        reader.update(response)
+
+        expect(reader.get_content()).to_equal(b'1234567')
+        expect(reader.complete).to_be_false()
+        expect(response.truncated).to_be_true()
+        expect(response.error).to_be_null()
+
+    def test_can_abort_large_bodies(self):
+        reader = BodyReader('http://www.google.com', max_body_size_in_bytes=7, abort_large_bodies=True)
+        response = self.get_response()
+
+        reader.write(b'12345')
+        expect(reader.write(b'67890')).to_be_false()
+        reader.update(response)
+
+        expect(reader.get_content()).to_be_null()
+        expect(response.truncated).to_be_true()
+        expect(response.error).to_equal('Response body for http://www.google.com is larger than 7 bytes.')
+
+    def test_can_read_headers_only(self):
+        reader = BodyReader('http://www.google.com', headers_only=True)
+        response = self.get_response()
+
+        expect(reader.write(b'12345')).to_be_false()
+        reader.update(response)
+
+        expect(reader.get_content()).to_be_null()
+        expect(response.headers_only).to_be_true()
+        expect(response.truncated).to_be_false()
+
+    def test_gives_chunks_to_chunk_handler(self):
+        chunk_handler = Mock()
+        reader = BodyReader('http://www.google.com', chunk_handler=chunk_handler, max_body_size_in_bytes=7)
+
+        reader.write(b'12345')
+        reader.write(b'67890')
+
+        expect(chunk_handler.call_count).to_equal(2)
+        chunk_handler.assert_called_with('http://www.google.com', b'67')
+        expect(reader.get_content()).to_be_null()
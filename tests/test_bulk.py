@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+
+from preggy import expect
+from mock import Mock, patch
+from six import StringIO
+
+from octopus.bulk import get_cached_responses, get_request, iter_batches, read_requests
+from tests import TestCase
+
+
+class TestReadRequests(TestCase):
+    def test_can_read_requests(self):
+        lines = StringIO(
+            '{"url": "http://www.globo.com"}\n'
+            '\n'
+            '{"url": "http://www.google.com", "method": "POST", "headers": {"a": "b"}, "body": "c=d", "priority": 2}\n'
+            '"http://www.yahoo.com"\n'
+        )
+
+        requests = list(read_requests(lines))
+
+        expect(requests).to_equal([
+            {'url': 'http://www.globo.com', 'method': 'GET', 'headers': {}, 'body': None},
+            {'url': 'http://www.google.com', 'method': 'POST', 'headers': {'a': 'b'}, 'body': 'c=d', 'priority': 2},
+            {'url': 'http://www.yahoo.com', 'method': 'GET', 'headers': {}, 'body': None},
+        ])
+
+    def test_can_read_requests_from_path(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'requests.jsonl')
+        with open(path, 'w') as requests_file:
+            requests_file.write('{"url": "http://www.globo.com"}\n{"url": "http://www.google.com"}\n')
+
+        try:
+            requests = read_requests(path)
+            expect(next(requests)['url']).to_equal('http://www.globo.com')
+            expect(next(requests)['url']).to_equal('http://www.google.com')
+            expect(list(requests)).to_be_empty()
+        finally:
+            shutil.rmtree(directory)
+
+    @patch.object(logging, 'warning')
+    def test_skips_invalid_requests(self, logging_mock):
+        lines = StringIO('{"url": \n{"method": "GET"}\n{"url": "http://www.globo.com"}\n')
+
+        requests = list(read_requests(lines))
+
+        expect(requests).to_length(1)
+        expect(logging_mock.call_count).to_equal(2)
+        logging_mock.assert_any_call('Invalid request in line 1: {"url":')
+        logging_mock.assert_any_call('Request without url in line 2: {"method": "GET"}')
+
+
+class TestBulk(TestCase):
+    def test_can_iterate_in_batches(self):
+        batches = list(iter_batches(iter(range(5)), 2))
+
+        expect(batches).to_equal([[0, 1], [2, 3], [4]])
+
+    def test_can_get_request_from_url(self):
+        request = get_request('http://www.globo.com', 'HEAD', 1, {'timeout': 2})
+
+        expect(request).to_equal(('http://www.globo.com', 'HEAD', 1, {'timeout': 2}))
+
+    def test_can_get_request_from_descriptor(self):
+        descriptor = {'url': 'http://www.globo.com', 'method': 'POST', 'headers': {'b': '2'}, 'body': 'a=b'}
+
+        request = get_request(descriptor, 'GET', 0, {'headers': {'a': '1'}}, body_argument='data')
+
+        expect(request).to_equal((
+            'http://www.globo.com', 'POST', 0,
+            {'headers': {'a': '1', 'b': '2'}, 'data': 'a=b'}
+        ))
+
+    def test_probes_cache_once_for_plain_requests(self):
+        cache = Mock(spec=['get', 'get_many'])
+        cache.get_many.return_value = {'http://www.globo.com': 'globo'}
+        cache.get.return_value = 'google'
+
+        responses = get_cached_responses(cache, [
+            ('http://www.globo.com', 'GET', 0, {}),
+            ('http://www.yahoo.com', 'GET', 0, {}),
+            ('http://www.google.com', 'GET', 0, {'headers': {'a': 'b'}}),
+            ('http://www.bing.com', 'GET', 0, {'chunk_handler': Mock()}),
+        ])
+
+        expect(responses).to_equal(['globo', None, 'google', None])
+        cache.get_many.assert_called_once_with(['http://www.globo.com', 'http://www.yahoo.com'])
+        cache.get.assert_called_once_with('http://www.google.com', method='GET', headers={'a': 'b'})
+
+    def test_probes_cache_without_get_many_for_each_request(self):
+        cache = Mock(spec=['get'])
+        cache.get.side_effect = ['globo', None]
+
+        responses = get_cached_responses(cache, [
+            ('http://www.globo.com', 'GET', 0, {}),
+            ('http://www.yahoo.com', 'POST', 0, {}),
+        ])
+
+        expect(responses).to_equal(['globo', None])
+        expect(cache.get.call_count).to_equal(2)
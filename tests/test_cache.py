@@ -4,8 +4,10 @@
 import time
 
 from preggy import expect
+from mock import Mock
 
-from octopus.cache import Cache
+from octopus.cache import Cache, HttpCache
+from octopus.model import Response
 from tests import TestCase
 
 
@@ -35,3 +37,237 @@ class TestCache(TestCase):
         cache = Cache(expiration_in_seconds=10)
         cache.put('http://www.google.com', 'response')
         expect(cache.get('http://www.google.com')).to_equal('response')
+
+    def test_can_get_many(self):
+        cache = Cache(expiration_in_seconds=10)
+        cache.put('http://www.google.com', 'google')
+        cache.put('http://www.globo.com', 'globo')
+
+        responses = cache.get_many(['http://www.google.com', 'http://www.globo.com', 'http://www.yahoo.com'])
+
+        expect(responses).to_equal({'http://www.google.com': 'google', 'http://www.globo.com': 'globo'})
+        expect(cache.hits).to_equal(2)
+        expect(cache.misses).to_equal(1)
+
+    def test_can_create_cache_with_limits(self):
+        cache = Cache(expiration_in_seconds=45, max_entries=10, max_size_in_bytes=1024)
+        expect(cache.max_entries).to_equal(10)
+        expect(cache.max_size_in_bytes).to_equal(1024)
+        expect(cache.size_in_bytes).to_equal(0)
+
+    def test_evicts_least_recently_used_when_max_entries_is_reached(self):
+        cache = Cache(expiration_in_seconds=10, max_entries=2)
+
+        cache.put('http://www.google.com', 'google')
+        cache.put('http://www.globo.com', 'globo')
+        expect(cache.get('http://www.google.com')).to_equal('google')
+
+        cache.put('http://www.yahoo.com', 'yahoo')
+
+        expect(cache).to_length(2)
+        expect(cache.get('http://www.globo.com')).to_be_null()
+        expect(cache.get('http://www.google.com')).to_equal('google')
+        expect(cache.get('http://www.yahoo.com')).to_equal('yahoo')
+        expect(cache.evictions).to_equal(1)
+
+    def test_evicts_when_max_size_is_reached(self):
+        cache = Cache(expiration_in_seconds=10, max_size_in_bytes=10)
+
+        cache.put('http://www.google.com', Mock(text='123456'))
+        cache.put('http://www.globo.com', Mock(text='1234'))
+        expect(cache.size_in_bytes).to_equal(10)
+
+        cache.put('http://www.yahoo.com', Mock(text='12'))
+
+        expect(cache.responses).not_to_include('http://www.google.com')
+        expect(cache.size_in_bytes).to_equal(6)
+        expect(cache.evictions).to_equal(1)
+
+    def test_does_not_keep_responses_larger_than_max_size(self):
+        cache = Cache(expiration_in_seconds=10, max_size_in_bytes=10)
+
+        cache.put('http://www.google.com', Mock(text='12345678901'))
+
+        expect(cache.responses).to_be_empty()
+        expect(cache.size_in_bytes).to_equal(0)
+
+    def test_putting_same_url_replaces_response(self):
+        cache = Cache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', Mock(text='123456'))
+        cache.put('http://www.google.com', Mock(text='1234'))
+
+        expect(cache).to_length(1)
+        expect(cache.size_in_bytes).to_equal(4)
+        expect(cache.get('http://www.google.com').text).to_equal('1234')
+
+    def test_expired_responses_are_swept_on_put(self):
+        cache = Cache(expiration_in_seconds=0.1)
+
+        cache.put('http://www.google.com', 'response')
+        time.sleep(0.2)
+        cache.put('http://www.globo.com', 'response')
+
+        expect(cache.responses).not_to_include('http://www.google.com')
+        expect(cache.responses).to_include('http://www.globo.com')
+        expect(cache.expirations).to_equal(1)
+
+    def test_can_get_stats(self):
+        cache = Cache(expiration_in_seconds=10, max_entries=1)
+
+        cache.put('http://www.google.com', Mock(text='123'))
+        cache.get('http://www.google.com')
+        cache.get('http://www.globo.com')
+        cache.put('http://www.globo.com', Mock(text='12'))
+
+        expect(cache.stats).to_be_like({
+            'entries': 1,
+            'size_in_bytes': 2,
+            'hits': 1,
+            'misses': 1,
+            'evictions': 1,
+            'expirations': 0,
+        })
+
+
+class TestHttpCache(TestCase):
+    def get_response(self, status_code=200, headers=None, text='body'):
+        return Response(
+            url='http://www.google.com', status_code=status_code,
+            headers=headers or {}, cookies={}, text=text,
+            effective_url='http://www.google.com', error=None,
+            request_time=0.1
+        )
+
+    def test_can_create_http_cache(self):
+        cache = HttpCache(expiration_in_seconds=45, max_entries=10)
+        expect(cache).to_be_instance_of(Cache)
+        expect(cache.expiration_in_seconds).to_equal(45)
+        expect(cache.stale_expiration_in_seconds).to_equal(3600)
+        expect(cache.stats['revalidations']).to_equal(0)
+
+    def test_keys_on_method_and_url(self):
+        cache = HttpCache(expiration_in_seconds=10)
+        response = self.get_response()
+
+        cache.put('http://www.google.com', response, method='GET')
+
+        expect(cache.get('http://www.google.com', method='GET')).to_equal(response)
+        expect(cache.get('http://www.google.com', method='POST')).to_be_null()
+
+    def test_does_not_cache_non_cacheable_methods(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(), method='POST')
+
+        expect(cache.responses).to_be_empty()
+
+    def test_does_not_cache_non_cacheable_status_codes(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(status_code=500))
+
+        expect(cache.responses).to_be_empty()
+
+    def test_keys_on_vary_headers(self):
+        cache = HttpCache(expiration_in_seconds=10)
+        response = self.get_response(headers={'Vary': 'Accept-Language'})
+
+        cache.put('http://www.google.com', response, headers={'accept-language': 'pt-BR'})
+
+        expect(cache.get('http://www.google.com', headers={'Accept-Language': 'pt-BR'})).to_equal(response)
+        expect(cache.get('http://www.google.com', headers={'Accept-Language': 'en'})).to_be_null()
+        expect(cache.get('http://www.google.com')).to_be_null()
+
+    def test_does_not_cache_vary_star(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(headers={'Vary': '*'}))
+
+        expect(cache.responses).to_be_empty()
+
+    def test_does_not_cache_no_store(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(headers={'Cache-Control': 'private, no-store'}))
+
+        expect(cache.responses).to_be_empty()
+
+    def test_honours_max_age(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(headers={'cache-control': 'max-age=0'}))
+        cache.put('http://www.globo.com', self.get_response(headers={'Cache-Control': 'max-age=60'}))
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+        expect(cache.get('http://www.globo.com')).not_to_be_null()
+
+    def test_honours_max_age_minus_age(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(headers={'Cache-Control': 'max-age=60', 'Age': '60'}))
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+
+    def test_honours_expires(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(headers={
+            'Date': 'Mon, 01 Jan 2024 10:00:00 GMT',
+            'Expires': 'Mon, 01 Jan 2024 10:00:00 GMT',
+        }))
+        cache.put('http://www.globo.com', self.get_response(headers={
+            'Date': 'Mon, 01 Jan 2024 10:00:00 GMT',
+            'Expires': 'Mon, 01 Jan 2024 11:00:00 GMT',
+        }))
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+        expect(cache.get('http://www.globo.com')).not_to_be_null()
+
+    def test_stale_responses_without_validators_are_removed(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(headers={'Cache-Control': 'no-cache'}))
+        cache.remove_expired()
+
+        expect(cache.responses).to_be_empty()
+        expect(cache.get_validators('http://www.google.com')).to_be_empty()
+
+    def test_can_get_validators_for_stale_response(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        cache.put('http://www.google.com', self.get_response(headers={
+            'Cache-Control': 'no-cache',
+            'ETag': '"123"',
+            'Last-Modified': 'Mon, 01 Jan 2024 10:00:00 GMT',
+        }))
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+        expect(cache.get_validators('http://www.google.com')).to_be_like({
+            'If-None-Match': '"123"',
+            'If-Modified-Since': 'Mon, 01 Jan 2024 10:00:00 GMT',
+        })
+
+    def test_can_refresh_stale_response(self):
+        cache = HttpCache(expiration_in_seconds=10)
+        response = self.get_response(headers={'Cache-Control': 'max-age=0', 'ETag': '"123"', 'Content-Length': '4'})
+        cache.put('http://www.google.com', response)
+
+        not_modified = self.get_response(status_code=304, text='', headers={
+            'cache-control': 'max-age=60',
+            'Content-Length': '0',
+        })
+
+        refreshed = cache.refresh('http://www.google.com', not_modified)
+
+        expect(refreshed).to_equal(response)
+        expect(refreshed.text).to_equal('body')
+        expect(refreshed.status_code).to_equal(200)
+        expect(refreshed.headers).to_be_like({'cache-control': 'max-age=60', 'ETag': '"123"', 'Content-Length': '4'})
+        expect(cache.get('http://www.google.com')).to_equal(response)
+        expect(cache.revalidations).to_equal(1)
+
+    def test_refresh_returns_none_when_not_cached(self):
+        cache = HttpCache(expiration_in_seconds=10)
+
+        expect(cache.refresh('http://www.google.com', self.get_response(status_code=304))).to_be_null()
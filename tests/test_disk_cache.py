@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import Process
+
+from preggy import expect
+
+from octopus import Octopus, TornadoOctopus
+from octopus.disk_cache import DiskCache
+from octopus.model import Response
+from tests import TestCase
+
+
+def get_response(url='http://www.google.com', text='body'):
+    return Response(
+        url=url, status_code=200,
+        headers={'Content-Type': 'text/html'}, cookies={'foo': 'bar'},
+        text=text, effective_url=url, error=None, request_time=0.5
+    )
+
+
+def put_from_other_process(path, url):
+    DiskCache(path, expiration_in_seconds=10).put(url, get_response(url=url))
+
+
+class TestDiskCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_can_create_disk_cache(self):
+        cache = DiskCache(self.path, expiration_in_seconds=45, max_entries=10, compress=True)
+
+        expect(cache.path).to_equal(self.path)
+        expect(cache.expiration_in_seconds).to_equal(45)
+        expect(cache.max_entries).to_equal(10)
+        expect(cache.compress).to_be_true()
+        expect(cache).to_length(0)
+        expect(os.path.exists(self.path)).to_be_true()
+
+    def test_get_returns_none_if_not_put(self):
+        cache = DiskCache(self.path, expiration_in_seconds=45)
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+        expect(cache.misses).to_equal(1)
+
+    def test_can_get_after_put(self):
+        cache = DiskCache(self.path, expiration_in_seconds=10)
+        cache.put('http://www.google.com', get_response())
+
+        response = cache.get('http://www.google.com')
+
+        expect(response.url).to_equal('http://www.google.com')
+        expect(response.status_code).to_equal(200)
+        expect(response.headers).to_be_like({'Content-Type': 'text/html'})
+        expect(response.cookies).to_be_like({'foo': 'bar'})
+        expect(response.text).to_equal('body')
+        expect(response.request_time).to_equal(0.5)
+        expect(cache.hits).to_equal(1)
+
+    def test_can_store_compressed_responses(self):
+        cache = DiskCache(self.path, expiration_in_seconds=10, compress=True)
+        cache.put('http://www.google.com', get_response(text='body' * 1000))
+
+        expect(cache.get('http://www.google.com').text).to_equal('body' * 1000)
+        expect(cache.stats['size_in_bytes']).to_be_lesser_than(1000)
+
+    def test_get_returns_none_if_expired(self):
+        cache = DiskCache(self.path, expiration_in_seconds=0.1)
+        cache.put('http://www.google.com', get_response())
+
+        time.sleep(0.2)
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+        expect(cache).to_length(0)
+        expect(cache.expirations).to_equal(1)
+
+    def test_can_get_many(self):
+        cache = DiskCache(self.path, expiration_in_seconds=10, batch_size=2)
+        for url in ('http://www.google.com', 'http://www.globo.com', 'http://www.yahoo.com'):
+            cache.put(url, get_response(url=url, text=url))
+
+        responses = cache.get_many([
+            'http://www.google.com', 'http://www.globo.com', 'http://www.yahoo.com', 'http://www.bing.com'
+        ])
+
+        expect(responses).to_length(3)
+        expect(responses['http://www.globo.com'].text).to_equal('http://www.globo.com')
+        expect(cache.hits).to_equal(3)
+        expect(cache.misses).to_equal(1)
+
+    def test_get_many_skips_expired_responses(self):
+        cache = DiskCache(self.path, expiration_in_seconds=0.1)
+        cache.put('http://www.google.com', get_response())
+
+        time.sleep(0.2)
+
+        expect(cache.get_many(['http://www.google.com'])).to_be_empty()
+        expect(cache).to_length(0)
+        expect(cache.expirations).to_equal(1)
+
+    def test_responses_survive_restarts(self):
+        DiskCache(self.path, expiration_in_seconds=10).put('http://www.google.com', get_response())
+
+        cache = DiskCache(self.path, expiration_in_seconds=10)
+
+        expect(cache.get('http://www.google.com').text).to_equal('body')
+
+    def test_can_share_responses_between_processes(self):
+        process = Process(target=put_from_other_process, args=(self.path, 'http://www.google.com'))
+        process.start()
+        process.join()
+
+        cache = DiskCache(self.path, expiration_in_seconds=10)
+
+        expect(cache.get('http://www.google.com').url).to_equal('http://www.google.com')
+
+    def test_evicts_least_recently_used_when_max_entries_is_reached(self):
+        cache = DiskCache(self.path, expiration_in_seconds=10, max_entries=2, eviction_interval=1)
+
+        cache.put('http://www.google.com', get_response())
+        cache.put('http://www.globo.com', get_response())
+        cache.get('http://www.google.com')
+        cache.put('http://www.yahoo.com', get_response())
+
+        expect(cache).to_length(2)
+        expect(cache.get('http://www.globo.com')).to_be_null()
+        expect(cache.get('http://www.google.com')).not_to_be_null()
+        expect(cache.evictions).to_equal(1)
+
+    def test_evicts_when_max_size_is_reached(self):
+        cache = DiskCache(self.path, expiration_in_seconds=10, eviction_interval=1)
+        cache.put('http://www.google.com', get_response(text='a' * 100))
+        cache.max_size_in_bytes = cache.stats['size_in_bytes'] + 50
+
+        cache.put('http://www.globo.com', get_response(text='a' * 100))
+
+        expect(cache).to_length(1)
+        expect(cache.get('http://www.google.com')).to_be_null()
+        expect(cache.evictions).to_equal(1)
+
+    def test_evicts_expired_responses(self):
+        cache = DiskCache(self.path, expiration_in_seconds=0.1, eviction_interval=2)
+        cache.put('http://www.google.com', get_response())
+
+        time.sleep(0.2)
+        cache.put('http://www.globo.com', get_response())
+
+        expect(cache).to_length(1)
+        expect(cache.expirations).to_equal(1)
+
+    def test_can_clear(self):
+        cache = DiskCache(self.path, expiration_in_seconds=10)
+        cache.put('http://www.google.com', get_response())
+
+        cache.clear()
+
+        expect(cache).to_length(0)
+
+    def test_engines_can_use_disk_cache(self):
+        cache = DiskCache(self.path, expiration_in_seconds=10)
+        cache.put('http://www.google.com', get_response())
+        responses = []
+
+        for otto in [Octopus(cache=True, response_cache=cache), TornadoOctopus(cache=True, response_cache=cache)]:
+            expect(otto.response_cache).to_equal(cache)
+            otto.enqueue('http://www.google.com', lambda url, response: responses.append(response))
+
+        expect(responses).to_length(2)
+        expect(responses[0].text).to_equal('body')
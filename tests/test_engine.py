@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from preggy import expect
+
+from octopus.cache import Cache, HttpCache
+from octopus.engine import WaitingRequests, create_response_cache, get_retry_count, get_retry_delay
+from octopus.limiter import Limiter
+from tests import TestCase
+
+
+class TestEngine(TestCase):
+    def test_can_create_response_cache(self):
+        expect(create_response_cache(None, False, 30, None, None)).to_be_instance_of(Cache)
+        expect(create_response_cache(None, True, 30, None, None)).to_be_instance_of(HttpCache)
+
+    def test_keeps_given_response_cache(self):
+        cache = HttpCache(expiration_in_seconds=30)
+
+        expect(create_response_cache(cache, True, 30, None, None)).to_equal(cache)
+
+    def test_http_caching_needs_cache_that_can_revalidate(self):
+        cache = Cache(expiration_in_seconds=30)
+
+        with expect.error_to_happen(ValueError):
+            create_response_cache(cache, True, 30, None, None)
+
+    def test_retry_delay_defaults_to_limiter_miss_timeout(self):
+        expect(get_retry_delay(Limiter(limiter_miss_timeout_ms=200), 'http://g1.globo.com/')).to_equal(0.2)
+        expect(get_retry_delay(object(), 'http://g1.globo.com/')).to_equal(0.5)
+
+    def test_retries_at_least_one_request(self):
+        limiter = Limiter()
+        expect(get_retry_count(limiter, 'http://g1.globo.com/')).to_equal(1)
+
+        limiter.get_available_locks = lambda url: 0
+        expect(get_retry_count(limiter, 'http://g1.globo.com/')).to_equal(1)
+
+        limiter.get_available_locks = lambda url: 3
+        expect(get_retry_count(limiter, 'http://g1.globo.com/')).to_equal(3)
+
+    def test_can_take_waiting_requests(self):
+        waiting = WaitingRequests()
+        waiting.add('http://g1.globo.com', 'a', 0)
+        waiting.add('http://g1.globo.com', 'b', 0)
+        waiting.add('http://g1.globo.com', 'c', 1)
+        waiting.add('http://globoesporte.globo.com', 'd', 0)
+
+        expect(waiting.size).to_equal(4)
+        expect(waiting.take('http://g1.globo.com')).to_equal([(1, 'c')])
+        expect(waiting.take('http://g1.globo.com', 5)).to_equal([(0, 'a'), (0, 'b')])
+        expect(waiting).not_to_include('http://g1.globo.com')
+        expect(waiting.take('http://www.globo.com')).to_be_empty()
+        expect(waiting.take('http://globoesporte.globo.com', None)).to_equal([(0, 'd')])
+        expect(waiting).to_be_empty()
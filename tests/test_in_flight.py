@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from preggy import expect
+from mock import Mock, patch
+
+from octopus.in_flight import InFlightRequests, get_request_key
+from tests import TestCase
+
+
+class TestInFlightRequests(TestCase):
+    def setUp(self):
+        self.in_flight = InFlightRequests()
+
+    def test_request_key_includes_method_url_and_arguments(self):
+        key = get_request_key('http://www.globo.com', 'get', {'headers': {'b': '2', 'a': '1'}, 'timeout': 2})
+
+        expect(key).to_equal(get_request_key('http://www.globo.com', 'GET', {'timeout': 2, 'headers': {'a': '1', 'b': '2'}}))
+        expect(key).not_to_equal(get_request_key('http://www.globo.com', 'GET', {'timeout': 2}))
+        expect(key).not_to_equal(get_request_key('http://www.globo.com', 'HEAD', {'timeout': 2, 'headers': {'a': '1', 'b': '2'}}))
+
+    def test_first_request_is_not_coalesced(self):
+        handler = Mock()
+
+        wrapped_handler, coalesced = self.in_flight.attach('http://www.globo.com', handler)
+
+        expect(coalesced).to_be_false()
+        expect(self.in_flight).to_length(1)
+
+        wrapped_handler('http://www.globo.com', 'response')
+
+        handler.assert_called_once_with('http://www.globo.com', 'response')
+        expect(self.in_flight).to_length(0)
+
+    def test_identical_requests_are_coalesced(self):
+        handlers = [Mock(), Mock(), Mock()]
+
+        wrapped_handler, coalesced = self.in_flight.attach('http://www.globo.com', handlers[0])
+        expect(self.in_flight.attach('http://www.globo.com', handlers[1])).to_equal((handlers[1], True))
+        expect(self.in_flight.attach('http://www.globo.com', handlers[2])).to_equal((handlers[2], True))
+
+        wrapped_handler('http://www.globo.com', 'response')
+
+        for handler in handlers:
+            handler.assert_called_once_with('http://www.globo.com', 'response')
+
+        expect(self.in_flight.attach('http://www.globo.com', Mock())[1]).to_be_false()
+
+    def test_different_requests_are_not_coalesced(self):
+        expect(self.in_flight.attach('http://www.globo.com', Mock())[1]).to_be_false()
+        expect(self.in_flight.attach('http://g1.globo.com', Mock())[1]).to_be_false()
+        expect(self.in_flight.attach('http://www.globo.com', Mock(), kw={'headers': {'a': 'b'}})[1]).to_be_false()
+        expect(self.in_flight).to_length(3)
+
+    def test_unsafe_methods_are_not_coalesced(self):
+        handler = Mock()
+
+        expect(self.in_flight.attach('http://www.globo.com', handler, method='POST')).to_equal((handler, False))
+        expect(self.in_flight.attach('http://www.globo.com', handler, method='POST')).to_equal((handler, False))
+        expect(self.in_flight).to_length(0)
+
+    @patch.object(logging, 'exception')
+    def test_attached_handlers_are_called_even_if_others_fail(self, logging_mock):
+        handler = Mock()
+
+        wrapped_handler, coalesced = self.in_flight.attach('http://www.globo.com', Mock(side_effect=RuntimeError))
+        self.in_flight.attach('http://www.globo.com', Mock(side_effect=RuntimeError))
+        self.in_flight.attach('http://www.globo.com', handler)
+
+        try:
+            wrapped_handler('http://www.globo.com', 'response')
+        except RuntimeError:
+            pass
+        else:
+            assert False, "Should not have gotten this far"
+
+        handler.assert_called_once_with('http://www.globo.com', 'response')
+        logging_mock.assert_called_once_with('Error calling callback for http://www.globo.com.')
+
+    def test_can_detach_request_nobody_else_waits_for(self):
+        self.in_flight.attach('http://www.globo.com', Mock())
+
+        expect(self.in_flight.detach('http://www.globo.com')).to_be_true()
+        expect(self.in_flight).to_length(0)
+
+    def test_can_not_detach_request_others_wait_for(self):
+        self.in_flight.attach('http://www.globo.com', Mock())
+        self.in_flight.attach('http://www.globo.com', Mock())
+
+        expect(self.in_flight.detach('http://www.globo.com')).to_be_false()
+        expect(self.in_flight).to_length(1)
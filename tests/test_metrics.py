@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from preggy import expect
+from mock import Mock
+from six.moves.urllib.request import urlopen
+
+from octopus.metrics import Metrics
+from tests import TestCase
+
+
+class TestMetrics(TestCase):
+    def get_response(self, status_code=200, request_time=0.2):
+        return Mock(status_code=status_code, request_time=request_time)
+
+    def test_can_create_metrics(self):
+        metrics = Metrics()
+
+        snapshot = metrics.snapshot()
+
+        expect(snapshot['requests']).to_equal(0)
+        expect(snapshot['in_flight']).to_equal(0)
+        expect(snapshot['responses']).to_be_empty()
+        expect(snapshot['latency']).to_be_empty()
+
+    def test_counts_requests_and_responses(self):
+        metrics = Metrics()
+
+        metrics.start_request()
+        metrics.start_request()
+        metrics.start_request()
+        metrics.end_request('http://www.globo.com/a', self.get_response(200))
+        metrics.end_request('http://www.globo.com/b', self.get_response(404))
+        metrics.record_timeout()
+        metrics.record_error()
+
+        snapshot = metrics.snapshot()
+
+        expect(snapshot['requests']).to_equal(3)
+        expect(snapshot['in_flight']).to_equal(1)
+        expect(snapshot['responses']).to_equal({'2xx': 1, '4xx': 1})
+        expect(snapshot['timeouts']).to_equal(1)
+        expect(snapshot['errors']).to_equal(1)
+
+    def test_keeps_latency_histogram_per_domain(self):
+        metrics = Metrics(latency_buckets=(0.1, 1))
+
+        metrics.start_request()
+        metrics.start_request()
+        metrics.start_request()
+        metrics.end_request('http://www.globo.com/a', self.get_response(request_time=0.05))
+        metrics.end_request('http://www.globo.com/b', self.get_response(request_time=2))
+        metrics.end_request('http://g1.globo.com/', self.get_response(request_time=0.5))
+
+        latency = metrics.snapshot()['latency']
+
+        expect(latency['www.globo.com']['buckets']).to_equal([(0.1, 1), (1, 1), (float('inf'), 2)])
+        expect(latency['www.globo.com']['count']).to_equal(2)
+        expect(latency['www.globo.com']['sum']).to_equal(2.05)
+        expect(latency['g1.globo.com']['buckets']).to_equal([(0.1, 0), (1, 1), (float('inf'), 1)])
+
+    def test_counts_limiter_misses_per_domain(self):
+        metrics = Metrics()
+
+        metrics.record_limiter_miss('http://www.globo.com/a')
+        metrics.record_limiter_miss('http://www.globo.com/b')
+        metrics.record_limiter_miss('http://g1.globo.com/', domain='http://g1.globo.com')
+
+        expect(metrics.snapshot()['limiter_misses']).to_equal({'www.globo.com': 2, 'http://g1.globo.com': 1})
+
+    def test_groups_domains_after_max_domains(self):
+        metrics = Metrics(max_domains=1)
+
+        metrics.record_limiter_miss('http://www.globo.com/')
+        metrics.record_limiter_miss('http://g1.globo.com/')
+        metrics.record_limiter_miss('http://www.globo.com/')
+        metrics.start_request()
+        metrics.start_request()
+        metrics.end_request('http://www.globo.com/', self.get_response())
+        metrics.end_request('http://g1.globo.com/', self.get_response())
+
+        snapshot = metrics.snapshot()
+
+        expect(snapshot['limiter_misses']).to_equal({'www.globo.com': 2, 'other': 1})
+        expect(sorted(snapshot['latency'].keys())).to_equal(['other', 'www.globo.com'])
+
+    def test_counts_cache_misses_only_for_requests_made(self):
+        metrics = Metrics()
+
+        metrics.record_cache_hit()
+        metrics.start_request(cache_miss=True)
+        metrics.start_request()
+
+        snapshot = metrics.snapshot()
+
+        expect(snapshot['cache_hits']).to_equal(1)
+        expect(snapshot['cache_misses']).to_equal(1)
+        expect(snapshot['requests']).to_equal(2)
+
+    def test_adds_up_queue_size_of_watched_engines(self):
+        metrics = Metrics()
+        engine = Mock(queue_size=3)
+        other_engine = Mock(queue_size=4)
+
+        metrics.watch(engine)
+        metrics.watch(other_engine)
+
+        expect(metrics.snapshot()['queue_size']).to_equal(7)
+
+    def test_can_export_prometheus_text(self):
+        metrics = Metrics(latency_buckets=(0.5,))
+        metrics.set_gauge('queue_size', lambda: 4)
+
+        metrics.start_request()
+        metrics.end_request('http://www.globo.com/', self.get_response(request_time=0.25))
+        metrics.record_limiter_miss('http://www.globo.com/', domain='say "hi"')
+
+        text = metrics.to_prometheus()
+
+        expect(text).to_include('# TYPE octopus_requests_total counter\noctopus_requests_total 1\n')
+        expect(text).to_include('# TYPE octopus_queue_size gauge\noctopus_queue_size 4\n')
+        expect(text).to_include('octopus_responses_total{status_class="2xx"} 1\n')
+        expect(text).to_include('octopus_limiter_misses_total{domain="say \\"hi\\""} 1\n')
+        expect(text).to_include('# TYPE octopus_request_duration_seconds histogram\n')
+        expect(text).to_include('octopus_request_duration_seconds_bucket{domain="www.globo.com",le="0.5"} 1\n')
+        expect(text).to_include('octopus_request_duration_seconds_bucket{domain="www.globo.com",le="+Inf"} 1\n')
+        expect(text).to_include('octopus_request_duration_seconds_sum{domain="www.globo.com"} 0.25\n')
+        expect(text).to_include('octopus_request_duration_seconds_count{domain="www.globo.com"} 1\n')
+        expect(text).to_include('octopus_cache_hits_total 0\n')
+
+    def test_can_serve_metrics(self):
+        metrics = Metrics()
+        metrics.start_request()
+
+        server = metrics.serve(port=0)
+        try:
+            response = urlopen('http://127.0.0.1:%d/metrics' % server.server_address[1], timeout=5)
+            text = response.read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        expect(response.headers['Content-Type']).to_include('text/plain')
+        expect(text).to_include('octopus_requests_total 1\n')
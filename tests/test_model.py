@@ -36,3 +36,44 @@ class TestResponseModel(TestCase):
         expect(response.effective_url).to_equal('http://www.google.com/')
         expect(response.error).to_equal('some error message')
         expect(response.request_time).to_equal(10.24)
+
+    def get_lazy_response(self, **kw):
+        return Response(
+            url='http://www.google.com', status_code=200,
+            headers=kw.get('headers'), cookies=kw.get('cookies'),
+            text=None, effective_url='http://www.google.com/',
+            error=None, request_time=0.1,
+            content=kw.get('content', b'caf\xc3\xa9'), encoding=kw.get('encoding')
+        )
+
+    def test_response_has_no_dict(self):
+        response = self.get_lazy_response()
+
+        expect(hasattr(response, '__dict__')).to_be_false()
+
+    def test_decodes_text_when_first_accessed(self):
+        response = self.get_lazy_response()
+
+        expect(response._text).to_be_null()
+        expect(response.text).to_equal(u'caf\xe9')
+        expect(response._text).to_equal(u'caf\xe9')
+
+    def test_decodes_text_with_response_encoding(self):
+        expect(self.get_lazy_response(content=b'caf\xe9', encoding='iso-8859-1').text).to_equal(u'caf\xe9')
+        expect(self.get_lazy_response(content=b'caf\xe9', encoding='unknown').text).to_equal(u'caf\ufffd')
+
+    def test_text_is_none_without_body(self):
+        expect(self.get_lazy_response(content=None).text).to_be_null()
+
+    def test_converts_headers_and_cookies_when_first_accessed(self):
+        class Headers(object):
+            def items(self):
+                return [('Content-Type', 'text/html')]
+
+        response = self.get_lazy_response(headers=Headers(), cookies=lambda: {'foo': 'bar'})
+
+        expect(response.headers).to_equal({'Content-Type': 'text/html'})
+        expect(response.cookies).to_equal({'foo': 'bar'})
+        expect(response.headers is response.headers).to_be_true()
+        expect(self.get_lazy_response().headers).to_equal({})
+
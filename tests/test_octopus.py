@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import logging
 import sys
+import time
+from threading import Thread, Timer
 
+import requests
 from preggy import expect
-from mock import Mock
+from mock import Mock, patch
 
 from octopus import Octopus, TimeoutError
+from octopus.cache import HttpCache
+from octopus.disk_cache import DiskCache
 from tests import TestCase
 
 
@@ -21,6 +27,71 @@ class TestOctopus(TestCase):
         expect(otto.auto_start).to_be_false()
         expect(otto.cache).to_be_false()
 
+    def test_can_create_octopus_with_connection_pool(self):
+        otto = Octopus(concurrency=20)
+
+        expect(otto.allow_connection_reuse).to_be_true()
+        expect(otto.connection_pool_size).to_equal(20)
+        expect(otto.connection_pool_sizes).to_be_empty()
+        expect(otto.max_pooled_hosts).to_equal(10)
+        expect(otto.connection_adapters).to_length(2)
+
+    def test_can_create_octopus_with_per_host_pool_sizes(self):
+        otto = Octopus(
+            connection_pool_size=5,
+            connection_pool_sizes={'http://www.globo.com': 50}
+        )
+
+        adapters = dict(otto.connection_adapters)
+        expect(adapters).to_length(3)
+        expect(adapters['http://www.globo.com']._pool_maxsize).to_equal(50)
+        expect(adapters['http://']._pool_maxsize).to_equal(5)
+        expect(adapters['https://']).to_equal(adapters['http://'])
+
+    def test_can_create_octopus_without_connection_reuse(self):
+        otto = Octopus(allow_connection_reuse=False)
+
+        expect(otto.allow_connection_reuse).to_be_false()
+        expect(otto.connection_adapters).to_be_null()
+
+    def test_session_is_kept_per_thread(self):
+        otto = Octopus()
+        sessions = []
+
+        session = otto.get_session()
+        expect(otto.get_session()).to_equal(session)
+
+        thread = Thread(target=lambda: sessions.append(otto.get_session()))
+        thread.start()
+        thread.join()
+
+        expect(sessions).to_length(1)
+        expect(sessions[0]).not_to_equal(session)
+        expect(sessions[0].get_adapter('http://www.globo.com')).to_equal(session.get_adapter('http://www.globo.com'))
+
+    @patch.object(requests, 'request')
+    def test_request_uses_new_connection_when_reuse_is_disabled(self, request_mock):
+        otto = Octopus(allow_connection_reuse=False)
+
+        otto.request('GET', 'http://www.globo.com', timeout=2)
+
+        request_mock.assert_called_once_with('GET', 'http://www.globo.com', timeout=2)
+
+    def test_request_uses_thread_session(self):
+        otto = Octopus()
+        session = Mock()
+        otto.sessions.session = session
+
+        otto.request('GET', 'http://www.globo.com', timeout=2)
+
+        session.request.assert_called_once_with('GET', 'http://www.globo.com', timeout=2)
+
+    def test_can_create_octopus_with_size_capped_cache(self):
+        otto = Octopus(cache=True, cache_max_entries=100, cache_max_size_in_bytes=1024)
+
+        expect(otto.response_cache.max_entries).to_equal(100)
+        expect(otto.response_cache.max_size_in_bytes).to_equal(1024)
+
     def test_has_default_concurrency(self):
         otto = Octopus()
         expect(otto.concurrency).to_equal(10)
@@ -195,3 +266,393 @@ class TestOctopus(TestCase):
 
         expect(self.response.text).to_include('Connection to baidu.com timed out')
         expect(self.response.error).to_include('Connection to baidu.com timed out. (connect timeout=0.1)')
+
+    def get_requests_response(self, status_code=200, headers=None, text='body'):
+        return Mock(
+            status_code=status_code, headers=headers or {}, cookies={},
+            text=text, content=text.encode('utf-8'), encoding='utf-8',
+            url='http://www.globo.com/', elapsed=None
+        )
+
+    def test_can_create_octopus_with_http_caching(self):
+        otto = Octopus(cache=True, http_caching=True)
+
+        expect(otto.http_caching).to_be_true()
+        expect(otto.response_cache).to_be_instance_of(HttpCache)
+
+    def test_http_caching_needs_cache_that_can_revalidate(self):
+        cache = DiskCache(':memory:', expiration_in_seconds=30)
+
+        with self.assertRaises(ValueError):
+            Octopus(cache=True, http_caching=True, response_cache=cache)
+
+    def test_revalidates_stale_responses(self):
+        url = 'http://www.globo.com'
+        otto = Octopus(concurrency=1, cache=True, http_caching=True)
+        otto.request = Mock(side_effect=[
+            self.get_requests_response(headers={'Cache-Control': 'max-age=0', 'ETag': '"v1"'}),
+            self.get_requests_response(status_code=304, text='', headers={'Cache-Control': 'max-age=60'}),
+        ])
+
+        def handle_url_response(url, response):
+            self.responses.setdefault(url, []).append(response)
+
+        otto.start()
+
+        otto.enqueue(url, handle_url_response, headers={'Accept': 'text/html'})
+        otto.wait(5)
+        otto.enqueue(url, handle_url_response, headers={'Accept': 'text/html'})
+        otto.wait(5)
+        otto.enqueue(url, handle_url_response, headers={'Accept': 'text/html'})
+
+        expect(otto.request.call_count).to_equal(2)
+        otto.request.assert_called_with(
+            'GET', url, timeout=5, headers={'Accept': 'text/html', 'If-None-Match': '"v1"'}
+        )
+
+        expect(self.responses[url]).to_length(3)
+        for response in self.responses[url]:
+            expect(response.status_code).to_equal(200)
+            expect(response.text).to_equal('body')
+
+    def test_urls_are_retrieved_in_order_of_priority(self):
+        otto = Octopus(concurrency=1)
+        otto.request = Mock(return_value=self.get_requests_response())
+        urls = []
+
+        otto.enqueue('http://www.globo.com/1', lambda url, response: urls.append(url))
+        otto.enqueue('http://www.globo.com/2', lambda url, response: urls.append(url))
+        otto.enqueue('http://www.globo.com/urgent', lambda url, response: urls.append(url), priority=10)
+        otto.enqueue('http://www.globo.com/3', lambda url, response: urls.append(url))
+
+        otto.start()
+        otto.wait(5)
+
+        expect(urls).to_equal([
+            'http://www.globo.com/urgent', 'http://www.globo.com/1',
+            'http://www.globo.com/2', 'http://www.globo.com/3'
+        ])
+
+    def test_coalesces_identical_requests(self):
+        url = 'http://www.globo.com'
+        otto = Octopus(concurrency=1, coalesce_requests=True)
+        otto.request = Mock(return_value=self.get_requests_response())
+
+        def handle_url_response(url, response):
+            self.responses.setdefault(url, []).append(response)
+
+        for i in range(10):
+            otto.enqueue(url, handle_url_response)
+
+        expect(otto.queue_size).to_equal(1)
+
+        otto.start()
+        otto.wait(5)
+
+        expect(otto.request.call_count).to_equal(1)
+        expect(self.responses[url]).to_length(10)
+        expect(otto.in_flight).to_length(0)
+
+    def test_can_stream_response_body_to_chunk_handler(self):
+        url = 'http://www.globo.com'
+        otto = Octopus(concurrency=1, cache=True, chunk_size_in_bytes=2)
+        response = self.get_requests_response(headers={'Content-Type': 'text/plain'})
+        response.iter_content.return_value = iter(['bo', '', 'dy'])
+        otto.request = Mock(return_value=response)
+        chunks = []
+
+        def handle_url_response(url, response):
+            self.response = response
+
+        otto.enqueue(url, handle_url_response, chunk_handler=lambda url, chunk: chunks.append(chunk))
+        otto.start()
+        otto.wait(5)
+
+        expect(chunks).to_equal(['bo', 'dy'])
+        response.iter_content.assert_called_once_with(chunk_size=2)
+        otto.request.assert_called_once_with('GET', url, timeout=5, stream=True)
+
+        expect(self.response.status_code).to_equal(200)
+        expect(self.response.headers).to_equal({'Content-Type': 'text/plain'})
+        expect(self.response.text).to_be_null()
+        expect(otto.response_cache.get(url)).to_be_null()
+
+    def test_response_body_is_decoded_only_when_accessed(self):
+        otto = Octopus()
+        requests_response = self.get_requests_response(status_code=200, headers={'Content-Type': 'text/html'})
+        del requests_response.text
+
+        response = otto.from_requests_response('http://www.globo.com', requests_response)
+
+        expect(response.content).to_equal(b'body')
+        expect(response.error).to_be_null()
+        expect(response.headers).to_equal({'Content-Type': 'text/html'})
+        expect(response.text).to_equal('body')
+
+    def test_can_limit_response_body_size(self):
+        url = 'http://www.globo.com'
+        otto = Octopus(concurrency=1, cache=True, max_body_size_in_bytes=5)
+        response = self.get_requests_response()
+        response.iter_content.return_value = iter([b'1234', b'5678', b'90'])
+        otto.request = Mock(return_value=response)
+
+        def handle_url_response(url, response):
+            self.response = response
+
+        otto.enqueue(url, handle_url_response)
+        otto.start()
+        otto.wait(5)
+
+        otto.request.assert_called_once_with('GET', url, timeout=5, stream=True)
+        expect(self.response.content).to_equal(b'12345')
+        expect(self.response.truncated).to_be_true()
+        expect(self.response.error).to_be_null()
+        expect(otto.response_cache.get(url)).to_be_null()
+
+    def test_can_abort_large_response_bodies_per_request(self):
+        url = 'http://www.globo.com'
+        otto = Octopus(concurrency=1)
+        response = self.get_requests_response()
+        response.iter_content.return_value = iter([b'1234', b'5678', b'90'])
+        otto.request = Mock(return_value=response)
+
+        def handle_url_response(url, response):
+            self.response = response
+
+        otto.enqueue(url, handle_url_response, max_body_size_in_bytes=5, abort_large_bodies=True)
+        otto.start()
+        otto.wait(5)
+
+        expect(self.response.status_code).to_equal(200)
+        expect(self.response.text).to_be_null()
+        expect(self.response.truncated).to_be_true()
+        expect(self.response.error).to_equal('Response body for http://www.globo.com is larger than 5 bytes.')
+
+    def test_can_fetch_headers_only(self):
+        url = 'http://www.globo.com'
+        otto = Octopus(concurrency=1)
+        response = self.get_requests_response(headers={'Content-Length': '1000'})
+        otto.request = Mock(return_value=response)
+
+        def handle_url_response(url, response):
+            self.response = response
+
+        otto.enqueue(url, handle_url_response, headers_only=True)
+        otto.start()
+        otto.wait(5)
+
+        expect(response.iter_content.called).to_be_false()
+        response.close.assert_called_once_with()
+        expect(self.response.headers).to_equal({'Content-Length': '1000'})
+        expect(self.response.text).to_be_null()
+        expect(self.response.headers_only).to_be_true()
+
+
+    def test_can_iterate_over_completed_responses(self):
+        otto = Octopus(concurrency=2, auto_start=True)
+        otto.request = Mock(side_effect=lambda method, url, **kw: self.get_requests_response())
+        urls = ['http://www.globo.com/%d' % index for index in range(5)]
+
+        responses = dict(otto.as_completed(urls, timeout=5))
+
+        expect(sorted(responses.keys())).to_equal(urls)
+        for response in responses.values():
+            expect(response.status_code).to_equal(200)
+            expect(response.text).to_equal('body')
+        expect(otto.is_empty).to_be_true()
+
+    def test_as_completed_only_enqueues_urls_as_responses_are_consumed(self):
+        otto = Octopus(concurrency=4, auto_start=True)
+        otto.request = Mock(side_effect=lambda method, url, **kw: self.get_requests_response())
+        taken = []
+
+        def get_urls():
+            for index in range(10):
+                taken.append(index)
+                yield 'http://www.globo.com/%d' % index
+
+        count = 0
+        for index, (url, response) in enumerate(otto.as_completed(get_urls(), timeout=5, max_pending_responses=2)):
+            # the response being consumed plus at most 2 pending ones
+            expect(len(taken)).to_be_lesser_or_equal_to(index + 3)
+            count += 1
+
+        expect(count).to_equal(10)
+
+    def test_as_completed_yields_cached_responses_without_fetching(self):
+        otto = Octopus(cache=True)
+        urls = ['http://www.globo.com/%d' % index for index in range(5)]
+        for url in urls:
+            otto.response_cache.put(url, otto.from_requests_response(url, self.get_requests_response()))
+
+        responses = list(otto.as_completed(urls, timeout=1, max_pending_responses=1))
+
+        expect([url for url, response in responses]).to_equal(urls)
+
+    def test_as_completed_times_out(self):
+        otto = Octopus()
+
+        responses = otto.as_completed(['http://www.globo.com'], timeout=0.1)
+
+        with self.assertRaises(TimeoutError):
+            next(responses)
+
+    def test_can_create_octopus_with_max_queue_size(self):
+        otto = Octopus(max_queue_size=100, enqueue_timeout_in_seconds=2)
+
+        expect(otto.max_queue_size).to_equal(100)
+        expect(otto.enqueue_timeout_in_seconds).to_equal(2)
+        expect(otto.url_queue.maxsize).to_equal(100)
+
+    def test_enqueue_rejects_urls_when_queue_is_full(self):
+        otto = Octopus(max_queue_size=2, enqueue_timeout_in_seconds=0)
+
+        expect(otto.enqueue('http://www.globo.com/1', Mock())).to_be_true()
+        expect(otto.enqueue('http://www.globo.com/2', Mock())).to_be_true()
+        expect(otto.enqueue('http://www.globo.com/3', Mock())).to_be_false()
+
+        expect(otto.queue_size).to_equal(2)
+
+    def test_enqueue_times_out_when_queue_stays_full(self):
+        otto = Octopus(max_queue_size=1, enqueue_timeout_in_seconds=0.1)
+        otto.enqueue('http://www.globo.com/1', Mock())
+
+        started = time.time()
+        expect(otto.enqueue('http://www.globo.com/2', Mock())).to_be_false()
+
+        expect(time.time() - started).to_be_greater_or_equal_to(0.1)
+
+    def test_enqueue_waits_for_room_in_queue(self):
+        otto = Octopus(concurrency=1, max_queue_size=1)
+        otto.request = Mock(side_effect=lambda method, url, **kw: self.get_requests_response())
+
+        def handle_url_response(url, response):
+            self.responses[url] = response
+
+        otto.enqueue('http://www.globo.com/1', handle_url_response)
+
+        timer = Timer(0.1, otto.start)
+        timer.start()
+
+        expect(otto.enqueue('http://www.globo.com/2', handle_url_response)).to_be_true()
+        otto.wait(5)
+
+        expect(self.responses).to_length(2)
+
+    def test_handlers_can_enqueue_urls_when_queue_is_full(self):
+        otto = Octopus(concurrency=1, max_queue_size=1, enqueue_timeout_in_seconds=0)
+        otto.request = Mock(side_effect=lambda method, url, **kw: self.get_requests_response())
+
+        def handle_url_response(url, response):
+            self.responses[url] = response
+
+            if url == 'http://www.globo.com/':
+                for index in range(3):
+                    expect(otto.enqueue('http://www.globo.com/%d' % index, handle_url_response)).to_be_true()
+
+        otto.enqueue('http://www.globo.com/', handle_url_response)
+        otto.start()
+        otto.wait(5)
+
+        expect(self.responses).to_length(4)
+
+    def test_as_completed_enqueues_refused_urls_again(self):
+        otto = Octopus(concurrency=1, auto_start=True, max_queue_size=1, enqueue_timeout_in_seconds=0.01)
+        otto.request = Mock(side_effect=lambda method, url, **kw: self.get_requests_response())
+        urls = ['http://www.globo.com/%d' % index for index in range(5)]
+
+        responses = dict(otto.as_completed(urls, timeout=5, max_pending_responses=4))
+
+        expect(sorted(responses.keys())).to_equal(urls)
+
+    @patch.object(logging, 'info')
+    def test_as_completed_waits_for_room_in_queue(self, logging_mock):
+        otto = Octopus(concurrency=1, max_queue_size=1, enqueue_timeout_in_seconds=0)
+        otto.request = Mock(side_effect=lambda method, url, **kw: self.get_requests_response())
+        otto.enqueue('http://www.globo.com/', Mock())
+
+        timer = Timer(0.2, otto.start)
+        timer.start()
+
+        urls = ['http://www.globo.com/%d' % index for index in range(3)]
+        responses = dict(otto.as_completed(urls, timeout=5))
+
+        expect(sorted(responses.keys())).to_equal(urls)
+        full = [call for call in logging_mock.call_args_list if call[0][0].startswith('Queue is full')]
+        expect(len(full)).to_be_lesser_than(10)
+
+    def test_as_completed_times_out_when_queue_stays_full(self):
+        otto = Octopus(max_queue_size=1, enqueue_timeout_in_seconds=0)
+        otto.enqueue('http://www.globo.com/', Mock())
+
+        responses = otto.as_completed(['http://www.globo.com/1'], timeout=0.1)
+
+        started = time.time()
+        with self.assertRaises(TimeoutError):
+            next(responses)
+        expect(time.time() - started).to_be_greater_or_equal_to(0.1)
+
+    def test_can_enqueue_many(self):
+        otto = Octopus(concurrency=2, cache=True)
+        otto.request = Mock(side_effect=lambda method, url, **kw: self.get_requests_response())
+        otto.response_cache.put('http://www.globo.com/0', otto.from_requests_response('http://www.globo.com/0', self.get_requests_response()))
+        otto.response_cache.get_many = Mock(wraps=otto.response_cache.get_many)
+
+        def handle_url_response(url, response):
+            self.responses[url] = response
+
+        requests = ['http://www.globo.com/%d' % index for index in range(4)]
+        requests.append({'url': 'http://www.globo.com/post', 'method': 'POST', 'headers': {'a': 'b'}, 'body': 'c=d'})
+
+        count = otto.enqueue_many(iter(requests), handle_url_response, batch_size=10)
+
+        expect(count).to_equal(5)
+        expect(otto.response_cache.get_many.call_count).to_equal(1)
+        expect(self.responses).to_length(1)
+        expect(otto.queue_size).to_equal(4)
+
+        otto.start()
+        otto.wait(5)
+
+        expect(self.responses).to_length(5)
+        otto.request.assert_any_call('POST', 'http://www.globo.com/post', timeout=5, headers={'a': 'b'}, data='c=d')
+
+    def test_enqueue_many_coalesces_requests(self):
+        otto = Octopus(coalesce_requests=True)
+
+        count = otto.enqueue_many(['http://www.globo.com'] * 3, Mock())
+
+        expect(count).to_equal(3)
+        expect(otto.queue_size).to_equal(1)
+
+    def test_records_metrics(self):
+        otto = Octopus(concurrency=1, cache=True)
+        otto.request = Mock(side_effect=[self.get_requests_response(), requests.exceptions.Timeout('timed out')])
+
+        otto.enqueue('http://www.globo.com/a', Mock())
+        otto.enqueue('http://www.globo.com/b', Mock())
+        otto.enqueue('http://www.globo.com/a', Mock())
+
+        otto.start()
+        otto.wait(5)
+
+        snapshot = otto.metrics.snapshot()
+
+        expect(snapshot['requests']).to_equal(2)
+        expect(snapshot['in_flight']).to_equal(0)
+        expect(snapshot['responses']).to_equal({'2xx': 1, '5xx': 1})
+        expect(snapshot['timeouts']).to_equal(1)
+        expect(snapshot['cache_hits']).to_equal(1)
+        expect(snapshot['cache_misses']).to_equal(2)
+        expect(snapshot['queue_size']).to_equal(0)
+        expect(snapshot['latency']['www.globo.com']['count']).to_equal(2)
+
+    def test_records_limiter_misses(self):
+        limiter = Mock(releases_locally=True)
+        limiter.acquire.return_value = False
+        limiter.get_domain_from_url.return_value = 'http://www.globo.com'
+        otto = Octopus(limiter=limiter)
+
+        otto.process(0, ('http://www.globo.com/', Mock(), 'GET', {}))
+
+        expect(otto.metrics.snapshot()['limiter_misses']).to_equal({'http://www.globo.com': 1})
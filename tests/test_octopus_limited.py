@@ -1,14 +1,40 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
+from threading import Event, Lock, Thread
+
 from preggy import expect
+from mock import Mock
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
 
 from octopus import Octopus
+from octopus.limiter import Limiter as BaseLimiter
+from octopus.limiter.redis.atomic import Limiter as AtomicRedisLimiter
 from octopus.limiter.redis.per_domain import Limiter as PerDomainRedisLimiter
 from octopus.limiter.in_memory.per_domain import Limiter as PerDomainInMemoryLimiter
+from octopus.limiter.in_memory.adaptive import Limiter as AdaptiveInMemoryLimiter
+from octopus.limiter.in_memory.rate import Limiter as RateInMemoryLimiter
 from tests import TestCase
 
 
+class SlowServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(0.3)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
 class TestThreadedOctopusAgainstLimiter(TestCase):
     def setUp(self):
         super(TestThreadedOctopusAgainstLimiter, self).setUp()
@@ -60,3 +86,236 @@ class TestThreadedOctopusAgainstLimiter(TestCase):
         otto.wait()
 
         expect(self.cache_miss).to_length(2)
+
+    def get_slow_request(self, delay):
+        lock = Lock()
+        self.running = {}
+        self.max_running = {}
+
+        def request(method, url, **kw):
+            domain = url.split('/')[2]
+            with lock:
+                self.running[domain] = self.running.get(domain, 0) + 1
+                self.max_running[domain] = max(self.max_running.get(domain, 0), self.running[domain])
+
+            time.sleep(delay)
+
+            with lock:
+                self.running[domain] -= 1
+
+            return Mock(status_code=200, headers={}, cookies={}, text='body', content=b'body', encoding='utf-8', url=url, elapsed=None)
+
+        return request
+
+    def test_waiting_requests_are_woken_up_when_lock_is_released(self):
+        limiter = PerDomainInMemoryLimiter({'http://g1.globo.com': 2})
+        limiter.subscribe_to_lock_miss(self.handle_limiter_miss)
+        otto = Octopus(concurrency=10, limiter=limiter)
+        otto.request = self.get_slow_request(0.05)
+
+        for index in range(10):
+            otto.enqueue('http://g1.globo.com/%d' % index, self.handle_url_response)
+        for index in range(10):
+            otto.enqueue('http://globoesporte.globo.com/%d' % index, self.handle_url_response)
+
+        otto.start()
+        otto.wait(5)
+
+        expect(self.responses).to_length(20)
+        expect(self.max_running['g1.globo.com']).to_equal(2)
+        expect(self.max_running['globoesporte.globo.com']).to_be_greater_than(2)
+        expect(self.cache_miss).to_length(8)
+        expect(otto.pending).to_be_empty()
+        expect(limiter.domain_count['http://g1.globo.com']).to_equal(0)
+
+    def test_waiting_requests_count_in_queue_size(self):
+        limiter = PerDomainInMemoryLimiter({'http://g1.globo.com': 1})
+        otto = Octopus(concurrency=2, limiter=limiter)
+        limiter.acquire('http://g1.globo.com/')
+
+        otto.enqueue('http://g1.globo.com/economia', self.handle_url_response)
+        otto.start()
+        time.sleep(0.1)
+
+        expect(otto.url_queue.qsize()).to_equal(0)
+        expect(otto.queue_size).to_equal(1)
+        expect(otto.is_empty).to_be_false()
+
+    def test_retries_waiting_requests_if_lock_is_released_elsewhere(self):
+        class SharedLimiter(BaseLimiter):
+            def __init__(self):
+                super(SharedLimiter, self).__init__(limiter_miss_timeout_ms=50)
+                self.locked = True
+
+            def acquire(self, url):
+                return not self.locked
+
+            def release(self, url):
+                pass
+
+        limiter = SharedLimiter()
+        otto = Octopus(concurrency=2, limiter=limiter)
+        otto.request = self.get_slow_request(0)
+
+        otto.enqueue('http://g1.globo.com/economia', self.handle_url_response)
+        otto.start()
+        time.sleep(0.1)
+
+        expect(self.responses).to_be_empty()
+
+        limiter.locked = False
+        otto.wait(5)
+
+        expect(self.responses).to_length(1)
+        expect(otto.retry_timers).to_be_empty()
+
+    def test_calls_remote_limiters_concurrently(self):
+        class RemoteLimiter(BaseLimiter):
+            remote = True
+
+            def __init__(self):
+                super(RemoteLimiter, self).__init__()
+                self.lock = Lock()
+                self.calls = 0
+                self.both_calling = Event()
+                self.concurrent = []
+
+            def acquire(self, url):
+                with self.lock:
+                    self.calls += 1
+                    if self.calls == 2:
+                        self.both_calling.set()
+
+                # blocks until the other worker is calling the limiter as well
+                self.both_calling.wait(2)
+                self.concurrent.append(self.both_calling.is_set())
+                return True
+
+            def release(self, url):
+                pass
+
+        limiter = RemoteLimiter()
+        otto = Octopus(concurrency=2, limiter=limiter)
+        otto.request = self.get_slow_request(0)
+
+        otto.enqueue('http://g1.globo.com/economia', self.handle_url_response)
+        otto.enqueue('http://g1.globo.com/politica', self.handle_url_response)
+        otto.start()
+        otto.wait(5)
+
+        expect(self.responses).to_length(2)
+        expect(limiter.concurrent).to_equal([True, True])
+
+    def test_retries_rate_limited_requests_when_next_token_is_available(self):
+        limiter = RateInMemoryLimiter({'http://g1.globo.com': {'requests': 1, 'per_seconds': 0.05}})
+        limiter.limiter_miss_timeout_ms = 10000
+        otto = Octopus(concurrency=4, limiter=limiter)
+        otto.request = self.get_slow_request(0)
+        times = []
+
+        for index in range(4):
+            otto.enqueue('http://g1.globo.com/%d' % index, lambda url, response: times.append(time.time()))
+
+        start = time.time()
+        otto.start()
+        otto.wait(5)
+
+        expect(times).to_length(4)
+        expect(times[-1] - start).to_be_greater_than(0.14)
+        expect(times[-1] - start).to_be_lesser_than(1)
+
+    def test_retries_only_requests_the_rate_limiter_can_take(self):
+        limiter = RateInMemoryLimiter({'http://g1.globo.com': {'requests': 40, 'burst': 1}})
+        misses = []
+        limiter.subscribe_to_lock_miss(misses.append)
+        otto = Octopus(concurrency=10, limiter=limiter)
+        otto.request = self.get_slow_request(0)
+
+        for index in range(30):
+            otto.enqueue('http://g1.globo.com/%d' % index, self.handle_url_response)
+
+        otto.start()
+        otto.wait(5)
+
+        # every waiting request used to be retried each time a token was added
+        expect(self.responses).to_length(30)
+        expect(len(misses)).to_be_lesser_than(90)
+
+    def test_gets_retry_delay_of_local_limiters_holding_the_lock(self):
+        limiter = RateInMemoryLimiter({'http://g1.globo.com': {'requests': 1, 'per_seconds': 0.05}})
+        otto = Octopus(concurrency=4, limiter=limiter)
+        otto.request = self.get_slow_request(0)
+        locked = []
+
+        get_retry_delay = limiter.get_retry_delay
+
+        def get_locked_retry_delay(url):
+            locked.append(otto.pending_lock.locked())
+            return get_retry_delay(url)
+
+        limiter.get_retry_delay = get_locked_retry_delay
+
+        for index in range(4):
+            otto.enqueue('http://g1.globo.com/%d' % index, self.handle_url_response)
+
+        otto.start()
+        otto.wait(5)
+
+        expect(self.responses).to_length(4)
+        expect(locked).not_to_be_empty()
+        expect(all(locked)).to_be_true()
+
+    def test_can_use_atomic_redis_limiter(self):
+        limiter = AtomicRedisLimiter({'http://g1.globo.com': 2}, redis=self.redis, limiter_miss_timeout_ms=10)
+        otto = Octopus(concurrency=10, limiter=limiter)
+        otto.request = self.get_slow_request(0.02)
+
+        for index in range(10):
+            otto.enqueue('http://g1.globo.com/%d' % index, self.handle_url_response)
+
+        otto.start()
+        otto.wait(5)
+
+        expect(self.responses).to_length(10)
+        expect(self.max_running['g1.globo.com']).to_equal(2)
+        expect(self.redis.zcard('leases-for-http://g1.globo.com')).to_equal(0)
+
+    def test_reports_responses_to_adaptive_limiter(self):
+        limiter = AdaptiveInMemoryLimiter({'http://g1.globo.com': {'min': 1, 'max': 8, 'initial': 4}}, limiter_miss_timeout_ms=10)
+        otto = Octopus(concurrency=10, limiter=limiter)
+        otto.request = Mock(return_value=Mock(status_code=503, headers={}, cookies={}, text='busy', content=b'busy', encoding='utf-8', url='http://g1.globo.com/', elapsed=None))
+
+        for index in range(6):
+            otto.enqueue('http://g1.globo.com/%d' % index, self.handle_url_response)
+
+        otto.start()
+        otto.wait(5)
+
+        expect(self.responses).to_length(6)
+        expect(limiter.get_domain_limit('http://g1.globo.com/')).to_be_lesser_than(4)
+        expect(limiter.domain_count['http://g1.globo.com']).to_equal(0)
+
+    def test_reports_timeouts_to_adaptive_limiter(self):
+        server = SlowServer(('127.0.0.1', 0), SlowHandler)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+        limiter = AdaptiveInMemoryLimiter({base_url: {'min': 1, 'max': 8, 'initial': 4}}, limiter_miss_timeout_ms=10)
+        otto = Octopus(concurrency=4, limiter=limiter, request_timeout_in_seconds=0.05)
+
+        for index in range(8):
+            otto.enqueue('%s/%d' % (base_url, index), self.handle_url_response)
+
+        try:
+            otto.start()
+            otto.wait(10)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        expect(self.responses).to_length(8)
+        for response in self.responses.values():
+            expect(response.status_code).to_equal(500)
+        expect(limiter.get_domain_limit(base_url)).to_be_lesser_than(4)
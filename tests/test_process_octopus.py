@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from threading import Thread
+
+from preggy import expect
+from mock import Mock
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from octopus import ProcessOctopus, TimeoutError
+from octopus.limiter.in_memory.per_domain import Limiter as PerDomainInMemoryLimiter
+from octopus.process_core import WorkerOctopus
+from tests import TestCase
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Path', self.path)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestProcessOctopus(TestCase):
+    def setUp(self):
+        super(TestProcessOctopus, self).setUp()
+        self.responses = {}
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle_url_response(self, url, response):
+        self.responses[url] = response
+
+    def test_can_create_process_otto(self):
+        otto = ProcessOctopus(concurrency=20, processes=3, request_timeout_in_seconds=1)
+
+        expect(otto.concurrency).to_equal(20)
+        expect(otto.processes).to_equal(3)
+        expect(otto.auto_start).to_be_false()
+        expect(otto.limiter).to_be_null()
+        expect(otto.compress_responses).to_be_false()
+        expect(otto.options).to_equal({'request_timeout_in_seconds': 1})
+        expect(otto.requests).to_length(3)
+        expect(otto.workers).to_be_empty()
+        expect(otto.is_empty).to_be_true()
+
+    def test_defaults_to_one_process_per_cpu(self):
+        otto = ProcessOctopus()
+
+        expect(otto.processes).to_be_greater_than(0)
+        expect(otto.requests).to_length(otto.processes)
+
+    def test_shards_by_domain(self):
+        otto = ProcessOctopus(processes=4)
+
+        shard = otto.get_shard('http://g1.globo.com/economia')
+        expect(otto.get_shard('http://g1.globo.com/')).to_equal(shard)
+        expect(otto.get_shard('http://g1.globo.com/politica?page=2')).to_equal(shard)
+
+        shards = set([otto.get_shard('http://www.domain-%d.com/' % index) for index in range(100)])
+        expect(shards).to_equal(set([0, 1, 2, 3]))
+
+    def test_shards_by_limiter_domain(self):
+        limiter = PerDomainInMemoryLimiter({'http://g1.globo.com/economia': 1})
+        otto = ProcessOctopus(processes=4, limiter=limiter)
+
+        expect(otto.get_domain('http://g1.globo.com/economia/1')).to_equal('http://g1.globo.com/economia')
+        expect(otto.get_domain('http://g1.globo.com/politica')).to_equal('g1.globo.com')
+
+    def test_can_get_responses_from_worker_processes(self):
+        otto = ProcessOctopus(concurrency=2, processes=2, auto_start=True, compress_responses=True)
+        urls = [self.base_url + '/%d' % index for index in range(10)]
+
+        for url in urls:
+            otto.enqueue(url, self.handle_url_response)
+
+        expect(otto.queue_size).to_equal(10)
+        otto.wait(10)
+        otto.stop()
+
+        expect(otto.is_empty).to_be_true()
+        expect(self.responses).to_length(10)
+
+        for index, url in enumerate(urls):
+            response = self.responses[url]
+            expect(response.status_code).to_equal(200)
+            expect(response.text).to_equal(b'/%d' % index)
+            expect(response.headers['X-Path']).to_equal('/%d' % index)
+            expect(response.error).to_be_null()
+
+    def test_handler_errors_do_not_stop_waiting(self):
+        otto = ProcessOctopus(processes=1, auto_start=True)
+        handler = Mock(side_effect=ValueError('handler error'))
+
+        otto.enqueue(self.base_url + '/1', handler)
+        otto.enqueue(self.base_url + '/2', self.handle_url_response)
+        otto.wait(10)
+        otto.stop()
+
+        expect(handler.call_count).to_equal(1)
+        expect(self.responses).to_include(self.base_url + '/2')
+
+    def test_can_stop_workers(self):
+        otto = ProcessOctopus(processes=2, auto_start=True)
+        workers = list(otto.workers)
+
+        otto.enqueue(self.base_url + '/1', self.handle_url_response)
+        otto.stop()
+
+        expect(otto.workers).to_be_empty()
+        for worker in workers:
+            expect(worker.is_alive()).to_be_false()
+            expect(worker.exitcode).to_equal(0)
+
+    def test_times_out_on_wait(self):
+        otto = ProcessOctopus(processes=1)
+
+        otto.enqueue(self.base_url + '/1', self.handle_url_response)
+
+        try:
+            otto.wait(0.2)
+        except TimeoutError:
+            expect(otto.queue_size).to_equal(1)
+        else:
+            assert False, "Should not have gotten this far"
+
+    def test_fails_when_a_worker_dies(self):
+        otto = ProcessOctopus(processes=1, auto_start=True)
+
+        otto.enqueue(self.base_url + '/1', self.handle_url_response)
+        otto.workers[0].terminate()
+        otto.workers[0].join()
+
+        with self.assertRaises(RuntimeError):
+            otto.wait(0)
+
+    def test_can_not_stream_responses(self):
+        otto = ProcessOctopus(processes=1)
+
+        with self.assertRaises(ValueError):
+            otto.enqueue(self.base_url + '/1', self.handle_url_response, chunk_handler=Mock())
+
+        expect(otto.is_empty).to_be_true()
+
+
+class TestWorkerOctopus(TestCase):
+    def test_keeps_running_until_closed(self):
+        otto = WorkerOctopus(concurrency=1, auto_start=True)
+        otto.ioloop.stop = Mock()
+
+        otto.stop()
+        expect(otto.ioloop.stop.called).to_be_false()
+
+        otto.close()
+        expect(otto.closing).to_be_true()
+        expect(otto.ioloop.stop.called).to_be_true()
+
+    def test_can_be_forced_to_stop(self):
+        otto = WorkerOctopus(concurrency=1, auto_start=True)
+        otto.ioloop.stop = Mock()
+
+        otto.stop(force=True)
+
+        expect(otto.ioloop.stop.called).to_be_true()
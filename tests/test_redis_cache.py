@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from preggy import expect
+
+from octopus import Octopus, TornadoOctopus
+from octopus.model import Response
+from octopus.redis_cache import RedisCache
+from tests import TestCase
+
+
+def get_response(url='http://www.google.com', text='body'):
+    return Response(
+        url=url, status_code=200,
+        headers={'Content-Type': 'text/html'}, cookies={'foo': 'bar'},
+        text=text, effective_url=url, error=None, request_time=0.5
+    )
+
+
+class TestRedisCache(TestCase):
+    def test_can_create_redis_cache(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=45)
+
+        expect(cache.redis).to_equal(self.redis)
+        expect(cache.expiration_in_seconds).to_equal(45)
+        expect(cache.prefix).to_equal('octopus-cache')
+        expect(cache.compress).to_be_false()
+        expect(cache.local_cache).to_be_null()
+
+    def test_can_create_redis_cache_with_local_cache(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=45, local_expiration_in_seconds=2, local_max_entries=10)
+
+        expect(cache.local_cache.expiration_in_seconds).to_equal(2)
+        expect(cache.local_cache.max_entries).to_equal(10)
+
+    def test_get_returns_none_if_not_put(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=45)
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+        expect(cache.misses).to_equal(1)
+
+    def test_can_get_after_put(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=10)
+        cache.put('http://www.google.com', get_response())
+
+        response = cache.get('http://www.google.com')
+
+        expect(response.url).to_equal('http://www.google.com')
+        expect(response.status_code).to_equal(200)
+        expect(response.headers).to_be_like({'Content-Type': 'text/html'})
+        expect(response.text).to_equal('body')
+        expect(cache.hits).to_equal(1)
+
+    def test_responses_are_shared_between_instances(self):
+        RedisCache(self.redis, expiration_in_seconds=10, compress=True).put('http://www.google.com', get_response())
+
+        cache = RedisCache(self.redis, expiration_in_seconds=10)
+
+        expect(cache.get('http://www.google.com').text).to_equal('body')
+
+    def test_responses_expire_in_redis(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=10)
+        cache.put('http://www.google.com', get_response())
+
+        ttl = self.redis.pttl('octopus-cache:http://www.google.com')
+
+        expect(ttl).to_be_greater_than(9000)
+        expect(ttl).to_be_lesser_or_equal_to(10000)
+
+    def test_get_returns_none_if_expired(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=0.1)
+        cache.put('http://www.google.com', get_response())
+
+        time.sleep(0.2)
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+
+    def test_local_cache_is_used_before_redis(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=10, local_expiration_in_seconds=10)
+        response = get_response()
+        cache.put('http://www.google.com', response)
+        self.redis.flushall()
+
+        expect(cache.get('http://www.google.com')).to_equal(response)
+        expect(cache.local_hits).to_equal(1)
+
+    def test_can_get_many(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=10, batch_size=2)
+        urls = ['http://www.google.com/%d' % index for index in range(5)]
+        for url in urls[:3]:
+            cache.put(url, get_response(url=url))
+
+        responses = cache.get_many(urls)
+
+        expect(responses).to_length(3)
+        expect(responses[urls[2]].url).to_equal(urls[2])
+        expect(cache.hits).to_equal(3)
+        expect(cache.misses).to_equal(2)
+
+    def test_can_prefetch_into_local_cache(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=10, local_expiration_in_seconds=10)
+        RedisCache(self.redis, expiration_in_seconds=10).put('http://www.google.com', get_response())
+
+        cache.prefetch(['http://www.google.com', 'http://www.globo.com'])
+        self.redis.flushall()
+
+        expect(cache.get('http://www.google.com').text).to_equal('body')
+        expect(cache.local_hits).to_equal(1)
+
+    def test_prefetch_without_local_cache_does_nothing(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=10)
+
+        expect(cache.prefetch(['http://www.google.com'])).to_be_empty()
+
+    def test_can_remove(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=10, local_expiration_in_seconds=10)
+        cache.put('http://www.google.com', get_response())
+
+        cache.remove('http://www.google.com')
+
+        expect(cache.get('http://www.google.com')).to_be_null()
+
+    def test_engines_can_use_redis_cache(self):
+        cache = RedisCache(self.redis, expiration_in_seconds=10)
+        cache.put('http://www.google.com', get_response())
+        responses = []
+
+        for otto in [Octopus(cache=True, response_cache=cache), TornadoOctopus(cache=True, response_cache=cache)]:
+            otto.enqueue('http://www.google.com', lambda url, response: responses.append(response))
+
+        expect(responses).to_length(2)
+        expect(responses[0].text).to_equal('body')
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from preggy import expect
+
+from octopus.request_queue import RequestQueue
+from tests import TestCase
+
+
+class TestRequestQueue(TestCase):
+    def test_can_create_queue(self):
+        queue = RequestQueue()
+
+        expect(queue).to_length(0)
+        expect(bool(queue)).to_be_false()
+
+    def test_items_are_retrieved_in_order(self):
+        queue = RequestQueue()
+        queue.extend(['a', 'b', 'c'])
+
+        expect(queue).to_length(3)
+        expect([queue.popleft() for i in range(3)]).to_equal(['a', 'b', 'c'])
+        expect(bool(queue)).to_be_false()
+
+    def test_higher_priorities_are_retrieved_first(self):
+        queue = RequestQueue()
+        queue.append('bulk')
+        queue.append('urgent', priority=10)
+        queue.append('backfill', priority=-1)
+        queue.append('other urgent', priority=10)
+        queue.append('important', priority=5)
+
+        expect(list(queue)).to_equal([
+            (10, 'urgent'), (10, 'other urgent'), (5, 'important'), (0, 'bulk'), (-1, 'backfill')
+        ])
+        expect([queue.popitem() for i in range(5)]).to_equal([
+            (10, 'urgent'), (10, 'other urgent'), (5, 'important'), (0, 'bulk'), (-1, 'backfill')
+        ])
+
+    def test_can_append_to_the_front_of_a_priority(self):
+        queue = RequestQueue()
+        queue.append('a', priority=1)
+        queue.appendleft('b', priority=1)
+        queue.appendleft('c', priority=2)
+
+        expect([queue.popleft() for i in range(3)]).to_equal(['c', 'b', 'a'])
+
+    def test_priorities_can_be_reused_after_emptied(self):
+        queue = RequestQueue()
+        queue.append('a', priority=1)
+        queue.popleft()
+        queue.append('b', priority=1)
+        queue.append('c')
+
+        expect(queue.priorities).to_length(2)
+        expect([queue.popleft() for i in range(2)]).to_equal(['b', 'c'])
+
+    def test_cant_pop_from_empty_queue(self):
+        try:
+            RequestQueue().popleft()
+        except IndexError as err:
+            expect(err).to_have_an_error_message_of('pop from an empty request queue')
+        else:
+            assert False, "Should not have gotten this far"
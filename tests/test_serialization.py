@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import marshal
+
+from preggy import expect
+
+from octopus.model import Response
+from octopus.serialization import dumps_response, loads_response
+from tests import TestCase
+
+
+class TestSerialization(TestCase):
+    def get_response(self, text='body'):
+        return Response(
+            url='http://www.google.com', status_code=404,
+            headers={'Content-Type': 'text/html'}, cookies={'foo': 'bar'},
+            text=text, effective_url='http://www.google.com/',
+            error=RuntimeError('not found'), request_time=1.5
+        )
+
+    def test_can_serialize_response(self):
+        response = loads_response(dumps_response(self.get_response()))
+
+        expect(response).to_be_instance_of(Response)
+        expect(response.url).to_equal('http://www.google.com')
+        expect(response.status_code).to_equal(404)
+        expect(response.headers).to_be_like({'Content-Type': 'text/html'})
+        expect(response.cookies).to_be_like({'foo': 'bar'})
+        expect(response.text).to_equal('body')
+        expect(response.effective_url).to_equal('http://www.google.com/')
+        expect(response.error).to_equal('not found')
+        expect(response.request_time).to_equal(1.5)
+
+    def test_can_serialize_binary_bodies(self):
+        response = loads_response(dumps_response(self.get_response(text=b'\x00\xff')))
+
+        expect(response.text).to_equal(b'\x00\xff')
+
+    def test_serializes_raw_body_without_decoding_it(self):
+        response = Response(
+            url='http://www.google.com', status_code=200, headers={}, cookies={},
+            text=None, effective_url='http://www.google.com/', error=None,
+            request_time=0.1, content=b'caf\xe9', encoding='iso-8859-1'
+        )
+
+        loaded = loads_response(dumps_response(response))
+
+        expect(response._text).to_be_null()
+        expect(loaded.content).to_equal(b'caf\xe9')
+        expect(loaded.encoding).to_equal('iso-8859-1')
+        expect(loaded.text).to_equal(u'caf\xe9')
+
+    def test_can_load_responses_serialized_without_raw_body(self):
+        data = marshal.dumps(('http://www.google.com', 200, {}, {}, 'body', 'http://www.google.com/', None, 0.1), 2)
+
+        response = loads_response(b'm' + data)
+
+        expect(response.text).to_equal('body')
+        expect(response.content).to_be_null()
+
+    def test_can_compress_response(self):
+        response = self.get_response(text='body' * 1000)
+
+        data = dumps_response(response, compress=True)
+
+        expect(len(data)).to_be_lesser_than(len(dumps_response(response)))
+        expect(loads_response(data).text).to_equal('body' * 1000)
+
+    def test_cant_load_unknown_format(self):
+        try:
+            loads_response(b'xwhatever')
+        except ValueError as err:
+            expect(err).to_have_an_error_message_of("Unknown serialized response format: b'x'.")
+        else:
+            assert False, "Should not have gotten this far"
+
+    def test_keeps_body_flags(self):
+        response = self.get_response()
+        response.truncated = True
+
+        loaded = loads_response(dumps_response(response))
+
+        expect(loaded.truncated).to_be_true()
+        expect(loaded.headers_only).to_be_false()
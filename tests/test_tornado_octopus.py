@@ -2,12 +2,20 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import current_thread
 
 from preggy import expect
 from mock import Mock, patch
-
-from octopus import TornadoOctopus
-from octopus.cache import Cache
+from tornado import gen
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+from tornado.web import Application, RequestHandler
+
+from octopus import TornadoOctopus, TimeoutError
+from octopus.cache import Cache, HttpCache
+from octopus.model import Response
 from tests import TestCase
 
 
@@ -59,8 +67,8 @@ class TestTornadoOctopus(TestCase):
         otto = TornadoOctopus(
             concurrency=20, auto_start=True, cache=True,
             expiration_in_seconds=60, request_timeout_in_seconds=20,
-            connect_timeout_in_seconds=10, ignore_pycurl=True
-
+            connect_timeout_in_seconds=10, ignore_pycurl=True,
+            cache_max_entries=100, cache_max_size_in_bytes=1024
         )
 
         expect(otto.concurrency).to_equal(20)
@@ -70,6 +78,8 @@ class TestTornadoOctopus(TestCase):
         expect(otto.response_cache).not_to_be_null()
         expect(otto.response_cache).to_be_instance_of(Cache)
         expect(otto.response_cache.expiration_in_seconds).to_equal(60)
+        expect(otto.response_cache.max_entries).to_equal(100)
+        expect(otto.response_cache.max_size_in_bytes).to_equal(1024)
 
         expect(otto.request_timeout_in_seconds).to_equal(20)
         expect(otto.connect_timeout_in_seconds).to_equal(10)
@@ -78,6 +88,54 @@ class TestTornadoOctopus(TestCase):
         expect(otto.running_urls).to_equal(0)
         expect(otto.url_queue).to_be_empty()
 
+    def test_can_create_tornado_otto_with_http_caching(self):
+        otto = TornadoOctopus(cache=True, http_caching=True)
+
+        expect(otto.http_caching).to_be_true()
+        expect(otto.response_cache).to_be_instance_of(HttpCache)
+
+    def test_http_caching_needs_cache_that_can_revalidate(self):
+        with self.assertRaises(ValueError):
+            TornadoOctopus(cache=True, http_caching=True, response_cache=Cache(expiration_in_seconds=30))
+
+    def test_fetch_adds_validators_for_stale_responses(self):
+        otto = TornadoOctopus(cache=True, http_caching=True, auto_start=True)
+        otto.response_cache.put('http://www.google.com', self.get_cached_response({'ETag': '"v1"'}))
+
+        http_client_mock = Mock()
+        otto.http_client = http_client_mock
+
+        otto.fetch('http://www.google.com', None, 'GET', headers={'Accept': 'text/html'})
+
+        request = http_client_mock.fetch.call_args[0][0]
+        expect(request.headers['If-None-Match']).to_equal('"v1"')
+        expect(request.headers['Accept']).to_equal('text/html')
+
+    @patch.object(TornadoOctopus, 'stop')
+    def test_handle_request_refreshes_stale_response(self, stop_mock):
+        otto = TornadoOctopus(cache=True, http_caching=True, auto_start=True)
+        cached_response = self.get_cached_response({'ETag': '"v1"'})
+        otto.response_cache.put('http://www.google.com', cached_response)
+
+        response = self.get_response()
+        response.code = 304
+        response.headers = {'Cache-Control': 'max-age=60'}
+        callback = Mock()
+
+        handle_request = otto.handle_request('http://www.google.com', callback, revalidating=True)
+        handle_request(response)
+
+        callback.assert_called_once_with('http://www.google.com', cached_response)
+        expect(otto.response_cache.get('http://www.google.com')).to_equal(cached_response)
+
+    def get_cached_response(self, headers):
+        headers['Cache-Control'] = 'max-age=0'
+        return Response(
+            url='http://www.google.com', status_code=200, headers=headers,
+            cookies={}, text='body', effective_url='http://www.google.com',
+            error=None, request_time=0.1
+        )
+
     def test_can_get_queue_info(self):
         otto = TornadoOctopus()
 
@@ -117,6 +175,35 @@ class TestTornadoOctopus(TestCase):
 
         expect(otto.url_queue).to_length(1)
 
+    @patch.object(TornadoOctopus, 'fetch')
+    def test_queued_urls_are_fetched_in_order_of_priority(self, fetch_mock):
+        otto = TornadoOctopus(cache=False, concurrency=1)
+        otto.running_urls = 1
+
+        otto.enqueue('http://www.google.com/1', None)
+        otto.enqueue('http://www.google.com/2', None)
+        otto.enqueue('http://www.google.com/urgent', None, priority=10)
+        otto.enqueue('http://www.google.com/3', None)
+
+        for i in range(4):
+            otto.running_urls = 0
+            otto.get_next_url()
+
+        expect([call[0][0] for call in fetch_mock.call_args_list]).to_equal([
+            'http://www.google.com/urgent', 'http://www.google.com/1',
+            'http://www.google.com/2', 'http://www.google.com/3'
+        ])
+
+    def test_can_coalesce_identical_requests(self):
+        otto = TornadoOctopus(cache=False, concurrency=0, coalesce_requests=True)
+
+        otto.enqueue('http://www.google.com', None)
+        otto.enqueue('http://www.google.com', None)
+        otto.enqueue('http://www.google.com', None, method='POST')
+
+        expect(otto.url_queue).to_length(2)
+        expect(otto.in_flight).to_length(1)
+
     @patch.object(TornadoOctopus, 'fetch')
     def test_can_enqueue_url_and_fetch(self, fetch_mock):
         otto = TornadoOctopus(cache=True)
@@ -166,6 +253,27 @@ class TestTornadoOctopus(TestCase):
         expect(otto.running_urls).to_equal(1)
         expect(http_client_mock.fetch.called).to_be_true()
 
+    @patch.object(TornadoOctopus, 'stop')
+    def test_can_stream_response_body_to_chunk_handler(self, stop_mock):
+        otto = TornadoOctopus(cache=True, auto_start=True)
+        otto.http_client = Mock()
+        chunks = []
+
+        def handle_url_response(url, response):
+            self.response = response
+
+        otto.fetch('http://www.google.com', handle_url_response, 'GET', chunk_handler=lambda url, chunk: chunks.append((url, chunk)))
+
+        request, handle = otto.http_client.fetch.call_args[0]
+        request.streaming_callback(b'bo')
+        request.streaming_callback(b'dy')
+        handle(self.get_response())
+
+        expect(chunks).to_equal([('http://www.google.com', b'bo'), ('http://www.google.com', b'dy')])
+        expect(self.response.status_code).to_equal(200)
+        expect(self.response.text).to_be_null()
+        expect(otto.response_cache.get('http://www.google.com')).to_be_null()
+
     def test_fetch_gets_the_response_from_cache_if_available(self):
         otto = TornadoOctopus(cache=True, auto_start=True)
         response_mock = Mock()
@@ -198,6 +306,54 @@ class TestTornadoOctopus(TestCase):
         expect(callback.called).to_be_true()
         expect(stop_mock.called).to_be_true()
 
+    @patch.object(TornadoOctopus, 'stop')
+    def test_handle_request_records_metrics(self, stop_mock):
+        otto = TornadoOctopus(auto_start=True)
+        otto.metrics.start_request()
+        otto.metrics.start_request()
+
+        otto.handle_request('http://www.globo.com/', Mock())(self.get_response())
+
+        response = self.get_response()
+        response.code = 599
+        response.error = 'HTTP 599: Timeout during request'
+        otto.handle_request('http://www.globo.com/', Mock())(response)
+
+        snapshot = otto.metrics.snapshot()
+
+        expect(snapshot['requests']).to_equal(2)
+        expect(snapshot['in_flight']).to_equal(0)
+        expect(snapshot['responses']).to_equal({'2xx': 1, '5xx': 1})
+        expect(snapshot['timeouts']).to_equal(1)
+        expect(snapshot['errors']).to_equal(0)
+        expect(snapshot['latency']['www.globo.com']['sum']).to_equal(4.2)
+
+    def test_records_cache_hits_and_misses(self):
+        otto = TornadoOctopus(cache=True, auto_start=True)
+        otto.http_client = Mock()
+
+        otto.enqueue('http://www.globo.com/', Mock())
+        otto.response_cache.put('http://www.globo.com/', Response(
+            url='http://www.globo.com/', status_code=200, headers={}, cookies={}, text='body',
+            effective_url='http://www.globo.com/', error=None, request_time=0.1
+        ))
+        otto.enqueue('http://www.globo.com/', Mock())
+
+        snapshot = otto.metrics.snapshot()
+
+        expect(snapshot['requests']).to_equal(1)
+        expect(snapshot['cache_misses']).to_equal(1)
+        expect(snapshot['cache_hits']).to_equal(1)
+
+    def test_records_limiter_misses(self):
+        limiter = Mock(releases_locally=True)
+        limiter.get_domain_from_url.return_value = 'http://www.globo.com'
+        otto = TornadoOctopus(limiter=limiter, auto_start=True)
+
+        otto.wait_for_lock('http://www.globo.com/', Mock(), 'GET', 0, {})
+
+        expect(otto.metrics.snapshot()['limiter_misses']).to_equal({'http://www.globo.com': 1})
+
     @patch.object(TornadoOctopus, 'stop')
     def test_handle_request_when_queue_has_no_items(self, stop_mock):
         otto = TornadoOctopus(cache=True, auto_start=True)
@@ -364,3 +520,287 @@ class TestTornadoOctopus(TestCase):
         otto.wait(2)
 
         log_mock.assert_called_once_with('Error calling callback for http://www.globo.com.')
+
+    def start_server(self, io_loop):
+        class Handler(RequestHandler):
+            def get(self):
+                self.set_header('X-Size', '10000')
+                for index in range(10):
+                    self.write('a' * 1000)
+                    self.flush()
+
+        sock, port = bind_unused_port()
+        server = HTTPServer(Application([(r'/.*', Handler)]), io_loop=io_loop)
+        server.add_sockets([sock])
+
+        # requests fetched before the IOLoop starts run in the current IOLoop
+        io_loop.make_current()
+
+        return 'http://127.0.0.1:%d' % port, server
+
+    def test_can_limit_response_body_size(self):
+        otto = TornadoOctopus(concurrency=3, auto_start=True, cache=True, max_body_size_in_bytes=1500, ignore_pycurl=True)
+        base_url, server = self.start_server(otto.ioloop)
+
+        def handle_url_response(url, response):
+            self.responses[url] = response
+
+        otto.enqueue(base_url + '/truncated', handle_url_response)
+        otto.enqueue(base_url + '/aborted', handle_url_response, abort_large_bodies=True)
+        otto.enqueue(base_url + '/headers', handle_url_response, headers_only=True)
+        otto.wait(5)
+        server.stop()
+
+        truncated = self.responses[base_url + '/truncated']
+        expect(truncated.status_code).to_equal(200)
+        expect(truncated.headers['X-Size']).to_equal('10000')
+        expect(truncated.text).to_equal(b'a' * 1500)
+        expect(truncated.truncated).to_be_true()
+        expect(truncated.error).to_be_null()
+        expect(otto.response_cache.get(base_url + '/truncated')).to_be_null()
+
+        aborted = self.responses[base_url + '/aborted']
+        expect(aborted.status_code).to_equal(200)
+        expect(aborted.text).to_be_null()
+        expect(aborted.error).to_equal('Response body for %s/aborted is larger than 1500 bytes.' % base_url)
+
+        headers = self.responses[base_url + '/headers']
+        expect(headers.status_code).to_equal(200)
+        expect(headers.headers['X-Size']).to_equal('10000')
+        expect(headers.text).to_be_null()
+        expect(headers.headers_only).to_be_true()
+
+    def test_reads_whole_body_below_size_limit(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, cache=True, max_body_size_in_bytes=20000, ignore_pycurl=True)
+        base_url, server = self.start_server(otto.ioloop)
+
+        def handle_url_response(url, response):
+            self.response = response
+
+        otto.enqueue(base_url + '/', handle_url_response)
+        otto.wait(5)
+        server.stop()
+
+        expect(self.response.status_code).to_equal(200)
+        expect(self.response.text).to_equal(b'a' * 10000)
+        expect(self.response.truncated).to_be_false()
+        expect(otto.response_cache.get(base_url + '/')).not_to_be_null()
+
+    def test_body_reader_replaces_curl_functions(self):
+        otto = TornadoOctopus(auto_start=True)
+        reader = Mock()
+        curl = Mock()
+
+        with patch('octopus.tornado_core.pycurl', create=True) as pycurl_mock:
+            otto.handle_curl_callback(curl, reader=reader)
+
+        curl.setopt.assert_any_call(pycurl_mock.WRITEFUNCTION, reader.stream_curl)
+        curl.setopt.assert_any_call(pycurl_mock.HEADERFUNCTION, reader.write_header)
+
+
+    def test_can_run_handlers_in_executor(self):
+        executor = ThreadPoolExecutor(max_workers=2)
+        otto = TornadoOctopus(concurrency=2, auto_start=True, ignore_pycurl=True, handler_executor=executor)
+        base_url, server = self.start_server(otto.ioloop)
+        threads = set()
+
+        def handle_url_response(url, response):
+            time.sleep(0.1)
+            threads.add(current_thread().name)
+            self.responses[url] = response
+
+        for index in range(4):
+            otto.enqueue(base_url + '/%d' % index, handle_url_response)
+        otto.wait(5)
+        server.stop()
+        executor.shutdown()
+
+        expect(self.responses).to_length(4)
+        expect(otto.pending_handlers).to_equal(0)
+        expect(threads).not_to_include(current_thread().name)
+
+    def test_does_not_fetch_while_handler_backlog_is_full(self):
+        otto = TornadoOctopus(concurrency=2, auto_start=True, handler_executor=Mock(), max_pending_handlers=1)
+        otto.get_next_url = Mock()
+
+        expect(otto.can_fetch).to_be_true()
+
+        otto.pending_handlers = 1
+        expect(otto.can_fetch).to_be_false()
+
+        otto.enqueue('http://www.globo.com', Mock())
+        expect(otto.get_next_url.called).to_be_false()
+        expect(otto.url_queue).to_length(1)
+
+    def test_max_pending_handlers_defaults_to_concurrency(self):
+        otto = TornadoOctopus(concurrency=5)
+
+        expect(otto.handler_executor).to_be_null()
+        expect(otto.max_pending_handlers).to_equal(5)
+        expect(otto.pending_handlers).to_equal(0)
+
+    @patch.object(logging, 'exception')
+    def test_can_handle_exception_in_executor(self, log_mock):
+        executor = ThreadPoolExecutor(max_workers=1)
+        otto = TornadoOctopus(concurrency=1, auto_start=True, ignore_pycurl=True, handler_executor=executor)
+        base_url, server = self.start_server(otto.ioloop)
+
+        def handle_url_response(url, response):
+            raise RuntimeError(url)
+
+        otto.enqueue(base_url + '/', handle_url_response)
+        otto.wait(5)
+        server.stop()
+        executor.shutdown()
+
+        log_mock.assert_called_once_with('Error calling callback for %s/.' % base_url)
+
+    def test_can_iterate_over_completed_responses(self):
+        otto = TornadoOctopus(concurrency=2, auto_start=True, ignore_pycurl=True)
+        base_url, server = self.start_server(otto.ioloop)
+        urls = [base_url + '/%d' % index for index in range(5)]
+
+        for index, (url, response) in enumerate(otto.as_completed(iter(urls), timeout=5, max_pending_responses=2)):
+            expect(response.status_code).to_equal(200)
+            expect(response.text).to_equal(b'a' * 10000)
+            self.responses[url] = response
+
+            # urls are only fetched as the responses are consumed
+            expect(otto.running_urls + otto.queue_size).to_be_lesser_or_equal_to(2)
+
+        expect(sorted(self.responses.keys())).to_equal(urls)
+
+        # the IOLoop can still be used afterwards
+        otto.enqueue(base_url + '/last', lambda url, response: setattr(self, 'response', response))
+        otto.wait(5)
+        server.stop()
+
+        expect(self.response.status_code).to_equal(200)
+
+    def test_as_completed_times_out(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, ignore_pycurl=True)
+        otto.ioloop.make_current()
+
+        # a socket that never answers
+        sock, port = bind_unused_port()
+        responses = otto.as_completed(['http://127.0.0.1:%d/' % port], timeout=0.2)
+
+        with self.assertRaises(TimeoutError):
+            next(responses)
+
+        sock.close()
+
+    def test_can_iterate_over_completed_responses_in_coroutine(self):
+        otto = TornadoOctopus(concurrency=2, auto_start=True, ignore_pycurl=True)
+        base_url, server = self.start_server(otto.ioloop)
+        urls = [base_url + '/%d' % index for index in range(5)]
+
+        @gen.coroutine
+        def consume():
+            responses = otto.as_completed_async(urls, max_pending_responses=2)
+            while not responses.done():
+                url, response = yield responses.next()
+                self.responses[url] = response
+
+        otto.ioloop.run_sync(consume, timeout=5)
+        server.stop()
+
+        expect(sorted(self.responses.keys())).to_equal(urls)
+        expect(self.responses[urls[0]].text).to_equal(b'a' * 10000)
+
+    def test_can_create_tornado_otto_with_max_queue_size(self):
+        otto = TornadoOctopus(max_queue_size=100, enqueue_timeout_in_seconds=2)
+
+        expect(otto.max_queue_size).to_equal(100)
+        expect(otto.enqueue_timeout_in_seconds).to_equal(2)
+        expect(otto.is_full).to_be_false()
+
+    def test_enqueue_rejects_urls_when_queue_is_full(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, max_queue_size=1)
+        otto.running_urls = 1
+
+        expect(otto.enqueue('http://www.globo.com/1', Mock())).to_be_true()
+        expect(otto.is_full).to_be_true()
+        expect(otto.enqueue('http://www.globo.com/2', Mock())).to_be_false()
+
+        expect(otto.queue_size).to_equal(1)
+
+    def test_coalesced_requests_are_forgotten_when_rejected(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, max_queue_size=1, coalesce_requests=True)
+        otto.running_urls = 1
+        otto.enqueue('http://www.globo.com/1', Mock())
+
+        expect(otto.enqueue('http://www.globo.com/2', Mock())).to_be_false()
+
+        expect(otto.in_flight).to_length(1)
+
+    def test_enqueue_async_waits_for_room_in_queue(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, max_queue_size=1)
+        otto.fetch_next_url = Mock()
+        otto.running_urls = 1
+        otto.enqueue('http://www.globo.com/1', Mock())
+
+        first = otto.enqueue_async('http://www.globo.com/2', Mock())
+        second = otto.enqueue_async('http://www.globo.com/3', Mock())
+
+        expect(first.done()).to_be_false()
+        expect(otto.queue_size).to_equal(3)
+
+        # a url leaves the queue, so the next one waiting takes its place
+        otto.get_next_url()
+
+        expect(first.result()).to_be_true()
+        expect(second.done()).to_be_false()
+        expect(otto.queue_size).to_equal(2)
+        expect(otto.url_queue.popitem()[1][0]).to_equal('http://www.globo.com/2')
+
+    def test_enqueue_async_resolves_right_away_when_queue_has_room(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, max_queue_size=1)
+        otto.fetch_next_url = Mock()
+
+        future = otto.enqueue_async('http://www.globo.com/1', Mock())
+
+        expect(future.result()).to_be_true()
+        expect(otto.fetch_next_url.called).to_be_true()
+
+    def test_enqueue_async_times_out(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, max_queue_size=1, enqueue_timeout_in_seconds=0.1)
+        otto.running_urls = 1
+        otto.enqueue('http://www.globo.com/1', Mock())
+
+        future = otto.enqueue_async('http://www.globo.com/2', Mock())
+        result = otto.ioloop.run_sync(lambda: future, timeout=5)
+
+        expect(result).to_be_false()
+        expect(otto.enqueue_waiters).to_be_empty()
+
+    def test_as_completed_waits_for_room_in_queue(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, ignore_pycurl=True, max_queue_size=1)
+        base_url, server = self.start_server(otto.ioloop)
+        urls = [base_url + '/%d' % index for index in range(5)]
+
+        responses = dict(otto.as_completed(urls, timeout=5, max_pending_responses=4))
+        server.stop()
+
+        expect(sorted(responses.keys())).to_equal(urls)
+        expect(otto.enqueue_waiters).to_be_empty()
+
+    def test_can_enqueue_many(self):
+        otto = TornadoOctopus(concurrency=1, auto_start=True, cache=True)
+        otto.fetch_next_url = Mock(side_effect=lambda *args, **kw: setattr(otto, 'running_urls', otto.running_urls + 1))
+        otto.response_cache.put('http://www.globo.com/0', Response(
+            url='http://www.globo.com/0', status_code=200, headers={}, cookies={}, text='body',
+            effective_url='http://www.globo.com/0', error=None, request_time=0.1
+        ))
+        handler = Mock()
+
+        requests = ['http://www.globo.com/%d' % index for index in range(3)]
+        requests.append({'url': 'http://www.globo.com/post', 'method': 'POST', 'body': 'c=d'})
+
+        count = otto.enqueue_many(requests, handler, batch_size=2)
+
+        expect(count).to_equal(4)
+        expect(handler.call_count).to_equal(1)
+        otto.fetch_next_url.assert_called_once_with('http://www.globo.com/1', handler, 'GET', priority=0)
+        expect(otto.url_queue.popitem()[1]).to_equal(('http://www.globo.com/2', handler, 'GET', {}))
+        expect(otto.url_queue.popitem()[1]).to_equal(('http://www.globo.com/post', handler, 'POST', {'body': 'c=d'}))
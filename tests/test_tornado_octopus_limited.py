@@ -2,10 +2,18 @@
 # -*- coding: utf-8 -*-
 
 from preggy import expect
+from mock import Mock, patch
+from tornado import gen
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+from tornado.web import Application, RequestHandler
 
 from octopus import TornadoOctopus
+from octopus.limiter import Limiter as BaseLimiter
 from octopus.limiter.redis.per_domain import Limiter as PerDomainRedisLimiter
 from octopus.limiter.in_memory.per_domain import Limiter as PerDomainInMemoryLimiter
+from octopus.limiter.in_memory.rate import Limiter as RateInMemoryLimiter
+from octopus.limiter.redis.atomic import Limiter as AtomicRedisLimiter
 from tests import TestCase
 
 
@@ -59,3 +67,182 @@ class TestTornadoCoreLimited(TestCase):
         otto.wait()
 
         expect(self.cache_miss).to_length(2)
+
+    def get_response(self):
+        return Mock(
+            code=200, body='body', effective_url='http://g1.globo.com/', error=None,
+            request_time=0.1, headers={}, request=Mock(headers={})
+        )
+
+    @patch.object(TornadoOctopus, 'fetch')
+    def test_limiter_miss_waits_for_release(self, fetch_mock):
+        limiter = PerDomainInMemoryLimiter({'http://g1.globo.com': 1})
+        otto = TornadoOctopus(concurrency=10, auto_start=True, limiter=limiter)
+        otto.ioloop = Mock()
+
+        otto.enqueue('http://g1.globo.com/', self.handle_url_response)
+        otto.enqueue('http://g1.globo.com/economia', self.handle_url_response)
+        otto.enqueue('http://globoesporte.globo.com/', self.handle_url_response)
+
+        expect(fetch_mock.call_count).to_equal(2)
+        expect(otto.waiting['http://g1.globo.com']).to_length(1)
+        expect(otto.url_queue).to_be_empty()
+        expect(otto.queue_size).to_equal(1)
+        expect(otto.remaining_requests).to_equal(1)
+        expect(otto.ioloop.add_timeout.called).to_be_false()
+
+    @patch.object(TornadoOctopus, 'fetch')
+    def test_release_dispatches_next_waiting_request(self, fetch_mock):
+        limiter = PerDomainInMemoryLimiter({'http://g1.globo.com': 1})
+        otto = TornadoOctopus(concurrency=10, auto_start=True, limiter=limiter)
+        otto.stop = Mock()
+
+        otto.enqueue('http://g1.globo.com/', self.handle_url_response)
+        otto.enqueue('http://g1.globo.com/economia', self.handle_url_response, method='POST')
+        otto.running_urls = 1
+
+        otto.handle_request('http://g1.globo.com/', self.handle_url_response)(self.get_response())
+
+        expect(fetch_mock.call_count).to_equal(2)
+        fetch_mock.assert_called_with('http://g1.globo.com/economia', self.handle_url_response, 'POST')
+        expect(otto.waiting).to_be_empty()
+        expect(limiter.domain_count['http://g1.globo.com']).to_equal(1)
+
+    @patch.object(TornadoOctopus, 'fetch')
+    def test_retries_waiting_requests_for_distributed_limiters(self, fetch_mock):
+        class SharedLimiter(BaseLimiter):
+            locked = True
+
+            def acquire(self, url):
+                return not self.locked
+
+            def release(self, url):
+                pass
+
+        limiter = SharedLimiter(limiter_miss_timeout_ms=50)
+        otto = TornadoOctopus(concurrency=10, auto_start=True, limiter=limiter)
+        otto.ioloop = Mock()
+
+        otto.enqueue('http://g1.globo.com/', self.handle_url_response)
+        otto.enqueue('http://g1.globo.com/economia', self.handle_url_response)
+
+        expect(otto.ioloop.add_timeout.call_count).to_equal(1)
+        expect(otto.retry_timeouts).to_include(None)
+        expect(fetch_mock.called).to_be_false()
+
+        limiter.locked = False
+        otto.retry_waiting(None, 'http://g1.globo.com/')
+
+        # limiters that can't tell how many locks are available get one
+        # request retried at a time, and the retried request starts the timer again
+        expect(fetch_mock.call_count).to_equal(1)
+        expect(otto.ioloop.add_timeout.call_count).to_equal(2)
+        expect(otto.retry_timeouts).to_include(None)
+
+        otto.retry_waiting(None, 'http://g1.globo.com/')
+
+        expect(fetch_mock.call_count).to_equal(2)
+        expect(otto.waiting).to_be_empty()
+        expect(otto.retry_timeouts).to_be_empty()
+
+    @patch.object(TornadoOctopus, 'fetch')
+    def test_reports_responses_to_limiter(self, fetch_mock):
+        limiter = PerDomainInMemoryLimiter({'http://g1.globo.com': 1})
+        limiter.report_response = Mock()
+        otto = TornadoOctopus(concurrency=10, auto_start=True, limiter=limiter)
+        otto.stop = Mock()
+
+        otto.enqueue('http://g1.globo.com/', self.handle_url_response)
+        otto.running_urls = 1
+        otto.handle_request('http://g1.globo.com/', self.handle_url_response)(self.get_response())
+
+        expect(limiter.report_response.call_count).to_equal(1)
+        url, response = limiter.report_response.call_args[0]
+        expect(url).to_equal('http://g1.globo.com/')
+        expect(response).to_equal(self.responses['http://g1.globo.com/'])
+
+    def test_cache_hit_after_acquiring_lock_releases_it(self):
+        limiter = PerDomainInMemoryLimiter({'http://g1.globo.com': 1})
+        otto = TornadoOctopus(concurrency=10, auto_start=True, cache=True, limiter=limiter)
+        otto.response_cache.put('http://g1.globo.com/', Mock())
+
+        otto.fetch_next_url('http://g1.globo.com/', self.handle_url_response, 'GET')
+
+        expect(self.responses).to_include('http://g1.globo.com/')
+        expect(limiter.domain_count['http://g1.globo.com']).to_equal(0)
+        expect(otto.running_urls).to_equal(0)
+
+    @patch.object(TornadoOctopus, 'fetch')
+    def test_retries_rate_limited_requests_when_next_token_is_available(self, fetch_mock):
+        limiter = RateInMemoryLimiter({'http://g1.globo.com': 0.5})
+        otto = TornadoOctopus(concurrency=10, auto_start=True, limiter=limiter)
+        otto.ioloop = Mock()
+
+        otto.enqueue('http://g1.globo.com/', self.handle_url_response)
+        otto.enqueue('http://g1.globo.com/economia', self.handle_url_response)
+
+        expect(fetch_mock.call_count).to_equal(1)
+        deadline = otto.ioloop.add_timeout.call_args[0][0]
+        expect(deadline.total_seconds()).to_be_greater_than(1.9)
+        expect(deadline.total_seconds()).to_be_lesser_or_equal_to(2)
+
+    def start_server(self, io_loop, delay=0.02):
+        running = {'now': 0, 'max': 0}
+
+        class Handler(RequestHandler):
+            @gen.coroutine
+            def get(self):
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+                yield gen.sleep(delay)
+                running['now'] -= 1
+                self.write('body')
+
+        sock, port = bind_unused_port()
+        server = HTTPServer(Application([(r'/.*', Handler)]), io_loop=io_loop)
+        server.add_sockets([sock])
+
+        return 'http://127.0.0.1:%d' % port, server, running
+
+    def test_retries_only_requests_the_rate_limiter_can_take(self):
+        otto = TornadoOctopus(concurrency=10, auto_start=True)
+        base_url, server, running = self.start_server(otto.ioloop, delay=0)
+
+        limiter = RateInMemoryLimiter({base_url: {'requests': 40, 'burst': 1}})
+        misses = []
+        limiter.subscribe_to_lock_miss(misses.append)
+        otto.limiter = limiter
+
+        for index in range(30):
+            otto.enqueue('%s/%d' % (base_url, index), self.handle_url_response)
+
+        otto.wait(5)
+        server.stop()
+
+        # every waiting request used to be retried each time a token was added
+        expect(self.responses).to_length(30)
+        expect(len(misses)).to_be_lesser_than(90)
+        expect(otto.waiting).to_be_empty()
+
+    def test_uses_asynchronous_limiter_when_available(self):
+        otto = TornadoOctopus(concurrency=10, auto_start=True)
+        base_url, server, running = self.start_server(otto.ioloop)
+
+        limiter = AtomicRedisLimiter({base_url: 2}, redis=self.redis, limiter_miss_timeout_ms=10)
+        limiter.acquire = Mock(side_effect=RuntimeError('should not be called'))
+        limiter.release = Mock(side_effect=RuntimeError('should not be called'))
+        otto.limiter = limiter
+
+        for index in range(6):
+            otto.enqueue('%s/%d' % (base_url, index), self.handle_url_response)
+
+        otto.wait(5)
+        server.stop()
+        limiter.async_client.close()
+
+        expect(self.responses).to_length(6)
+        for response in self.responses.values():
+            expect(response.status_code).to_equal(200)
+        expect(running['max']).to_equal(2)
+        expect(otto.running_urls).to_equal(0)
+        expect(otto.waiting).to_be_empty()